@@ -0,0 +1,79 @@
+import random
+from typing import List
+
+from django.db.models import Max
+
+from maps.models import Map
+from players.models import Player
+from players.tokens import hash_token
+from trains.models import Train, TrainState
+
+from . import data
+
+SAMPLE_SIZE = 1000
+BUNDLE_SIZE = 10
+
+
+class NotSeeded(Exception):
+    pass
+
+
+class BenchmarkContext:
+    """Samples of the seeded data that scenarios build their requests from."""
+
+    def __init__(self, seed: int = data.DEFAULT_SEED) -> None:
+        rng = random.Random(seed)
+        self.token = data.BENCHMARK_TOKEN
+        self.token_hash = hash_token(data.BENCHMARK_TOKEN)
+
+        self.map_ids = self._sample(rng, Map.objects.values_list("id", flat=True))
+        self.players = self._sample(
+            rng,
+            Player.objects.filter(token=self.token_hash).values_list(
+                "username", flat=True
+            ),
+        )
+        self.available_trains = self._sample(
+            rng,
+            Train.objects.filter(state=TrainState.AVAILABLE).values_list(
+                "pk", flat=True
+            ),
+        )
+        if not (self.map_ids and self.players and self.available_trains):
+            raise NotSeeded(
+                "Needs maps, available trains and players with the benchmark "
+                "token; run seed_benchmark_data first"
+            )
+
+        self.bundle_ids = sorted(self.map_ids[:BUNDLE_SIZE])
+        self.max_change_seq = Map.objects.aggregate(Max("change_seq"))[
+            "change_seq__max"
+        ]
+        self.last_train = Train.objects.aggregate(Max("pk"))["pk__max"]
+        self.rng = rng
+
+    @staticmethod
+    def _sample(rng: random.Random, values) -> List:
+        values = list(values[: SAMPLE_SIZE * 100])
+        return rng.sample(values, min(len(values), SAMPLE_SIZE))
+
+    def map_id(self, i: int) -> int:
+        return self.map_ids[i % len(self.map_ids)]
+
+    def player(self, i: int) -> str:
+        return self.players[i % len(self.players)]
+
+    def available_train(self, i: int) -> int:
+        return self.available_trains[i % len(self.available_trains)]
+
+    def change_seq(self, i: int) -> int:
+        # Clients polling for changes are mostly nearly up to date
+        return max(self.max_change_seq - (i % 10) * 10, 0)
+
+    def filename_query(self, i: int) -> str:
+        return f"Y{self.map_id(i)}"
+
+    def new_train_filename(self, i: int) -> str:
+        return data.train_filename(
+            self.rng, self.map_id(i), i, self.player(i + 1), self.player(i)
+        )
@@ -0,0 +1,93 @@
+"""Generators for realistic synthetic maps, players and trains.
+
+Everything is derived from a seeded ``random.Random``, so the same options
+always produce the same data set and benchmark runs can be compared.
+"""
+import random
+from datetime import date, timedelta
+from typing import Iterator, List, Tuple
+
+DEFAULT_SEED = 1
+# Every seeded player has this token, so benchmark requests can authenticate
+BENCHMARK_TOKEN = "benchmark"
+FIRST_MAP_ID = 1001
+NAME_PARTS = (
+    "Rail Yard Loco Freight Steam Diesel Signal Switch "
+    "Depot Hump Caboose Boxcar Tanker Hopper Gondola Flat"
+).split()
+TRAIN_FILE_EXT = ".zrn"
+DAYS_OF_HISTORY = 10 * 365
+TRAIN_DAYS_OF_HISTORY = 180
+# Fraction of trains already downloaded, and so candidates for archiving
+DOWNLOADED_FRACTION = 0.7
+
+
+def player_names(rng: random.Random, count: int) -> List[str]:
+    """Unique usernames such as ``SteamHopper1042``."""
+    return [
+        f"{rng.choice(NAME_PARTS)}{rng.choice(NAME_PARTS)}{index}"
+        for index in range(count)
+    ]
+
+
+def player_email(name: str) -> str:
+    return f"{name.lower()}@example.com"
+
+
+def map_ids(count: int) -> range:
+    return range(FIRST_MAP_ID, FIRST_MAP_ID + count)
+
+
+def random_sha256(rng: random.Random) -> str:
+    return f"{rng.getrandbits(256):064x}"
+
+
+def random_date(rng: random.Random, days: int, today: date) -> date:
+    return today - timedelta(days=rng.randrange(days))
+
+
+def map_file_sizes(rng: random.Random) -> Tuple[int, int, int]:
+    """Sizes of a map's jpg, yrd and his files."""
+    return (
+        rng.randint(50_000, 2_000_000),
+        rng.randint(5_000, 200_000),
+        rng.randint(1_000, 50_000),
+    )
+
+
+def train_filename(
+    rng: random.Random, map_id: int, sequence: int, to_player: str, from_player: str
+) -> str:
+    """A name like ``Y1234-01E02F034C0-000123-Player1-Player2.zrn``."""
+    return (
+        f"Y{map_id}-{rng.getrandbits(44):011X}-{sequence:06d}-"
+        f"{to_player}-{from_player}{TRAIN_FILE_EXT}"
+    )
+
+
+def skewed_choice(rng: random.Random, items: List[str]) -> str:
+    """Pick from ``items``, favouring the first ones as the busiest players."""
+    return items[min(int(rng.paretovariate(1.2)) - 1, len(items) - 1)]
+
+
+def train_rows(
+    rng: random.Random,
+    count: int,
+    players: List[str],
+    map_count: int,
+    today: date,
+) -> Iterator[Tuple[str, str, str, date, bool]]:
+    """(filename, from_player, to_player, upload_date, downloaded) per train."""
+    # Shuffled so the busiest players are not simply the first ones created
+    busiest = rng.sample(players, len(players))
+    for sequence in range(count):
+        from_player = skewed_choice(rng, busiest)
+        to_player = skewed_choice(rng, busiest)
+        map_id = FIRST_MAP_ID + rng.randrange(max(map_count, 1))
+        yield (
+            train_filename(rng, map_id, sequence, to_player, from_player),
+            from_player,
+            to_player,
+            random_date(rng, TRAIN_DAYS_OF_HISTORY, today),
+            rng.random() < DOWNLOADED_FRACTION,
+        )
@@ -0,0 +1,93 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.context import NotSeeded
+from benchmarks.runner import (
+    DEFAULT_ITERATIONS,
+    DEFAULT_WARMUP,
+    compare,
+    run_benchmarks,
+)
+from benchmarks.scenarios import SCENARIOS
+
+DEFAULT_OUTPUT = "benchmark-results.json"
+
+
+class Command(BaseCommand):
+    help = (
+        "Times every endpoint against the seeded database and local storage, "
+        "writing latency percentiles and queries per request as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "scenarios",
+            nargs="*",
+            help=f"Scenarios to run (default all): {', '.join(SCENARIOS)}",
+        )
+        parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+        parser.add_argument(
+            "--warmup",
+            type=int,
+            default=DEFAULT_WARMUP,
+            help="Untimed requests before each scenario",
+        )
+        parser.add_argument(
+            "--async-views",
+            action="store_true",
+            help="Run against the async views served by fymserver.asgi",
+        )
+        parser.add_argument("--output", type=Path, default=Path(DEFAULT_OUTPUT))
+        parser.add_argument(
+            "--baseline",
+            type=Path,
+            help="Results of an earlier run to compare p95 latencies against",
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=10.0,
+            help="Percent p95 slowdown counted as a regression",
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options["scenarios"]) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        if options["iterations"] < 1:
+            raise CommandError("--iterations must be positive")
+
+        def progress(name, result):
+            self.stdout.write(
+                f"{name:32} p50 {result['p50_ms']:9.2f}ms  "
+                f"p95 {result['p95_ms']:9.2f}ms  p99 {result['p99_ms']:9.2f}ms  "
+                f"{result['queries_per_request']:6.1f} queries"
+            )
+
+        try:
+            results = run_benchmarks(
+                options["scenarios"],
+                options["iterations"],
+                options["warmup"],
+                options["async_views"],
+                progress,
+            )
+        except NotSeeded as e:
+            raise CommandError(str(e))
+
+        with open(options["output"], "w") as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(f"Wrote {options['output']}")
+
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+            regressions = compare(results, baseline, options["threshold"])
+            if regressions:
+                raise CommandError(
+                    f"p95 regressed over {options['threshold']}%: "
+                    + ", ".join(regressions)
+                )
+            self.stdout.write("No regressions against the baseline")
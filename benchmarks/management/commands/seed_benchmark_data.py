@@ -0,0 +1,201 @@
+import random
+import time
+from datetime import date
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, TypeVar
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from tqdm import tqdm
+
+from benchmarks import data
+from maps.models import FILE_EXTS, Map, next_change_seqs
+from players.models import Player
+from players.tokens import hash_token
+from trains.management.commands.archive_trains import archive_trains
+from trains.models import PlayerName, Train, TrainNameTrigram, TrainState
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_ARCHIVE_DAYS = 30
+
+T = TypeVar("T")
+
+
+class SeedStats:
+    def __init__(self) -> None:
+        self.rows = 0
+        self.start = time.monotonic()
+
+    def report(self) -> str:
+        elapsed = max(time.monotonic() - self.start, 1e-6)
+        return f"Inserted {self.rows} rows in {elapsed:.1f}s: {self.rows / elapsed:.1f} rows/s"
+
+
+def batched(items: Iterable[T], batch_size: int) -> Iterator[List[T]]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def seed_players(
+    rng: random.Random, count: int, batch_size: int, stats: SeedStats
+) -> Dict[str, Player]:
+    token = hash_token(data.BENCHMARK_TOKEN)
+    players = {}
+    names = data.player_names(rng, count)
+    for batch in batched(tqdm(names, desc="players"), batch_size):
+        with transaction.atomic():
+            created = Player.objects.bulk_create(
+                [
+                    Player(username=name, email=data.player_email(name), token=token)
+                    for name in batch
+                ]
+            )
+            PlayerName.objects.bulk_create([PlayerName(name=name) for name in batch])
+        players.update((player.username, player) for player in created)
+        stats.rows += 2 * len(batch)
+    return players
+
+
+def seed_maps(
+    rng: random.Random, count: int, batch_size: int, stats: SeedStats, today: date
+) -> None:
+    for batch in batched(tqdm(data.map_ids(count), desc="maps"), batch_size):
+        with transaction.atomic():
+            map_objs = []
+            for map_id, change_seq in zip(batch, next_change_seqs(len(batch))):
+                map_obj = Map(
+                    id=map_id,
+                    modified_date=data.random_date(rng, data.DAYS_OF_HISTORY, today),
+                    change_seq=change_seq,
+                )
+                for file_ext, size in zip(FILE_EXTS, data.map_file_sizes(rng)):
+                    setattr(map_obj, f"{file_ext}_file", f"{map_id}.{file_ext}")
+                    map_obj.set_file_digest(file_ext, size, data.random_sha256(rng))
+                map_objs.append(map_obj)
+            # bulk_create skips Map.save, which would log a second change
+            Map.objects.bulk_create(map_objs)
+        stats.rows += 2 * len(batch)
+
+
+def seed_trains(
+    rng: random.Random,
+    count: int,
+    players: Dict[str, Player],
+    map_count: int,
+    batch_size: int,
+    stats: SeedStats,
+    today: date,
+) -> None:
+    player_keys = dict(PlayerName.objects.values_list("name", "pk"))
+    # Explicit ids, so the trigrams can be built without reading them back
+    next_pk = (Train.objects.aggregate(Max("pk"))["pk__max"] or 0) + 1
+
+    rows = data.train_rows(rng, count, sorted(players), map_count, today)
+    for batch in batched(tqdm(rows, desc="trains", total=count), batch_size):
+        train_objs = []
+        for filename, from_player, to_player, upload_date, downloaded in batch:
+            train_objs.append(
+                Train(
+                    id=next_pk,
+                    train_file=filename,
+                    file_size=rng.randint(2_000, 40_000),
+                    file_sha256=data.random_sha256(rng),
+                    from_player=from_player,
+                    to_player=to_player,
+                    from_player_key_id=player_keys[from_player],
+                    to_player_key_id=player_keys[to_player],
+                    downloaded_by=players[to_player] if downloaded else None,
+                    upload_date=upload_date,
+                    state=TrainState.DOWNLOADED if downloaded else TrainState.AVAILABLE,
+                )
+            )
+            next_pk += 1
+
+        trigrams = [
+            trigram
+            for train_obj in train_objs
+            for trigram in train_obj.build_trigrams()
+        ]
+        with transaction.atomic():
+            Train.objects.bulk_create(train_objs)
+            TrainNameTrigram.objects.bulk_create(trigrams, batch_size=batch_size)
+        stats.rows += len(train_objs) + len(trigrams)
+
+
+def seed_benchmark_data(
+    maps: int,
+    players: int,
+    trains: int,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    seed: int = data.DEFAULT_SEED,
+    archive_days: Optional[int] = DEFAULT_ARCHIVE_DAYS,
+    stats: Optional[SeedStats] = None,
+) -> SeedStats:
+    """Fill an empty database with synthetic maps, players and trains."""
+    if stats is None:
+        stats = SeedStats()
+
+    rng = random.Random(seed)
+    today = date.today()
+    player_objs = seed_players(rng, players, batch_size, stats)
+    seed_maps(rng, maps, batch_size, stats, today)
+    seed_trains(rng, trains, player_objs, maps, batch_size, stats, today)
+    if archive_days is not None:
+        archive_trains(archive_days, batch_size)
+    return stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills an empty database with synthetic maps, players and trains "
+        "for run_benchmarks. Never run this against production."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--maps", type=int, default=50_000)
+        parser.add_argument("--players", type=int, default=100_000)
+        parser.add_argument("--trains", type=int, default=1_000_000)
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help="Rows inserted per query",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=data.DEFAULT_SEED,
+            help="Random seed; the same seed always generates the same data",
+        )
+        parser.add_argument(
+            "--archive-days",
+            type=int,
+            default=DEFAULT_ARCHIVE_DAYS,
+            help="Archive downloaded trains uploaded at least this many days ago",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+        if options["players"] < 1 and options["trains"] > 0:
+            raise CommandError("Trains need at least one player")
+        if any(
+            model.objects.exists()
+            for model in (Map, Player, PlayerName, Train, TrainNameTrigram)
+        ):
+            raise CommandError("The database must be empty to seed benchmark data")
+
+        stats = seed_benchmark_data(
+            options["maps"],
+            options["players"],
+            options["trains"],
+            options["batch_size"],
+            options["seed"],
+            options["archive_days"],
+        )
+        self.stdout.write(stats.report())
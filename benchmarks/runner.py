@@ -0,0 +1,174 @@
+"""Runs the scenarios through the test client and summarises each one."""
+import contextlib
+import math
+import platform
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, models, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from fymserver.mail_queue import mail_queue
+from maps.models import FILE_EXTS, Map
+from players.models import Player
+from trains.models import ArchivedTrain, Train
+
+from .context import BenchmarkContext
+from .scenarios import ASYNC_ONLY, SCENARIOS
+
+DEFAULT_ITERATIONS = 200
+DEFAULT_WARMUP = 10
+PERCENTILES = (50, 95, 99)
+MAP_FILE_BYTES = b"\0" * 64 * 1024
+BENCHMARK_CACHE_PREFIX = "benchmarks"
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+@contextlib.contextmanager
+def local_storage() -> Iterator[str]:
+    """Point every FileField at a temporary directory instead of S3."""
+    fields = [
+        field
+        for model in apps.get_models()
+        for field in model._meta.get_fields()
+        if isinstance(field, models.FileField)
+    ]
+    originals = [field.storage for field in fields]
+    with tempfile.TemporaryDirectory(prefix="fymserver-benchmark-") as root:
+        storage = FileSystemStorage(location=root, base_url="/benchmark-files/")
+        for field in fields:
+            field.storage = storage
+        try:
+            yield root
+        finally:
+            for field, original in zip(fields, originals):
+                field.storage = original
+
+
+def benchmark_settings():
+    return override_settings(
+        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+        # Keeps benchmark entries apart from any others in a shared cache
+        CACHES={
+            alias: {**config, "KEY_PREFIX": BENCHMARK_CACHE_PREFIX}
+            for alias, config in settings.CACHES.items()
+        },
+        EMAIL_BACKEND="django.core.mail.backends.dummy.EmailBackend",
+        RATELIMIT_ENABLED=False,
+        METRICS_ALLOWED_IPS=["127.0.0.1"],
+    )
+
+
+def store_map_files(map_ids: List[int]) -> None:
+    """Give the sampled maps real files, for the bundle scenario to read."""
+    for map_obj in Map.objects.filter(id__in=map_ids):
+        for file_ext in FILE_EXTS:
+            field_file = getattr(map_obj, f"{file_ext}_file")
+            field_file.storage.save(field_file.name, ContentFile(MAP_FILE_BYTES))
+
+
+def run_scenario(
+    client: Client, ctx: BenchmarkContext, name: str, iterations: int, warmup: int
+) -> Dict[str, Any]:
+    build = SCENARIOS[name]
+    latencies = []
+    queries = 0
+    statuses: Dict[str, int] = {}
+
+    for i in range(warmup + iterations):
+        method, path, data = build(ctx, i)
+        # Every request is rolled back, so each run sees the same data
+        with transaction.atomic(), CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = getattr(client, method)(path, data)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+
+        if i < warmup:
+            continue
+        latencies.append(elapsed)
+        queries += len(captured)
+        status = str(response.status_code)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    latencies.sort()
+    result: Dict[str, Any] = {
+        f"p{p}_ms": round(percentile(latencies, p) * 1000, 3) for p in PERCENTILES
+    }
+    result.update(
+        mean_ms=round(sum(latencies) / len(latencies) * 1000, 3),
+        max_ms=round(latencies[-1] * 1000, 3),
+        queries_per_request=round(queries / len(latencies), 2),
+        statuses=statuses,
+    )
+    return result
+
+
+def run_benchmarks(
+    names: Optional[List[str]] = None,
+    iterations: int = DEFAULT_ITERATIONS,
+    warmup: int = DEFAULT_WARMUP,
+    async_views: bool = False,
+    progress=None,
+) -> Dict[str, Any]:
+    """Run ``names`` (default all routed) scenarios, returning the results document."""
+    names = names or [
+        name for name in SCENARIOS if async_views or name not in ASYNC_ONLY
+    ]
+    urlconf = "fymserver.async_urls" if async_views else settings.ROOT_URLCONF
+    results = {}
+
+    with benchmark_settings(), override_settings(ROOT_URLCONF=urlconf):
+        ctx = BenchmarkContext()
+        with local_storage():
+            store_map_files(ctx.bundle_ids)
+            client = Client()
+            for name in names:
+                results[name] = run_scenario(client, ctx, name, iterations, warmup)
+                if progress:
+                    progress(name, results[name])
+            # Let queued mail reach the dummy backend before it is swapped back
+            mail_queue.join()
+            mail_queue.disconnect()
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "async_views": async_views,
+        "iterations": iterations,
+        "rows": {
+            "maps": Map.objects.count(),
+            "trains": Train.objects.count(),
+            "archived_trains": ArchivedTrain.objects.count(),
+            "players": Player.objects.count(),
+        },
+        "scenarios": results,
+    }
+
+
+def compare(
+    results: Dict[str, Any], baseline: Dict[str, Any], threshold: float
+) -> List[str]:
+    """Scenarios whose p95 latency grew more than ``threshold`` percent."""
+    regressions = []
+    for name, result in results["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before and result["p95_ms"] > before["p95_ms"] * (1 + threshold / 100):
+            regressions.append(name)
+    return regressions
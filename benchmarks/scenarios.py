@@ -0,0 +1,184 @@
+"""One benchmark scenario per endpoint.
+
+Each scenario builds its ``i``-th request from the ``BenchmarkContext``,
+spreading requests over the sampled maps, players and trains so caches see
+a realistic mix. The S3 direct-upload endpoints (presign/complete) need a
+real bucket and are not covered.
+"""
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+
+from maps.models import FILE_EXTS
+from players.views import generate_otp
+
+from .context import BenchmarkContext
+
+Request = Tuple[str, str, Dict[str, Any]]
+
+SCENARIOS: Dict[str, Callable[[BenchmarkContext, int], Request]] = {}
+# Scenarios for endpoints only routed by fymserver.async_urls
+ASYNC_ONLY: Set[str] = set()
+
+UPLOAD_BYTES = b"\0" * 16 * 1024
+
+
+def scenario(name: str, async_only: bool = False):
+    def decorator(build: Callable[[BenchmarkContext, int], Request]):
+        SCENARIOS[name] = build
+        if async_only:
+            ASYNC_ONLY.add(name)
+        return build
+
+    return decorator
+
+
+def login(ctx: BenchmarkContext, i: int) -> Dict[str, Any]:
+    return {"player": ctx.player(i), "token": ctx.token}
+
+
+def upload(name: str, content: bytes = UPLOAD_BYTES) -> SimpleUploadedFile:
+    return SimpleUploadedFile(name, content)
+
+
+@scenario("maps:index")
+def maps_index(ctx, i):
+    return "get", reverse("maps:index"), {}
+
+
+@scenario("maps:manifest")
+def maps_manifest(ctx, i):
+    return "get", reverse("maps:manifest"), {}
+
+
+@scenario("maps:changes")
+def maps_changes(ctx, i):
+    return "get", reverse("maps:changes"), {"since": ctx.change_seq(i)}
+
+
+@scenario("maps:bundle")
+def maps_bundle(ctx, i):
+    return "get", reverse("maps:bundle"), {"ids": ",".join(map(str, ctx.bundle_ids))}
+
+
+def add_map_file_scenarios(file_ext: str) -> None:
+    @scenario(f"maps:{file_ext}_file")
+    def maps_file(ctx, i):
+        return "get", reverse(f"maps:{file_ext}_file", args=(ctx.map_id(i),)), {}
+
+    @scenario(f"maps:update_{file_ext}_file")
+    def maps_update_file(ctx, i):
+        map_id = ctx.map_id(i)
+        url = reverse(f"maps:update_{file_ext}_file", args=(map_id,))
+        return "post", url, {"file": upload(f"{map_id}.{file_ext}")}
+
+
+for map_file_ext in FILE_EXTS:
+    add_map_file_scenarios(map_file_ext)
+
+
+@scenario("maps:modified_date")
+def maps_modified_date(ctx, i):
+    return "get", reverse("maps:modified_date", args=(ctx.map_id(i),)), {}
+
+
+@scenario("maps:update_modified_date")
+def maps_update_modified_date(ctx, i):
+    url = reverse("maps:update_modified_date", args=(ctx.map_id(i),))
+    return "post", url, {"modified_date": "2022-02-22"}
+
+
+@scenario("maps:publish")
+def maps_publish(ctx, i):
+    map_id = ctx.map_id(i)
+    return (
+        "post",
+        reverse("maps:publish", args=(map_id,)),
+        {
+            "jpg_file": upload(f"{map_id}.jpg"),
+            "yrd_file": upload(f"{map_id}.yrd", b"Fver=02/22/2022\n" + UPLOAD_BYTES),
+            "his_file": upload(f"{map_id}.his"),
+        },
+    )
+
+
+@scenario("trains:index")
+def trains_index(ctx, i):
+    return (
+        "post",
+        reverse("trains:index"),
+        {**login(ctx, i), "search_player": ctx.player(i + 1), "limit": 100},
+    )
+
+
+@scenario("trains:index:filename")
+def trains_index_filename(ctx, i):
+    return (
+        "post",
+        reverse("trains:index"),
+        {**login(ctx, i), "filename": ctx.filename_query(i), "limit": 100},
+    )
+
+
+@scenario("trains:download")
+def trains_download(ctx, i):
+    url = reverse("trains:download", args=(ctx.available_train(i),))
+    return "post", url, login(ctx, i)
+
+
+@scenario("trains:claim")
+def trains_claim(ctx, i):
+    pks = ",".join(str(ctx.available_train(i * 10 + n)) for n in range(10))
+    return "post", reverse("trains:claim"), {**login(ctx, i), "pks": pks}
+
+
+@scenario("trains:archive")
+def trains_archive(ctx, i):
+    return (
+        "post",
+        reverse("trains:archive"),
+        {**login(ctx, i), "search_player": ctx.player(i)},
+    )
+
+
+@scenario("trains:wait", async_only=True)
+def trains_wait(ctx, i):
+    return (
+        "post",
+        reverse("trains:wait"),
+        {**login(ctx, i), "since": ctx.last_train, "timeout": 0},
+    )
+
+
+@scenario("trains:upload")
+def trains_upload(ctx, i):
+    filename = ctx.new_train_filename(i)
+    return (
+        "post",
+        reverse("trains:upload"),
+        {**login(ctx, i), "filename": filename, "file": upload(filename)},
+    )
+
+
+@scenario("players:send_auth_code")
+def players_send_auth_code(ctx, i):
+    return "post", reverse("players:send_auth_code"), {"player": ctx.player(i)}
+
+
+@scenario("players:check_auth_code")
+def players_check_auth_code(ctx, i):
+    # A different player each time, as each code can only be used once
+    player = ctx.player(i)
+    otp = generate_otp(settings.SECRET_KEY + ctx.token_hash, settings.OTP_STEP_SECS, 0)
+    return "post", reverse("players:check_auth_code"), {"player": player, "otp": otp}
+
+
+@scenario("monitoring:metrics")
+def monitoring_metrics(ctx, i):
+    return "get", reverse("monitoring:metrics"), {}
+
+
+def scenario_names() -> List[str]:
+    return list(SCENARIOS)
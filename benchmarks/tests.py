@@ -0,0 +1,108 @@
+import json
+import random
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase
+
+from maps.models import Map
+from players.models import Player
+from trains.models import ArchivedTrain, Train, TrainNameTrigram
+from trains.views import _train_players
+
+from . import data
+from .management.commands.seed_benchmark_data import seed_benchmark_data
+from .runner import benchmark_settings, compare, percentile
+from .scenarios import ASYNC_ONLY, SCENARIOS
+
+
+class TestData(SimpleTestCase):
+    def test_same_seed_generates_same_data(self):
+        first = data.player_names(random.Random(1), 50)
+        second = data.player_names(random.Random(1), 50)
+
+        self.assertEqual(first, second)
+        self.assertEqual(50, len(set(first)))
+
+    def test_train_filenames_name_their_players(self):
+        filename = data.train_filename(random.Random(1), 1234, 5, "Alice", "Bob")
+
+        self.assertEqual(("Alice", "Bob"), _train_players(filename))
+        self.assertRegex(filename, r"^Y1234-[0-9A-F]{11}-000005-Alice-Bob\.zrn$")
+
+
+class TestPercentile(SimpleTestCase):
+    def test_nearest_rank(self):
+        values = [float(value) for value in range(1, 101)]
+
+        self.assertEqual(50.0, percentile(values, 50))
+        self.assertEqual(99.0, percentile(values, 99))
+        self.assertEqual(7.0, percentile([7.0], 95))
+
+    def test_benchmarks_use_their_own_cache_prefix(self):
+        cache.set("key", "live")
+        with benchmark_settings():
+            self.assertIsNone(cache.get("key"))
+            cache.set("key", "benchmark")
+
+        self.assertEqual("live", cache.get("key"))
+
+    def test_compare_flags_slower_p95(self):
+        baseline = {"scenarios": {"a": {"p95_ms": 10.0}, "b": {"p95_ms": 10.0}}}
+        results = {"scenarios": {"a": {"p95_ms": 10.5}, "b": {"p95_ms": 12.0}}}
+
+        self.assertEqual(["b"], compare(results, baseline, threshold=10))
+
+
+class SeedBenchmarkDataTests(TestCase):
+    def test_seeds_related_rows(self):
+        seed_benchmark_data(maps=5, players=4, trains=20, batch_size=3)
+
+        self.assertEqual(5, Map.objects.count())
+        self.assertEqual(4, Player.objects.count())
+        self.assertEqual(20, Train.objects.count() + ArchivedTrain.objects.count())
+        train = Train.objects.first()
+        self.assertEqual(
+            len(train.build_trigrams()),
+            TrainNameTrigram.objects.filter(train=train).count(),
+        )
+        self.assertTrue(Player.objects.first().validate_token(data.BENCHMARK_TOKEN))
+
+    def test_refuses_database_with_data(self):
+        seed_benchmark_data(maps=1, players=1, trains=0)
+
+        with self.assertRaises(CommandError):
+            call_command("seed_benchmark_data", stdout=StringIO())
+
+
+class RunBenchmarksTests(TestCase):
+    def test_runs_every_scenario(self):
+        seed_benchmark_data(maps=20, players=10, trains=100, archive_days=30)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = Path(tmpdir) / "results.json"
+            call_command(
+                "run_benchmarks",
+                iterations=3,
+                warmup=1,
+                output=output,
+                stdout=StringIO(),
+            )
+            with open(output) as f:
+                results = json.load(f)
+
+        self.assertEqual(set(SCENARIOS) - ASYNC_ONLY, set(results["scenarios"]))
+        for name, result in results["scenarios"].items():
+            with self.subTest(name):
+                self.assertTrue(
+                    all(int(status) < 400 for status in result["statuses"]), result
+                )
+                self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+
+    def test_requires_seeded_database(self):
+        with self.assertRaises(CommandError):
+            call_command("run_benchmarks", stdout=StringIO())
@@ -0,0 +1,43 @@
+import io
+import zipfile
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+from django.core.files import File
+
+ArchiveEntry = Tuple[zipfile.ZipInfo, Callable[[], File]]
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Unseekable sink that hands back whatever has been written since the last pop."""
+
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def stream_zip(entries: Iterable[ArchiveEntry]) -> Iterator[bytes]:
+    """Yield a zip archive of ``entries`` piece by piece.
+
+    Each entry is a ZipInfo and a callable opening the file to store. Only
+    one file chunk is held in memory at a time.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+        for info, open_file in entries:
+            with open_file() as src, archive.open(info, "w", force_zip64=True) as dest:
+                for chunk in src.chunks():
+                    dest.write(chunk)
+                    yield buffer.pop()
+            yield buffer.pop()
+    yield buffer.pop()
@@ -2,6 +2,10 @@
 ASGI config for fymserver project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with run-asgi.sh, which runs uvicorn on a unix socket for nginx to
+``proxy_pass`` to. Requests are routed through fymserver.async_urls, so
+views waiting on S3 free the event loop for other requests meanwhile, and
+streaming responses are sent as they are made, see fymserver.asynchronous.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
@@ -9,8 +13,21 @@ https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "fymserver.settings")
+os.environ.setdefault("DJANGO_ASYNC_VIEWS", "TRUE")
 
-application = get_asgi_application()
+# As get_asgi_application, with the handler from fymserver.asynchronous
+django.setup(set_prefix=False)
+
+from fymserver.asynchronous import StreamingASGIHandler  # noqa: E402
+from trains.events import SSE_PATH, sse_application  # noqa: E402
+
+django_application = StreamingASGIHandler()
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and scope["path"] == SSE_PATH:
+        return await sse_application(scope, receive, send)
+    return await django_application(scope, receive, send)
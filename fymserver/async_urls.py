@@ -0,0 +1,14 @@
+"""URLconf for the ASGI application, see fymserver.asynchronous.
+
+Same URLs as fymserver.urls, routed to the async views where apps have them.
+"""
+from django.contrib import admin
+from django.urls import include, path
+
+urlpatterns = [
+    path("fymserver/maps/", include("maps.async_urls")),
+    path("fymserver/trains/", include("trains.async_urls")),
+    path("fymserver/players/", include("players.async_urls")),
+    path("fymserver/monitoring/", include("monitoring.urls")),
+    path("fymserver/admin/", admin.site.urls),
+]
@@ -0,0 +1,100 @@
+"""Support for the async views served by ``fymserver.asgi``.
+
+Django 4.0 has no async ORM, so async views share the sync views' code and
+run it with ``sync_to_async``. Django gives each ASGI request a thread of its
+own for that, so a request waiting on S3 there holds up no other request.
+Slow calls made from async code itself, such as parsing an upload, go to
+``run_blocking``, whose pool bounds how many of those run at once however
+many requests are waiting on them.
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.urls import URLPattern
+
+BLOCKING_EXECUTOR = ThreadPoolExecutor(
+    max_workers=settings.BLOCKING_IO_WORKERS, thread_name_prefix="blocking-io"
+)
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Run ``func``, which must not touch the database, in the blocking I/O pool."""
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context over, as sync_to_async does
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        BLOCKING_EXECUTOR, functools.partial(context.run, func, *args, **kwargs)
+    )
+
+
+def async_csrf_exempt(view: Callable) -> Callable:
+    # csrf_exempt only learned to wrap coroutine functions in Django 5.0
+    view.csrf_exempt = True
+    return view
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """Django 4.0's ASGI handler, sending streaming responses as they are made.
+
+    Django 4.0 iterates streaming content on the event loop, where database
+    cursors are not allowed and S3 reads would block every other request.
+    This produces each chunk with ``sync_to_async`` instead, in the request's
+    own thread, as Django 4.2 does.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        headers = [
+            (
+                header.encode("ascii") if isinstance(header, str) else header,
+                value.encode("latin1") if isinstance(value, str) else value,
+            )
+            for header, value in response.items()
+        ]
+        for cookie in response.cookies.values():
+            headers.append(
+                (b"Set-Cookie", cookie.output(header="").encode("ascii").strip())
+            )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": headers,
+            }
+        )
+
+        parts = iter(response)
+        next_part = sync_to_async(next)
+        done = object()
+        while True:
+            part = await next_part(parts, done)
+            if part is done:
+                break
+            for chunk, _ in self.chunk_bytes(part):
+                await send(
+                    {"type": "http.response.body", "body": chunk, "more_body": True}
+                )
+        await send({"type": "http.response.body"})
+
+
+def with_async_views(
+    urlpatterns: List[URLPattern], async_views: Dict[Callable, Callable]
+) -> List[URLPattern]:
+    """Copy ``urlpatterns``, replacing each sync view with its async version."""
+    return [
+        URLPattern(
+            pattern.pattern,
+            async_views.get(pattern.callback, pattern.callback),
+            pattern.default_args,
+            pattern.name,
+        )
+        for pattern in urlpatterns
+    ]
@@ -0,0 +1,11 @@
+"""Settings for running the benchmarks against a production-like setup:
+
+    DJANGO_SETTINGS_MODULE=fymserver.benchmark_settings python manage.py run_benchmarks
+
+Use a database and cache that no live server is using.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS
+
+if "benchmarks" not in INSTALLED_APPS:
+    INSTALLED_APPS = [*INSTALLED_APPS, "benchmarks"]
@@ -0,0 +1,129 @@
+import base64
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+from django.http import HttpRequest
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from .upload_handlers import (
+    STAGING_NAME_RE,
+    STAGING_PREFIX,
+    StagedUpload,
+    new_staging_name,
+)
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class DirectUploadError(ValueError):
+    pass
+
+
+def parse_upload_params(request: HttpRequest) -> Tuple[int, str]:
+    """Return the declared size and SHA-256 of a direct upload."""
+    try:
+        size = int(request.POST.get("size", ""))
+    except ValueError:
+        raise DirectUploadError("size must be an integer")
+    if size < 0:
+        raise DirectUploadError("size must not be negative")
+
+    sha256 = request.POST.get("sha256", "").lower()
+    if not SHA256_RE.match(sha256):
+        raise DirectUploadError("sha256 must be a hex SHA-256 digest")
+
+    return size, sha256
+
+
+def _check_storage(storage) -> None:
+    # Other storages have nowhere for the client to upload to
+    if not isinstance(storage, S3Boto3Storage):
+        raise DirectUploadError("Direct uploads are not supported by this server")
+
+
+def presign_upload(storage, size: int, sha256: str) -> Dict[str, Any]:
+    """Reserve a staging name and return how the client should upload to it.
+
+    The presigned PUT is bound to the declared size and SHA-256, so S3 itself
+    rejects any other body.
+    """
+    _check_storage(storage)
+    staging_name = new_staging_name()
+
+    checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+    url = storage.connection.meta.client.generate_presigned_url(
+        "put_object",
+        Params={
+            "Bucket": storage.bucket_name,
+            "Key": storage._normalize_name(staging_name),
+            "ContentLength": size,
+            "ChecksumSHA256": checksum,
+        },
+        ExpiresIn=int(storage.querystring_expire),
+        HttpMethod="PUT",
+    )
+    headers = {"x-amz-checksum-sha256": checksum}
+
+    return {"upload": staging_name, "url": url, "method": "PUT", "headers": headers}
+
+
+def _stored_digest(storage, staging_name: str) -> Optional[Tuple[int, str]]:
+    try:
+        head = storage.connection.meta.client.head_object(
+            Bucket=storage.bucket_name,
+            Key=storage._normalize_name(staging_name),
+            ChecksumMode="ENABLED",
+        )
+    except ClientError:
+        return None
+    checksum = head.get("ChecksumSHA256")
+    if not checksum:
+        return None
+    return head["ContentLength"], base64.b64decode(checksum).hex()
+
+
+def complete_upload(
+    storage, staging_name: str, name: str, size: int, sha256: str
+) -> StagedUpload:
+    """Check that a direct upload arrived intact and return it for committing."""
+    _check_storage(storage)
+    if not STAGING_NAME_RE.match(staging_name):
+        raise DirectUploadError("Unknown upload")
+
+    stored = _stored_digest(storage, staging_name)
+    if stored is None:
+        raise DirectUploadError("Upload not found")
+
+    staged = StagedUpload(storage, staging_name, name, None, *stored)
+    if stored != (size, sha256):
+        staged.discard()
+        raise DirectUploadError("Uploaded file does not match size and sha256")
+
+    return staged
+
+
+def stale_uploads(storage, before: datetime) -> List[str]:
+    """Staging names last written before ``before``.
+
+    Presigned uploads that are never completed leave their object behind, so
+    these are what the purge_uploads command deletes.
+    """
+    _check_storage(storage)
+    client = storage.connection.meta.client
+    prefix = storage._normalize_name(f"{STAGING_PREFIX}/")
+
+    names = []
+    params: Dict[str, Any] = {}
+    while True:
+        response = client.list_objects_v2(
+            Bucket=storage.bucket_name, Prefix=prefix, **params
+        )
+        for obj in response.get("Contents", []):
+            name = STAGING_PREFIX + "/" + obj["Key"][len(prefix) :]
+            if STAGING_NAME_RE.match(name) and obj["LastModified"] < before:
+                names.append(name)
+        if not response.get("IsTruncated"):
+            return names
+        params = {"ContinuationToken": response["NextContinuationToken"]}
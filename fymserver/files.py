@@ -0,0 +1,62 @@
+import hashlib
+from typing import List, Sequence, Tuple
+
+from django.core.files import File
+from django.core.files.storage import Storage
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from .upload_handlers import StagedUpload
+
+# Most keys S3 accepts in a single DeleteObjects call
+S3_DELETE_BATCH_SIZE = 1000
+
+
+def file_digest(file_obj: File) -> Tuple[int, str]:
+    """Return the size and SHA-256 hex digest of a file, rewinding it afterwards."""
+    if isinstance(file_obj, StagedUpload):
+        return file_obj.size, file_obj.sha256
+
+    digest = hashlib.sha256()
+    size = 0
+
+    file_obj.seek(0)
+    for chunk in file_obj.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    file_obj.seek(0)
+
+    return size, digest.hexdigest()
+
+
+def delete_files(storage: Storage, names: Sequence[str]) -> int:
+    """Delete ``names`` from ``storage``, batching the requests on S3.
+
+    Deleting a file that does not exist is not an error, so this can safely be
+    repeated after an interruption. Returns the number of names deleted.
+    """
+    if not isinstance(storage, S3Boto3Storage):
+        for name in names:
+            storage.delete(name)
+        return len(names)
+
+    client = storage.connection.meta.client
+    for start in range(0, len(names), S3_DELETE_BATCH_SIZE):
+        batch = names[start : start + S3_DELETE_BATCH_SIZE]
+        response = client.delete_objects(
+            Bucket=storage.bucket_name,
+            Delete={
+                "Objects": [{"Key": storage._normalize_name(name)} for name in batch],
+                "Quiet": True,
+            },
+        )
+        errors: List[dict] = response.get("Errors", [])
+        if errors:
+            raise IOError(
+                f"Failed to delete {len(errors)} objects, first "
+                f"{errors[0]['Key']}: {errors[0].get('Message', '')}"
+            )
+        if hasattr(storage, "invalidate_url"):
+            for name in batch:
+                storage.invalidate_url(name)
+
+    return len(names)
@@ -0,0 +1,205 @@
+"""Background delivery of outgoing mail.
+
+Views enqueue messages and return; a single worker thread per process sends
+them over one reused connection from ``EMAIL_BACKEND``, reconnecting and
+retrying with exponential backoff when a send fails. The connection is closed
+after ``MAIL_QUEUE_IDLE_SECS`` without mail so it does not time out under us.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.core import mail
+from django.core.mail import EmailMessage
+
+from monitoring import tracing
+from monitoring.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Shared through METRICS_DIR like the request metrics, so they add up over
+# every process's queue
+MAIL_SENT = registry.counter("fym_mail_queue_sent", "Emails sent")
+MAIL_FAILED = registry.counter("fym_mail_queue_failed", "Emails given up on")
+MAIL_RETRIES = registry.counter("fym_mail_queue_retries", "Email send retries")
+MAIL_SEND_SECONDS = registry.counter(
+    "fym_mail_queue_send_seconds_total", "Time spent sending email"
+)
+
+
+class MailQueueFull(Exception):
+    pass
+
+
+class MailQueueMetrics:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.send_seconds = 0.0
+        self.last_send_seconds = 0.0
+
+    def record_send(self, seconds: float) -> None:
+        with self.lock:
+            self.sent += 1
+            self.send_seconds += seconds
+            self.last_send_seconds = seconds
+        MAIL_SENT.inc()
+        MAIL_SEND_SECONDS.inc(amount=seconds)
+
+    def record_retry(self) -> None:
+        with self.lock:
+            self.retries += 1
+        MAIL_RETRIES.inc()
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failed += 1
+        MAIL_FAILED.inc()
+
+    def snapshot(self) -> Dict[str, float]:
+        with self.lock:
+            average = self.send_seconds / self.sent if self.sent else 0.0
+            return {
+                "sent": self.sent,
+                "failed": self.failed,
+                "retries": self.retries,
+                "send_seconds_total": self.send_seconds,
+                "send_seconds_last": self.last_send_seconds,
+                "send_seconds_avg": average,
+            }
+
+
+class MailQueue:
+    def __init__(
+        self,
+        maxsize: int = 1000,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        idle_timeout: float = 30.0,
+        connection_factory: Callable = mail.get_connection,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.queue: "queue.Queue[EmailMessage]" = queue.Queue(maxsize)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.connection_factory = connection_factory
+        self.sleep = sleep
+        self.metrics = MailQueueMetrics()
+        self._connection = None
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, message: EmailMessage) -> None:
+        """Queue ``message`` for sending, raising ``MailQueueFull`` if full."""
+        self._ensure_worker()
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            raise MailQueueFull()
+
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def stats(self) -> Dict[str, float]:
+        return {"depth": self.depth(), **self.metrics.snapshot()}
+
+    def join(self) -> None:
+        """Block until every queued message has been sent or given up on."""
+        self.queue.join()
+
+    def disconnect(self) -> None:
+        """Drop the connection, so the next message opens one from the current
+        ``EMAIL_BACKEND``. Call only when the queue is drained."""
+        self._close_connection()
+
+    def _ensure_worker(self) -> None:
+        # Started lazily so a forking server starts it in each worker process
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="mail-queue", daemon=True
+                )
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                message = self.queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                self._close_connection()
+                continue
+
+            try:
+                with tracing.trace("mail.send", recipients=len(message.to)):
+                    self._send(message)
+            except Exception:
+                self.metrics.record_failure()
+                logger.exception("Giving up sending mail to %s", message.to)
+            finally:
+                self.queue.task_done()
+
+    def _send(self, message: EmailMessage) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                started = time.monotonic()
+                with tracing.span("mail.attempt", attempt=attempt):
+                    self._get_connection().send_messages([message])
+                self.metrics.record_send(time.monotonic() - started)
+                return
+            except Exception:
+                self._close_connection()
+                if attempt == self.max_retries:
+                    raise
+                self.metrics.record_retry()
+                logger.warning(
+                    "Failed to send mail to %s, retrying", message.to, exc_info=True
+                )
+                self.sleep(self.backoff * 2**attempt)
+
+    def _get_connection(self):
+        if self._connection is None:
+            self._connection = self.connection_factory(fail_silently=False)
+            self._connection.open()
+        return self._connection
+
+    def _close_connection(self) -> None:
+        if self._connection is None:
+            return
+        try:
+            self._connection.close()
+        except Exception:
+            logger.warning("Failed to close mail connection", exc_info=True)
+        self._connection = None
+
+
+mail_queue = MailQueue(
+    maxsize=settings.MAIL_QUEUE_SIZE,
+    max_retries=settings.MAIL_MAX_RETRIES,
+    backoff=settings.MAIL_RETRY_BACKOFF_SECS,
+    idle_timeout=settings.MAIL_QUEUE_IDLE_SECS,
+)
+registry.gauge("fym_mail_queue_depth", "Emails waiting to be sent", mail_queue.depth)
+
+
+def send_mail_async(
+    subject: str, message: str, from_email: Optional[str], recipient_list
+) -> None:
+    """Queue a plain text email, like ``django.core.mail.send_mail``."""
+    with tracing.span("mail.enqueue"):
+        mail_queue.enqueue(EmailMessage(subject, message, from_email, recipient_list))
+
+
+@atexit.register
+def _drain_on_exit() -> None:
+    # Best effort only: a stuck relay must not stop the process exiting
+    if mail_queue.depth():
+        worker = threading.Thread(target=mail_queue.join, daemon=True)
+        worker.start()
+        worker.join(settings.MAIL_QUEUE_IDLE_SECS)
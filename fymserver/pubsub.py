@@ -0,0 +1,208 @@
+"""Fan-out of small JSON-able messages to subscribers waiting on the event loop.
+
+Publishers may call from any thread (sync views run in a thread pool under
+ASGI); delivery is handed to each subscriber's own loop. The broker used is
+chosen by ``settings.PUBSUB_BROKER``: ``InProcessBroker`` only reaches
+subscribers in the publishing process, while ``CachePollingBroker`` reaches
+every process sharing the default cache.
+"""
+import asyncio
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, Optional, Set
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 16
+MESSAGE_TTL_SECS = 5 * 60
+
+
+class Subscription:
+    def __init__(self, broker: "InProcessBroker", channel: str, maxsize: int):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+    def deliver(self, message: Any) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The subscriber's loop has already closed
+            pass
+
+    def _put(self, message: Any) -> None:
+        # A slow subscriber only needs to know something changed, so drop the
+        # oldest message rather than letting the queue grow
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Any]:
+        """Wait for the next message, or return ``None`` after ``timeout``."""
+        if not self.queue.empty():
+            return self.queue.get_nowait()
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self.broker.unsubscribe(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class InProcessBroker:
+    def __init__(self, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+
+    def subscribe(self, channel: str) -> Subscription:
+        """Subscribe to ``channel``; must be called from a running event loop."""
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.channel]
+
+    def publish(self, channel: str, message: Any) -> int:
+        """Deliver ``message`` to subscribers of ``channel``; returns how many."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(message)
+        return len(subscribers)
+
+    def subscriber_count(self, channel: str) -> int:
+        with self._lock:
+            return len(self._subscribers.get(channel, ()))
+
+
+def _seq_key(channel: str) -> str:
+    return f"pubsub:{channel}"
+
+
+def _message_key(channel: str, seq: int) -> str:
+    return f"pubsub:{channel}:{seq}"
+
+
+class CachePollingBroker(InProcessBroker):
+    """Broker shared between processes through the default cache.
+
+    Each channel's messages are numbered by a counter in the cache. A thread
+    in each subscribing process polls the counters of the channels it has
+    subscribers for, every ``interval`` seconds. The cache must be shared
+    between processes, i.e. not the default ``LocMemCache``.
+    """
+
+    def __init__(
+        self, queue_size: int = DEFAULT_QUEUE_SIZE, interval: Optional[float] = None
+    ):
+        super().__init__(queue_size)
+        self.interval = settings.PUBSUB_POLL_INTERVAL if interval is None else interval
+        self._last_seqs: Dict[str, int] = {}
+        self._missing: Dict[str, int] = {}
+        self._poller: Optional[threading.Thread] = None
+
+    def subscribe(self, channel: str) -> Subscription:
+        with self._lock:
+            last_seq = self._last_seqs.get(channel)
+        if last_seq is None:
+            last_seq = cache.get(_seq_key(channel), 0)
+
+        subscription = super().subscribe(channel)
+        with self._lock:
+            self._last_seqs.setdefault(channel, last_seq)
+            if self._poller is None:
+                self._poller = threading.Thread(
+                    target=self._poll_forever, name="pubsub-poller", daemon=True
+                )
+                self._poller.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        super().unsubscribe(subscription)
+        with self._lock:
+            if subscription.channel not in self._subscribers:
+                self._last_seqs.pop(subscription.channel, None)
+                self._missing.pop(subscription.channel, None)
+
+    def publish(self, channel: str, message: Any) -> int:
+        """Publish ``message`` to subscribers of ``channel`` in every process.
+
+        Returns how many subscribers this process has; they, like those in
+        other processes, receive it on the next poll.
+        """
+        key = _seq_key(channel)
+        try:
+            seq = cache.incr(key)
+        except ValueError:
+            seq = 1 if cache.add(key, 1, None) else cache.incr(key)
+        cache.set(_message_key(channel, seq), message, MESSAGE_TTL_SECS)
+        return self.subscriber_count(channel)
+
+    def _poll_forever(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Failed to poll for published messages")
+
+    def poll(self) -> None:
+        """Deliver messages published since the last poll to local subscribers."""
+        with self._lock:
+            last_seqs = dict(self._last_seqs)
+        if not last_seqs:
+            return
+
+        seqs = cache.get_many([_seq_key(channel) for channel in last_seqs])
+        for channel, last_seq in last_seqs.items():
+            seq = seqs.get(_seq_key(channel), 0)
+            if seq < last_seq:
+                # The counter was evicted and has started again
+                last_seq = 0
+            if seq == last_seq:
+                continue
+
+            # Subscribers only keep the newest queue_size messages anyway
+            first = max(last_seq + 1, seq - self.queue_size + 1)
+            keys = {_message_key(channel, n): n for n in range(first, seq + 1)}
+            messages = cache.get_many(list(keys))
+            for key, n in keys.items():
+                if key in messages:
+                    InProcessBroker.publish(self, channel, messages[key])
+                elif self._missing.get(channel) != n:
+                    # Numbered but not stored yet, so try again next poll
+                    self._missing[channel] = n
+                    break
+                last_seq = n
+
+            with self._lock:
+                if channel in self._last_seqs:
+                    self._last_seqs[channel] = last_seq
+
+
+@lru_cache(maxsize=None)
+def get_broker() -> InProcessBroker:
+    return import_string(settings.PUBSUB_BROKER)()
@@ -0,0 +1,125 @@
+"""Per-client and per-endpoint request limits for individual views.
+
+Each limited view names an entry in ``settings.RATELIMITS``, which maps each
+kind of client key, ``"ip"`` or ``"player"``, to a rate of the form
+``"<requests>/<period>"`` with period one of s, m, h or d. An optional
+``"global"`` rate caps the endpoint's requests from all clients together and
+is checked along with the ``"ip"`` rate.
+
+Rates are enforced with a sliding window: requests are counted per fixed
+period with an atomic ``incr`` on the shared cache, and the previous period's
+count is weighted by how much of it still falls inside the trailing window.
+This avoids the 2x burst a plain fixed window allows across a period
+boundary, at the cost of reading the previous count, which is skipped when
+the current period alone is already over the limit.
+
+Views taking a player apply the limit twice: per remote address before
+``valid_player_required``, so unauthenticated floods are refused early, and
+per player after it, keyed on the authenticated ``request.player``.
+"""
+import asyncio
+import math
+import time
+from functools import wraps
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpRequest, HttpResponse
+
+from .asynchronous import run_blocking
+
+PERIODS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+
+def parse_rate(rate: str) -> Tuple[int, int]:
+    """Parse ``"<requests>/<period>"`` into a count and period in seconds."""
+    count, period = rate.split("/")
+    return int(count), PERIODS[period]
+
+
+def client_key(request: HttpRequest, key: str) -> str:
+    """Identify the client by authenticated player or by remote address."""
+    if key == "global":
+        return "global"
+    if key == "player":
+        if not hasattr(request, "player"):
+            raise ImproperlyConfigured(
+                'ratelimit(key="player") must be applied inside valid_player_required'
+            )
+        return f"player:{request.player.pk}"
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def hit(cache_key: str, period: int) -> int:
+    """Count a request against ``cache_key``, returning the count so far."""
+    try:
+        return cache.incr(cache_key)
+    except ValueError:
+        # First request of the period
+        if cache.add(cache_key, 1, 2 * period):
+            return 1
+        return cache.incr(cache_key)
+
+
+def retry_after(prefix: str, rate: str, now: float) -> Optional[int]:
+    """Count a request against ``rate``, returning seconds to wait if over it."""
+    limit, period = parse_rate(rate)
+    window, elapsed = divmod(now, period)
+    count = hit(f"{prefix}:{int(window)}", period)
+    if count <= limit:
+        previous = cache.get(f"{prefix}:{int(window) - 1}", 0)
+        if count + previous * (1 - elapsed / period) <= limit:
+            return None
+    return max(1, math.ceil(period - elapsed))
+
+
+def ratelimit(name: str, key: str = "ip"):
+    """Limit each client to its ``settings.RATELIMITS[name][key]`` rate.
+
+    ``key`` is ``"ip"`` to count requests per remote address, or ``"player"``
+    to count them per authenticated player. The ``"ip"`` check also applies
+    the endpoint's ``"global"`` rate, if any.
+    """
+    keys = [key, "global"] if key == "ip" else [key]
+
+    def check(request: HttpRequest) -> Optional[HttpResponse]:
+        if not settings.RATELIMIT_ENABLED:
+            return None
+
+        rates = settings.RATELIMITS.get(name, {})
+        now = time.time()
+        for limit_key in keys:
+            if not rates.get(limit_key):
+                continue
+            prefix = f"ratelimit:{name}:{client_key(request, limit_key)}"
+            wait = retry_after(prefix, rates[limit_key], now)
+            if wait is not None:
+                response = HttpResponse("Too many requests", status=429)
+                response["Retry-After"] = str(wait)
+                return response
+        return None
+
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+
+            @wraps(view)
+            async def async_wrapper(request: HttpRequest, *args, **kwargs):
+                response = await run_blocking(check, request)
+                if response is not None:
+                    return response
+                return await view(request, *args, **kwargs)
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request: HttpRequest, *args, **kwargs):
+            response = check(request)
+            if response is not None:
+                return response
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -51,6 +51,12 @@ ALLOWED_HOSTS = [
 ]
 DEFAULT_FROM_EMAIL = "webmaster@fymanager.com"
 
+# Outgoing mail is sent from a background thread, see fymserver.mail_queue
+MAIL_QUEUE_SIZE = int(os.getenv("MAIL_QUEUE_SIZE", "1000"))
+MAIL_MAX_RETRIES = int(os.getenv("MAIL_MAX_RETRIES", "5"))
+MAIL_RETRY_BACKOFF_SECS = float(os.getenv("MAIL_RETRY_BACKOFF_SECS", "1"))
+MAIL_QUEUE_IDLE_SECS = float(os.getenv("MAIL_QUEUE_IDLE_SECS", "30"))
+
 # HTTPS
 CSRF_COOKIE_SECURE = True
 SESSION_COOKIE_SECURE = True
@@ -61,6 +67,7 @@ INSTALLED_APPS = [
     "maps",
     "trains",
     "players",
+    "monitoring",
     "storages",
     "django.contrib.admin",
     "django.contrib.auth",
@@ -70,7 +77,15 @@ INSTALLED_APPS = [
     "django.contrib.staticfiles",
 ]
 
+# Benchmarks write to the configured database and cache, so outside development
+# they need fymserver.benchmark_settings
+if DEBUG:
+    INSTALLED_APPS.append("benchmarks")
+
 MIDDLEWARE = [
+    "monitoring.middleware.MetricsMiddleware",
+    "monitoring.middleware.TracingMiddleware",
+    "monitoring.middleware.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -80,7 +95,11 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
-ROOT_URLCONF = "fymserver.urls"
+# fymserver.asgi serves the async versions of the views, see fymserver.asynchronous
+if os.getenv("DJANGO_ASYNC_VIEWS") == "TRUE":
+    ROOT_URLCONF = "fymserver.async_urls"
+else:
+    ROOT_URLCONF = "fymserver.urls"
 
 TEMPLATES = [
     {
@@ -175,10 +194,63 @@ else:
     STATIC_ROOT = Path("/var/www/html/static/")
 
 AWS_QUERYSTRING_EXPIRE = "360"
+# Presigned URLs are reused until this many seconds before they expire
+AWS_URL_CACHE_MARGIN = int(os.getenv("AWS_URL_CACHE_MARGIN", "60"))
+AWS_URL_CACHE_SIZE = int(os.getenv("AWS_URL_CACHE_SIZE", "4096"))
 AWS_S3_SIGNATURE_VERSION = "s3v4"
 AWS_S3_ADDRESSING_STYLE = "virtual"
 AWS_S3_REGION_NAME = "us-east-2"
 
+# Rate limits and OTP attempt counters must be shared between worker processes,
+# so production should point this at memcached or redis
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "DJANGO_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("DJANGO_CACHE_LOCATION", ""),
+    }
+}
+
+# Requests allowed per client for each rate limited view, see fymserver.ratelimit
+RATELIMIT_ENABLED = os.getenv("RATELIMIT_ENABLED", "TRUE") == "TRUE"
+# Requests per endpoint allowed from each address, each authenticated player
+# and, under "global", from all clients together
+RATELIMITS = {
+    "trains:index": {
+        "ip": os.getenv("RATELIMIT_TRAINS_INDEX_IP", "600/m"),
+        "player": os.getenv("RATELIMIT_TRAINS_INDEX", "120/m"),
+        "global": os.getenv("RATELIMIT_TRAINS_INDEX_GLOBAL", "6000/m"),
+    },
+    "trains:download": {
+        "ip": os.getenv("RATELIMIT_TRAINS_DOWNLOAD_IP", "600/m"),
+        "player": os.getenv("RATELIMIT_TRAINS_DOWNLOAD", "120/m"),
+        "global": os.getenv("RATELIMIT_TRAINS_DOWNLOAD_GLOBAL", "6000/m"),
+    },
+    "trains:claim": {
+        "ip": os.getenv("RATELIMIT_TRAINS_CLAIM_IP", "300/m"),
+        "player": os.getenv("RATELIMIT_TRAINS_CLAIM", "60/m"),
+        "global": os.getenv("RATELIMIT_TRAINS_CLAIM_GLOBAL", "3000/m"),
+    },
+    "trains:upload": {
+        "ip": os.getenv("RATELIMIT_TRAINS_UPLOAD_IP", "300/m"),
+        "player": os.getenv("RATELIMIT_TRAINS_UPLOAD", "60/m"),
+        "global": os.getenv("RATELIMIT_TRAINS_UPLOAD_GLOBAL", "3000/m"),
+    },
+    "maps:update": {
+        "ip": os.getenv("RATELIMIT_MAPS_UPDATE", "300/m"),
+        "global": os.getenv("RATELIMIT_MAPS_UPDATE_GLOBAL", "1200/m"),
+    },
+    "players:send_auth_code": {
+        "ip": os.getenv("RATELIMIT_SEND_AUTH_CODE", "10/h"),
+        "global": os.getenv("RATELIMIT_SEND_AUTH_CODE_GLOBAL", "600/h"),
+    },
+    "players:check_auth_code": {
+        "ip": os.getenv("RATELIMIT_CHECK_AUTH_CODE", "30/h"),
+        "global": os.getenv("RATELIMIT_CHECK_AUTH_CODE_GLOBAL", "3000/h"),
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
@@ -186,6 +258,68 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 OTP_STEP_SECS = int(os.getenv("OTP_STEP_SECS", "30"))
 OTP_DRIFT_RANGE = int(os.getenv("OTP_DRIFT_RANGE", "20"))
+# Wrong codes allowed per player before check_auth_code starts refusing them
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", "10"))
+OTP_ATTEMPT_WINDOW_SECS = int(os.getenv("OTP_ATTEMPT_WINDOW_SECS", "900"))
+
+# Validated player tokens are trusted for this long without a database lookup
+PLAYER_TOKEN_CACHE_TTL = int(os.getenv("PLAYER_TOKEN_CACHE_TTL", "60"))
+
+# Staged uploads never completed are removed by purge_uploads after this long
+STAGED_UPLOAD_MAX_AGE_HOURS = int(os.getenv("STAGED_UPLOAD_MAX_AGE_HOURS", "24"))
+# Downloaded trains older than this are removed by the purge_trains command
+TRAIN_RETENTION_DAYS = int(os.getenv("TRAIN_RETENTION_DAYS", "90"))
+# ...and moved to the archive table by archive_trains once this old
+TRAIN_ARCHIVE_AFTER_DAYS = int(os.getenv("TRAIN_ARCHIVE_AFTER_DAYS", "0"))
+
+# Threads available to async views for blocking storage and mail calls
+BLOCKING_IO_WORKERS = int(os.getenv("BLOCKING_IO_WORKERS", "32"))
+
+# Train notifications are published by uWSGI workers and delivered by the ASGI
+# server, so the broker must be shared between processes: CachePollingBroker
+# needs a shared DJANGO_CACHE_BACKEND, such as memcached or Redis
+PUBSUB_BROKER = os.getenv("PUBSUB_BROKER", "fymserver.pubsub.CachePollingBroker")
+# Seconds between CachePollingBroker checks for new messages
+PUBSUB_POLL_INTERVAL = float(os.getenv("PUBSUB_POLL_INTERVAL", "1.0"))
+
+# Addresses allowed to scrape /fymserver/monitoring/metrics
+METRICS_ALLOWED_IPS = os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1").split(",")
+# Directory where each worker process writes its metrics, so that a scrape of
+# any one of them reports the totals of all; must be set when serving from more
+# than one process. METRICS_WRITE_INTERVAL is the seconds between writes
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_WRITE_INTERVAL = float(os.getenv("METRICS_WRITE_INTERVAL", "5.0"))
+
+# Profiling of sampled requests, see monitoring.profiling
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED") == "TRUE"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0.001"))
+PROFILING_DIR = os.getenv("PROFILING_DIR", str(BASE_DIR / "profiles"))
+PROFILING_MAX_FILES = int(os.getenv("PROFILING_MAX_FILES", "1000"))
+PROFILING_TOKEN_MAX_AGE = int(os.getenv("PROFILING_TOKEN_MAX_AGE", "3600"))
+# Views whose profiles also record peak memory use
+PROFILING_MEMORY_VIEWS = [
+    "maps:update_jpg_file",
+    "maps:update_yrd_file",
+    "maps:update_his_file",
+    "maps:publish",
+    "trains:upload",
+]
+
+# Request tracing, see monitoring.tracing. Every trace slower than
+# TRACING_SLOW_SECS is kept, and TRACING_SAMPLE_RATE of the others
+TRACING_ENABLED = os.getenv("TRACING_ENABLED") == "TRUE"
+TRACING_SLOW_SECS = float(os.getenv("TRACING_SLOW_SECS", "1.0"))
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", "0.01"))
+TRACING_MAX_SPANS = int(os.getenv("TRACING_MAX_SPANS", "1000"))
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "monitoring.tracing.JsonLinesExporter")
+TRACING_FILE = os.getenv("TRACING_FILE", str(BASE_DIR / "traces.jsonl"))
+# JsonLinesExporter rotates TRACING_FILE at this size, keeping this many old files
+TRACING_FILE_MAX_BYTES = int(
+    os.getenv("TRACING_FILE_MAX_BYTES", str(100 * 1024 * 1024))
+)
+TRACING_FILE_BACKUPS = int(os.getenv("TRACING_FILE_BACKUPS", "3"))
+TRACING_COLLECTOR_URL = os.getenv("TRACING_COLLECTOR_URL", "")
+TRACING_QUEUE_SIZE = int(os.getenv("TRACING_QUEUE_SIZE", "1000"))
 
 LOGGING = {
     "version": 1,
@@ -1,8 +1,51 @@
 from django.conf import settings
 from storages.backends.s3boto3 import S3Boto3Storage
 
+from monitoring.instrumentation import InstrumentedStorageMixin
 
-class MapDataS3Storage(S3Boto3Storage):
+from .caching import TTLCache
+
+_url_cache = TTLCache(
+    maxsize=settings.AWS_URL_CACHE_SIZE,
+    ttl=int(settings.AWS_QUERYSTRING_EXPIRE) - settings.AWS_URL_CACHE_MARGIN,
+)
+
+
+class CachedUrlMixin:
+    """Reuses presigned URLs until shortly before they expire.
+
+    Only plain ``url(name)`` calls are cached; overwriting or deleting an
+    object through the storage invalidates its URL.
+    """
+
+    url_cache = _url_cache
+
+    def _url_cache_key(self, name):
+        return (type(self).__name__, self.bucket_name, self.location, name)
+
+    def invalidate_url(self, name):
+        self.url_cache.invalidate(self._url_cache_key(name))
+
+    def url(self, name, parameters=None, expire=None, http_method=None):
+        if parameters is not None or expire is not None or http_method is not None:
+            return super().url(name, parameters, expire, http_method)
+
+        return self.url_cache.get_or_set(
+            self._url_cache_key(name), lambda: super(CachedUrlMixin, self).url(name)
+        )
+
+    def _save(self, name, content):
+        self.invalidate_url(name)
+        name = super()._save(name, content)
+        self.invalidate_url(name)
+        return name
+
+    def delete(self, name):
+        super().delete(name)
+        self.invalidate_url(name)
+
+
+class MapDataS3Storage(InstrumentedStorageMixin, CachedUrlMixin, S3Boto3Storage):
     bucket_name = "freightyardmanager-serverdata"
     location = "maps"
     default_acl = "private"
@@ -10,7 +53,7 @@ class MapDataS3Storage(S3Boto3Storage):
     custom_domain = False
 
 
-class TrainDataS3Storage(S3Boto3Storage):
+class TrainDataS3Storage(InstrumentedStorageMixin, CachedUrlMixin, S3Boto3Storage):
     bucket_name = "freightyardmanager-serverdata"
     location = "trains"
     default_acl = "private"
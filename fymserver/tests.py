@@ -0,0 +1,740 @@
+import asyncio
+import base64
+import hashlib
+import os
+import socketserver
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List
+from unittest import mock
+
+from botocore.exceptions import ClientError
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.uploadhandler import StopFutureHandlers
+from django.core.mail import EmailMessage
+from django.core.mail.backends.smtp import EmailBackend
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from .asynchronous import StreamingASGIHandler
+from .caching import TTLCache
+from .direct_uploads import stale_uploads
+from .files import delete_files
+from .ingest_state import IngestState, watch
+from .mail_queue import MAIL_SENT, MailQueue
+from .pubsub import CachePollingBroker, InProcessBroker
+from .ratelimit import parse_rate, ratelimit
+from .storage_backends import CachedUrlMixin
+from .upload_handlers import (
+    S3MultipartUploadHandler,
+    StagedUpload,
+    new_staging_name,
+    streamed_upload,
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestTTLCache(SimpleTestCase):
+    def test_returns_cached_value_until_expiry(self):
+        clock = FakeClock()
+        cache = TTLCache(maxsize=10, ttl=5, timer=clock)
+        cache.set("key", "value")
+
+        clock.now = 4.9
+        self.assertEqual("value", cache.get("key"))
+
+        clock.now = 5
+        self.assertIsNone(cache.get("key"))
+
+    def test_evicts_least_recently_used_entry(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(1, cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(3, cache.get("c"))
+
+    def test_get_or_set_calls_factory_once_for_concurrent_misses(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        calls: List[int] = []
+        release = threading.Event()
+
+        def factory():
+            calls.append(1)
+            release.wait(5)
+            return "value"
+
+        results: List[str] = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(cache.get_or_set("key", factory))
+            )
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual(["value"] * 5, results)
+
+    def test_invalidate_during_factory_discards_result(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+
+        def factory():
+            cache.invalidate("key")
+            return "old"
+
+        self.assertEqual("old", cache.get_or_set("key", factory))
+        self.assertEqual("new", cache.get_or_set("key", lambda: "new"))
+
+
+class FakeStorage:
+    bucket_name = "bucket"
+    location = "maps"
+
+    def __init__(self) -> None:
+        self.signed = 0
+
+    def url(self, name, parameters=None, expire=None, http_method=None):
+        self.signed += 1
+        return f"/{name}?sig={self.signed}"
+
+    def _save(self, name, content):
+        return name
+
+    def delete(self, name):
+        pass
+
+
+class CachedFakeStorage(CachedUrlMixin, FakeStorage):
+    pass
+
+
+class TestCachedUrlMixin(SimpleTestCase):
+    def setUp(self):
+        self.storage = CachedFakeStorage()
+        self.storage.url_cache = TTLCache(maxsize=10, ttl=60)
+
+    def test_reuses_signed_url(self):
+        first = self.storage.url("1001.jpg")
+        second = self.storage.url("1001.jpg")
+
+        self.assertEqual(first, second)
+        self.assertEqual(1, self.storage.signed)
+
+    def test_does_not_cache_urls_with_custom_parameters(self):
+        self.storage.url("1001.jpg", http_method="PUT")
+        self.storage.url("1001.jpg", http_method="PUT")
+
+        self.assertEqual(2, self.storage.signed)
+
+    def test_save_invalidates_url(self):
+        first = self.storage.url("1001.jpg")
+        self.storage._save("1001.jpg", None)
+
+        self.assertNotEqual(first, self.storage.url("1001.jpg"))
+
+
+class TestIngestState(SimpleTestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dirpath = Path(tempdir.name)
+        self.filepath = self.dirpath / "1001.yrd"
+        self.filepath.write_bytes(b"data")
+
+    def test_unrecorded_file_is_changed(self):
+        state = IngestState(self.dirpath / "state.json")
+        self.assertTrue(state.changed(self.filepath))
+
+    def test_recorded_file_is_unchanged_after_reload(self):
+        state = IngestState(self.dirpath / "state.json")
+        state.record(self.filepath, "")
+        state.save()
+
+        self.assertFalse(
+            IngestState(self.dirpath / "state.json").changed(self.filepath)
+        )
+
+    def test_file_with_new_size_is_changed(self):
+        state = IngestState(self.dirpath / "state.json")
+        state.record(self.filepath, "")
+        self.filepath.write_bytes(b"new data")
+
+        self.assertTrue(state.changed(self.filepath))
+
+    def test_touched_file_with_same_hash_is_unchanged(self):
+        state = IngestState(self.dirpath / "state.json")
+        state.record(
+            self.filepath,
+            "3a6eb0790f39ac87c94f3856b2dd2c5d110e6811602261a9a923d3bb23adc8b7",
+        )
+        os.utime(self.filepath, ns=(0, 0))
+
+        self.assertFalse(state.changed(self.filepath))
+
+    def test_reset_ignores_saved_state(self):
+        state = IngestState(self.dirpath / "state.json")
+        state.record(self.filepath, "")
+        state.save()
+
+        state = IngestState(self.dirpath / "state.json", reset=True)
+        self.assertTrue(state.changed(self.filepath))
+
+
+class TestWatch(SimpleTestCase):
+    def test_keeps_running_after_a_failed_run(self):
+        run = mock.Mock(side_effect=[RuntimeError("boom"), None])
+
+        with mock.patch(
+            "fymserver.ingest_state.time.sleep", side_effect=[None, KeyboardInterrupt]
+        ), self.assertLogs("fymserver.ingest_state", "ERROR"):
+            with self.assertRaises(KeyboardInterrupt):
+                watch(run, 0)
+
+        self.assertEqual(2, run.call_count)
+
+
+class FakeS3Client:
+    """Local stand-in for the parts of the boto3 S3 client used for uploads."""
+
+    def __init__(self, fail_parts: bool = False) -> None:
+        self.objects: Dict[str, bytes] = {}
+        self.uploads: Dict[str, Dict] = {}
+        self.fail_parts = fail_parts
+        self.last_modified: Dict[str, datetime] = {}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = f"upload-{len(self.uploads) + 1}"
+        self.uploads[upload_id] = {"key": Key, "parts": {}}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if self.fail_parts:
+            raise ConnectionError("S3 unavailable")
+        self.uploads[UploadId]["parts"][PartNumber] = Body
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self.uploads.pop(UploadId)
+        self.objects[Key] = b"".join(
+            upload["parts"][part["PartNumber"]] for part in MultipartUpload["Parts"]
+        )
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        del self.uploads[UploadId]
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn, HttpMethod):
+        return f"https://{Params['Bucket']}.s3.example.com/{Params['Key']}"
+
+    def head_object(self, Bucket, Key, ChecksumMode=None):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        body = self.objects[Key]
+        return {
+            "ContentLength": len(body),
+            "ChecksumSHA256": base64.b64encode(hashlib.sha256(body).digest()).decode(),
+        }
+
+    def copy(self, CopySource, Bucket, Key, ExtraArgs=None):
+        self.objects[Key] = self.objects[CopySource["Key"]]
+        self.copy_args = ExtraArgs
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def list_objects_v2(self, Bucket, Prefix, ContinuationToken="0", MaxKeys=2):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix))
+        start = int(ContinuationToken)
+        now = datetime.now(timezone.utc)
+        response = {
+            "Contents": [
+                {"Key": key, "LastModified": self.last_modified.get(key, now)}
+                for key in keys[start : start + MaxKeys]
+            ],
+            "IsTruncated": start + MaxKeys < len(keys),
+        }
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = str(start + MaxKeys)
+        return response
+
+    def delete_objects(self, Bucket, Delete):
+        self.delete_calls = getattr(self, "delete_calls", 0) + 1
+        for obj in Delete["Objects"]:
+            self.objects.pop(obj["Key"], None)
+        return {}
+
+
+class FakeS3Storage(S3Boto3Storage):
+    bucket_name = "bucket"
+    location = "maps"
+
+    def __init__(self, client: FakeS3Client) -> None:
+        super().__init__()
+        self.client = client
+
+    @property
+    def connection(self):
+        return SimpleNamespace(meta=SimpleNamespace(client=self.client))
+
+    def _normalize_name(self, name):
+        return f"{self.location}/{name}"
+
+    def _get_write_parameters(self, name, content=None):
+        return {}
+
+    def _open(self, name, mode="rb"):
+        return ContentFile(self.client.objects[self._normalize_name(name)], name)
+
+    def exists(self, name):
+        return self._normalize_name(name) in self.client.objects
+
+
+class TestS3MultipartUploadHandler(SimpleTestCase):
+    def start_upload(self, client: FakeS3Client) -> S3MultipartUploadHandler:
+        handler = S3MultipartUploadHandler(None, FakeS3Storage(client))
+        handler.part_size = 4
+        with self.assertRaises(StopFutureHandlers):
+            handler.new_file("jpg_file", "1001.jpg", "image/jpeg", None)
+        return handler
+
+    def test_streams_chunks_as_parts_and_returns_staged_upload(self):
+        client = FakeS3Client()
+        handler = self.start_upload(client)
+
+        for start, chunk in enumerate([b"abc", b"def", b"gh"]):
+            self.assertIsNone(handler.receive_data_chunk(chunk, start))
+        self.assertEqual(1, len(handler.parts))
+        staged = handler.file_complete(8)
+
+        self.assertIsInstance(staged, StagedUpload)
+        self.assertEqual(8, staged.size)
+        self.assertEqual(
+            "9c56cc51b374c3ba189210d5b6d4bf57790d351c96c47c02190ecf1e430635ab",
+            staged.sha256,
+        )
+        self.assertEqual({f"maps/{staged.staging_name}": b"abcdefgh"}, client.objects)
+        self.assertEqual({}, client.uploads)
+
+    def test_commit_moves_staged_upload_to_final_name(self):
+        client = FakeS3Client()
+        handler = self.start_upload(client)
+        handler.receive_data_chunk(b"data", 0)
+        staged = handler.file_complete(4)
+
+        staged.commit("1001.jpg")
+
+        self.assertEqual({"maps/1001.jpg": b"data"}, client.objects)
+        self.assertEqual("REPLACE", client.copy_args["MetadataDirective"])
+        self.assertTrue(staged.committed)
+
+    def test_interrupted_upload_is_aborted(self):
+        client = FakeS3Client()
+        handler = self.start_upload(client)
+        handler.receive_data_chunk(b"abcdef", 0)
+
+        handler.upload_interrupted()
+
+        self.assertEqual({}, client.uploads)
+        self.assertEqual({}, client.objects)
+
+    def test_failed_part_aborts_upload(self):
+        client = FakeS3Client(fail_parts=True)
+        handler = self.start_upload(client)
+
+        with self.assertRaises(ConnectionError):
+            handler.receive_data_chunk(b"abcdef", 0)
+
+        self.assertEqual({}, client.uploads)
+
+
+class TestStreamedUpload(SimpleTestCase):
+    def setUp(self):
+        self.client = FakeS3Client()
+        self.field = SimpleNamespace(storage=FakeS3Storage(self.client))
+
+    def post(self):
+        return RequestFactory().post("/", {"upload": BytesIO(b"data")})
+
+    def test_streams_unread_body_to_s3_and_discards_uncommitted_upload(self):
+        @streamed_upload(self.field)
+        def view(request):
+            file_obj = request.FILES["upload"]
+            self.assertIsInstance(file_obj, StagedUpload)
+            self.assertEqual(
+                {f"maps/{file_obj.staging_name}": b"data"}, self.client.objects
+            )
+            return HttpResponse()
+
+        view(self.post())
+
+        self.assertEqual({}, self.client.objects)
+
+    def test_does_not_stream_body_already_read(self):
+        @streamed_upload(self.field)
+        def view(request):
+            self.assertNotIsInstance(request.FILES["upload"], StagedUpload)
+            return HttpResponse()
+
+        request = self.post()
+        request.POST
+        view(request)
+
+        self.assertEqual({}, self.client.uploads)
+
+    def test_discards_files_staged_before_a_parse_error(self):
+        complete_multipart_upload = self.client.complete_multipart_upload
+
+        def complete_then_fail(**kwargs):
+            complete_multipart_upload(**kwargs)
+            self.client.fail_parts = True
+
+        self.client.complete_multipart_upload = complete_then_fail
+
+        @streamed_upload(self.field)
+        def view(request):
+            request.FILES
+            return HttpResponse()
+
+        request = RequestFactory().post(
+            "/", {"first": BytesIO(b"data"), "second": BytesIO(b"more")}
+        )
+        with self.assertRaises(ConnectionError):
+            view(request)
+
+        self.assertEqual({}, self.client.uploads)
+        self.assertEqual({}, self.client.objects)
+
+    def test_logs_buffering_body_already_read(self):
+        @streamed_upload(self.field)
+        def view(request):
+            return HttpResponse()
+
+        request = self.post()
+        request.POST
+        with self.assertLogs("fymserver.upload_handlers", "INFO"):
+            view(request)
+
+    def test_rejected_request_never_reaches_s3(self):
+        @ratelimit("test")
+        @streamed_upload(self.field)
+        def view(request):
+            return HttpResponse()
+
+        cache.clear()
+        with override_settings(
+            RATELIMIT_ENABLED=True, RATELIMITS={"test": {"ip": "0/m"}}
+        ):
+            response = view(self.post())
+
+        self.assertEqual(429, response.status_code)
+        self.assertEqual({}, self.client.uploads)
+        self.assertEqual({}, self.client.objects)
+
+
+class TestStaleUploads(SimpleTestCase):
+    def test_lists_staged_uploads_written_before_cutoff(self):
+        client = FakeS3Client()
+        cutoff = datetime(2020, 1, 2, tzinfo=timezone.utc)
+        names = [new_staging_name() for _ in range(3)]
+        for name in names + ["1001.jpg"]:
+            client.objects[f"maps/{name}"] = b"data"
+            client.last_modified[f"maps/{name}"] = cutoff - timedelta(days=1)
+        client.last_modified[f"maps/{names[2]}"] = cutoff
+
+        stale = stale_uploads(FakeS3Storage(client), cutoff)
+
+        self.assertEqual(sorted(names[:2]), sorted(stale))
+
+
+class TestDeleteFiles(SimpleTestCase):
+    def test_deletes_s3_objects_in_batches(self):
+        client = FakeS3Client()
+        names = [f"{i}.zrn" for i in range(1001)]
+        client.objects = {f"maps/{name}": b"" for name in names}
+        client.objects["maps/kept.zrn"] = b""
+
+        self.assertEqual(1001, delete_files(FakeS3Storage(client), names))
+
+        self.assertEqual(2, client.delete_calls)
+        self.assertEqual(["maps/kept.zrn"], list(client.objects))
+
+
+class TestInProcessBroker(SimpleTestCase):
+    async def test_delivers_to_channel_subscribers_only(self):
+        broker = InProcessBroker()
+        with broker.subscribe("a") as sub_a, broker.subscribe("b") as sub_b:
+            self.assertEqual(1, broker.publish("a", {"pk": 1}))
+
+            self.assertEqual({"pk": 1}, await sub_a.get(1))
+            self.assertIsNone(await sub_b.get(0))
+
+        self.assertEqual(0, broker.subscriber_count("a"))
+
+    async def test_publishes_from_other_threads(self):
+        broker = InProcessBroker()
+        with broker.subscribe("a") as subscription:
+            thread = threading.Thread(target=broker.publish, args=("a", "hello"))
+            thread.start()
+            self.assertEqual("hello", await subscription.get(1))
+            thread.join()
+
+    async def test_slow_subscriber_keeps_newest_messages(self):
+        broker = InProcessBroker(queue_size=2)
+        with broker.subscribe("a") as subscription:
+            for i in range(3):
+                broker.publish("a", i)
+            await asyncio.sleep(0)
+
+            self.assertEqual(1, await subscription.get(0))
+            self.assertEqual(2, await subscription.get(0))
+
+
+class TestCachePollingBroker(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        # Two brokers sharing the cache, as in two processes; tests poll by hand
+        self.publisher = CachePollingBroker(interval=3600)
+        self.broker = CachePollingBroker(interval=3600)
+
+    async def test_delivers_messages_published_by_another_broker(self):
+        with self.broker.subscribe("a") as sub_a, self.broker.subscribe("b") as sub_b:
+            self.publisher.publish("a", {"pk": 1})
+            self.publisher.publish("a", {"pk": 2})
+            self.broker.poll()
+
+            self.assertEqual({"pk": 1}, await sub_a.get(1))
+            self.assertEqual({"pk": 2}, await sub_a.get(1))
+            self.assertIsNone(await sub_b.get(0))
+
+    async def test_does_not_replay_messages_published_before_subscribing(self):
+        self.publisher.publish("a", "old")
+        with self.broker.subscribe("a") as subscription:
+            self.publisher.publish("a", "new")
+            self.broker.poll()
+
+            self.assertEqual("new", await subscription.get(1))
+            self.assertIsNone(await subscription.get(0))
+
+    async def test_skips_message_still_missing_on_next_poll(self):
+        with self.broker.subscribe("a") as subscription:
+            self.publisher.publish("a", "lost")
+            self.publisher.publish("a", "kept")
+            cache.delete("pubsub:a:1")
+
+            self.broker.poll()
+            self.assertIsNone(await subscription.get(0))
+            self.broker.poll()
+            self.assertEqual("kept", await subscription.get(1))
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough of SMTP for smtplib to deliver plain messages."""
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self) -> None:
+        self.server.connections += 1
+        self.reply("220 localhost")
+        for line in self.rfile:
+            command = line.decode().strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250 localhost")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = b"".join(iter(self.rfile.readline, b".\r\n"))
+                if self.server.fail_next:
+                    self.server.fail_next -= 1
+                    self.reply("451 Try again later")
+                else:
+                    self.server.messages.append(data)
+                    self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), FakeSMTPHandler)
+        self.connections = 0
+        self.fail_next = 0
+        self.messages: List[bytes] = []
+
+
+class TestMailQueue(SimpleTestCase):
+    def setUp(self):
+        self.server = FakeSMTPServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        host, port = self.server.server_address
+        self.mail_queue = MailQueue(
+            connection_factory=lambda fail_silently: EmailBackend(
+                host=host, port=port, fail_silently=fail_silently, timeout=5
+            ),
+            sleep=lambda seconds: None,
+        )
+
+    def send(self, count: int) -> None:
+        for i in range(count):
+            self.mail_queue.enqueue(
+                EmailMessage(f"Message {i}", "body", "from@localhost", ["to@localhost"])
+            )
+        self.mail_queue.join()
+
+    def test_reuses_connection(self):
+        sent = MAIL_SENT.value()
+        self.send(3)
+
+        self.assertEqual(3, len(self.server.messages))
+        self.assertEqual(1, self.server.connections)
+        self.assertEqual(3, self.mail_queue.stats()["sent"])
+        self.assertEqual(0, self.mail_queue.stats()["depth"])
+        self.assertEqual(sent + 3, MAIL_SENT.value())
+
+    def test_reconnects_and_retries_failed_send(self):
+        self.server.fail_next = 1
+
+        self.send(2)
+
+        self.assertEqual(2, len(self.server.messages))
+        self.assertEqual(2, self.server.connections)
+        self.assertEqual(1, self.mail_queue.stats()["retries"])
+
+    def test_gives_up_after_max_retries(self):
+        self.server.fail_next = 10
+        self.mail_queue.max_retries = 2
+
+        self.send(1)
+
+        self.assertEqual([], self.server.messages)
+        self.assertEqual(1, self.mail_queue.stats()["failed"])
+
+
+@ratelimit("test")
+def limited_view(request):
+    return HttpResponse()
+
+
+@ratelimit("test", key="player")
+def player_limited_view(request):
+    return HttpResponse()
+
+
+@override_settings(
+    RATELIMIT_ENABLED=True,
+    RATELIMITS={"test": {"ip": "2/m", "player": "2/m", "global": "3/m"}},
+)
+class TestRateLimit(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def statuses(self, count: int, remote_addr: str = "127.0.0.1") -> List[int]:
+        return [
+            limited_view(self.factory.post("/", REMOTE_ADDR=remote_addr)).status_code
+            for _ in range(count)
+        ]
+
+    def player_statuses(self, count: int, player_id: int) -> List[int]:
+        statuses = []
+        for _ in range(count):
+            request = self.factory.post("/")
+            request.player = SimpleNamespace(pk=player_id)
+            statuses.append(player_limited_view(request).status_code)
+        return statuses
+
+    def test_parses_rates(self):
+        self.assertEqual((10, 3600), parse_rate("10/h"))
+
+    def test_limits_each_address_separately(self):
+        self.assertEqual([200, 200, 429], self.statuses(3))
+        self.assertEqual([200], self.statuses(1, remote_addr="10.0.0.2"))
+
+    def test_limits_each_authenticated_player_separately(self):
+        self.assertEqual([200, 200, 429], self.player_statuses(3, player_id=1))
+        self.assertEqual([200], self.player_statuses(1, player_id=2))
+
+    def test_limits_all_addresses_together(self):
+        self.assertEqual([200, 200], self.statuses(2))
+        self.assertEqual([200, 429], self.statuses(2, remote_addr="10.0.0.2"))
+
+    def test_does_not_allow_a_burst_across_a_period_boundary(self):
+        with mock.patch("fymserver.ratelimit.time.time", return_value=59.0):
+            self.assertEqual([200, 200], self.statuses(2))
+        with mock.patch("fymserver.ratelimit.time.time", return_value=61.0):
+            self.assertEqual([429], self.statuses(1))
+        with mock.patch("fymserver.ratelimit.time.time", return_value=121.0):
+            self.assertEqual([200], self.statuses(1))
+
+    def test_player_limit_requires_authenticated_player(self):
+        request = self.factory.post("/", {"player": "Player1"})
+        with self.assertRaises(ImproperlyConfigured):
+            player_limited_view(request)
+
+    def test_sets_retry_after(self):
+        self.statuses(2)
+        response = limited_view(self.factory.post("/"))
+
+        self.assertTrue(1 <= int(response["Retry-After"]) <= 60)
+
+    @override_settings(RATELIMIT_ENABLED=False)
+    def test_can_be_disabled(self):
+        self.assertEqual([200] * 3, self.statuses(3))
+
+
+class TestStreamingASGIHandler(SimpleTestCase):
+    def test_sends_each_chunk_as_made_off_the_event_loop(self):
+        events = []
+
+        def content():
+            for chunk in (b"a", b"b"):
+                events.append(("made", chunk, threading.current_thread()))
+                yield chunk
+
+        async def send(message):
+            events.append(("sent", message.get("body"), threading.current_thread()))
+
+        response = StreamingHttpResponse(content())
+        asyncio.run(StreamingASGIHandler().send_response(response, send))
+
+        self.assertEqual(
+            [
+                ("sent", None),
+                ("made", b"a"),
+                ("sent", b"a"),
+                ("made", b"b"),
+                ("sent", b"b"),
+                ("sent", None),
+            ],
+            [(event, body) for event, body, _ in events],
+        )
+        loop_thread = events[0][2]
+        self.assertNotEqual(loop_thread, events[1][2])
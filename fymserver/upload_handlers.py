@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import logging
+import re
+import uuid
+from functools import wraps
+
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from .asynchronous import run_blocking
+
+logger = logging.getLogger(__name__)
+
+STAGING_PREFIX = "uploads"
+STAGING_NAME_RE = re.compile(rf"^{STAGING_PREFIX}/[0-9a-f]{{32}}$")
+
+
+def new_staging_name() -> str:
+    return f"{STAGING_PREFIX}/{uuid.uuid4().hex}"
+
+
+class StagedUpload(UploadedFile):
+    """An upload that has already been written to a staging key in S3.
+
+    ``commit`` moves it to its final name with a server-side copy; anything
+    not committed is removed by ``discard``.
+    """
+
+    def __init__(self, storage, staging_name, name, content_type, size, sha256):
+        super().__init__(None, name, content_type, size)
+        self.storage = storage
+        self.staging_name = staging_name
+        self.sha256 = sha256
+        self.committed = False
+
+    def commit(self, name: str) -> str:
+        if isinstance(self.storage, S3Boto3Storage):
+            self.storage.connection.meta.client.copy(
+                {
+                    "Bucket": self.storage.bucket_name,
+                    "Key": self.storage._normalize_name(self.staging_name),
+                },
+                self.storage.bucket_name,
+                self.storage._normalize_name(name),
+                ExtraArgs={
+                    **self.storage._get_write_parameters(name),
+                    # Without this S3 copies the staged object's metadata and
+                    # ignores the ContentType and other write parameters
+                    "MetadataDirective": "REPLACE",
+                },
+            )
+            if hasattr(self.storage, "invalidate_url"):
+                self.storage.invalidate_url(name)
+        else:
+            with self.storage.open(self.staging_name) as f:
+                name = self.storage.save(name, f)
+
+        self.discard()
+        self.committed = True
+        return name
+
+    def close(self) -> None:
+        # Called by Django on every uploaded file; there is no local file to close
+        pass
+
+    def discard(self) -> None:
+        if isinstance(self.storage, S3Boto3Storage):
+            self.storage.connection.meta.client.delete_object(
+                Bucket=self.storage.bucket_name,
+                Key=self.storage._normalize_name(self.staging_name),
+            )
+        else:
+            self.storage.delete(self.staging_name)
+
+
+class S3MultipartUploadHandler(FileUploadHandler):
+    """Forwards uploaded file chunks into an S3 multipart upload as they arrive.
+
+    The file is never spooled to memory or disk on the worker; at most one
+    part is buffered at a time. The SHA-256 digest is computed on the fly.
+    """
+
+    part_size = 8 * 1024 * 1024
+
+    def __init__(self, request, storage):
+        super().__init__(request)
+        self.storage = storage
+        self.upload_id = None
+        # Every file completed so far, including any the parser then dropped
+        self.staged = []
+
+    def _client(self):
+        return self.storage.connection.meta.client
+
+    def new_file(self, field_name, file_name, content_type, *args, **kwargs):
+        super().new_file(field_name, file_name, content_type, *args, **kwargs)
+
+        self.staging_name = new_staging_name()
+        self.key = self.storage._normalize_name(self.staging_name)
+        self.parts = []
+        self.buffer = bytearray()
+        self.digest = hashlib.sha256()
+
+        response = self._client().create_multipart_upload(
+            Bucket=self.storage.bucket_name,
+            Key=self.key,
+            **self.storage._get_write_parameters(self.staging_name),
+        )
+        self.upload_id = response["UploadId"]
+
+        raise StopFutureHandlers()
+
+    def _upload_part(self) -> None:
+        part_number = len(self.parts) + 1
+        try:
+            response = self._client().upload_part(
+                Bucket=self.storage.bucket_name,
+                Key=self.key,
+                UploadId=self.upload_id,
+                PartNumber=part_number,
+                Body=bytes(self.buffer),
+            )
+        except Exception:
+            self.abort()
+            raise
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        self.buffer.clear()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        self.buffer.extend(raw_data)
+        if len(self.buffer) >= self.part_size:
+            self._upload_part()
+        return None
+
+    def file_complete(self, file_size):
+        if self.buffer or not self.parts:
+            self._upload_part()
+
+        try:
+            self._client().complete_multipart_upload(
+                Bucket=self.storage.bucket_name,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={"Parts": self.parts},
+            )
+        except Exception:
+            self.abort()
+            raise
+        self.upload_id = None
+
+        staged = StagedUpload(
+            self.storage,
+            self.staging_name,
+            self.file_name,
+            self.content_type,
+            file_size,
+            self.digest.hexdigest(),
+        )
+        self.staged.append(staged)
+        return staged
+
+    def abort(self) -> None:
+        if self.upload_id is None:
+            return
+        try:
+            self._client().abort_multipart_upload(
+                Bucket=self.storage.bucket_name,
+                Key=self.key,
+                UploadId=self.upload_id,
+            )
+        except Exception:
+            logger.exception("Failed to abort multipart upload of %s", self.key)
+        self.upload_id = None
+
+    def upload_interrupted(self):
+        self.abort()
+
+
+def stage_upload(storage, file_obj, sha256: str) -> StagedUpload:
+    """Write an uploaded file to a staging name, unless it was streamed to one."""
+    if isinstance(file_obj, StagedUpload):
+        return file_obj
+    staging_name = storage.save(new_staging_name(), file_obj)
+    return StagedUpload(
+        storage,
+        staging_name,
+        file_obj.name,
+        getattr(file_obj, "content_type", None),
+        file_obj.size,
+        sha256,
+    )
+
+
+def store_upload(field_file, name: str, file_obj) -> None:
+    """Store an uploaded file on a model's FieldFile without saving the model."""
+    if isinstance(file_obj, StagedUpload):
+        field_file.name = file_obj.commit(name)
+    else:
+        field_file.save(name, file_obj, save=False)
+
+
+def streamed_upload(field):
+    """Stream uploads for this view straight to S3 when ``field`` is stored there.
+
+    Apply this inside any authentication and rate limiting decorators, so that
+    rejected requests never reach S3: the body is only streamed if nothing has
+    read ``request.POST`` yet, and is otherwise handled as a normal upload.
+    So only clients sending their credentials in the ``X-FYM-Player`` and
+    ``X-FYM-Token`` headers get streamed uploads; with credentials in the form,
+    ``valid_player_required`` has to parse the body first.
+
+    Uploads that the view does not commit are removed from S3 afterwards,
+    including any completed before the body failed to parse.
+    """
+
+    def cleanup(handler: S3MultipartUploadHandler) -> None:
+        handler.abort()
+        for staged in handler.staged:
+            if staged.committed:
+                continue
+            try:
+                staged.discard()
+            except Exception:
+                logger.exception("Failed to discard staged upload %s", staged.name)
+
+    def streams_to_s3(request) -> bool:
+        if not isinstance(field.storage, S3Boto3Storage):
+            return False
+        if hasattr(request, "_files"):
+            logger.info(
+                "Buffering upload to %s: the body was read before it could be "
+                "streamed, as when credentials are sent in the form",
+                request.path,
+            )
+            return False
+        return True
+
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if not streams_to_s3(request):
+                    await run_blocking(getattr, request, "POST")
+                    return await view(request, *args, **kwargs)
+
+                handler = S3MultipartUploadHandler(request, field.storage)
+                request.upload_handlers = [handler]
+                try:
+                    # Parsing the body uploads the parts, so keep it off the loop
+                    await run_blocking(getattr, request, "POST")
+                    return await view(request, *args, **kwargs)
+                finally:
+                    await run_blocking(cleanup, handler)
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not streams_to_s3(request):
+                return view(request, *args, **kwargs)
+
+            handler = S3MultipartUploadHandler(request, field.storage)
+            request.upload_handlers = [handler]
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                cleanup(handler)
+
+        return wrapper
+
+    return decorator
@@ -20,5 +20,6 @@ urlpatterns = [
     path("fymserver/maps/", include("maps.urls")),
     path("fymserver/trains/", include("trains.urls")),
     path("fymserver/players/", include("players.urls")),
+    path("fymserver/monitoring/", include("monitoring.urls")),
     path("fymserver/admin/", admin.site.urls),
 ]
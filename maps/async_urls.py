@@ -0,0 +1,17 @@
+from fymserver.asynchronous import with_async_views
+
+from . import async_views, views
+from .urls import urlpatterns as sync_urlpatterns
+
+app_name = "maps"
+
+urlpatterns = with_async_views(
+    sync_urlpatterns,
+    {
+        views.update_jpg_file: async_views.update_jpg_file,
+        views.update_yrd_file: async_views.update_yrd_file,
+        views.update_his_file: async_views.update_his_file,
+        views.complete_upload: async_views.complete_upload,
+        views.publish: async_views.publish,
+    },
+)
@@ -0,0 +1,49 @@
+"""Async versions of the map views that wait on S3, served by ``fymserver.asgi``.
+
+Each parses its upload off the event loop, then runs the same code as the
+sync view with ``sync_to_async``, in the thread Django keeps for the request.
+The other map views run as they are.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpRequest, HttpResponse
+
+from fymserver.asynchronous import async_csrf_exempt
+from fymserver.ratelimit import ratelimit
+from fymserver.upload_handlers import streamed_upload
+
+from . import views
+from .models import Map
+
+
+@async_csrf_exempt
+@ratelimit("maps:update")
+@streamed_upload(Map._meta.get_field("jpg_file"))
+async def update_jpg_file(request: HttpRequest, pk: int) -> HttpResponse:
+    return await sync_to_async(views.update_file)(request, pk, "jpg_file", "jpg")
+
+
+@async_csrf_exempt
+@ratelimit("maps:update")
+@streamed_upload(Map._meta.get_field("yrd_file"))
+async def update_yrd_file(request: HttpRequest, pk: int) -> HttpResponse:
+    return await sync_to_async(views.update_file)(request, pk, "yrd_file", "yrd")
+
+
+@async_csrf_exempt
+@ratelimit("maps:update")
+@streamed_upload(Map._meta.get_field("his_file"))
+async def update_his_file(request: HttpRequest, pk: int) -> HttpResponse:
+    return await sync_to_async(views.update_file)(request, pk, "his_file", "his")
+
+
+@async_csrf_exempt
+@ratelimit("maps:update")
+async def complete_upload(request: HttpRequest, pk: int, file_ext: str) -> HttpResponse:
+    return await sync_to_async(views._complete_upload)(request, pk, file_ext)
+
+
+@async_csrf_exempt
+@ratelimit("maps:update")
+@streamed_upload(Map._meta.get_field("jpg_file"))
+async def publish(request: HttpRequest, pk: int) -> HttpResponse:
+    return await sync_to_async(views._publish)(request, pk)
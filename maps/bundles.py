@@ -0,0 +1,64 @@
+import tempfile
+import zipfile
+from typing import Iterable, Iterator
+
+from django.core.files import File
+
+from fymserver.archives import ArchiveEntry, stream_zip
+
+from .manifest import manifest_snapshot
+from .models import FILE_EXTS, Map
+
+BUNDLE_DIR = "bundles"
+
+
+def _map_entries(map_objs: Iterable[Map]) -> Iterator[ArchiveEntry]:
+    for map_obj in map_objs:
+        date_time = map_obj.modified_date.timetuple()[:6]
+        for file_ext in FILE_EXTS:
+            field_file = getattr(map_obj, f"{file_ext}_file")
+            if not field_file:
+                continue
+            info = zipfile.ZipInfo(f"{map_obj.id}.{file_ext}", date_time=date_time)
+            yield info, lambda field_file=field_file: field_file.open("rb")
+
+
+def stream_bundle(map_objs: Iterable[Map]) -> Iterator[bytes]:
+    return stream_zip(_map_entries(map_objs))
+
+
+def bundle_storage():
+    return Map._meta.get_field("jpg_file").storage
+
+
+def catalogue_bundle_name() -> str:
+    """Name of the full-catalogue bundle for the current manifest version."""
+    etag, _ = manifest_snapshot()
+    version = etag.strip('"')[:16]
+    return f"{BUNDLE_DIR}/catalogue-{version}.zip"
+
+
+def build_catalogue_bundle() -> bool:
+    """Build and store the full-catalogue bundle unless it is already current.
+
+    Bundles for older manifest versions are deleted. Returns whether a new
+    bundle was built.
+    """
+    storage = bundle_storage()
+    name = catalogue_bundle_name()
+    if storage.exists(name):
+        return False
+
+    with tempfile.TemporaryFile() as f:
+        for chunk in stream_bundle(Map.objects.order_by("id").iterator()):
+            f.write(chunk)
+        f.seek(0)
+        name = storage.save(name, File(f))
+
+    _, old_bundles = storage.listdir(BUNDLE_DIR)
+    for old_bundle in old_bundles:
+        old_name = f"{BUNDLE_DIR}/{old_bundle}"
+        if old_name != name:
+            storage.delete(old_name)
+
+    return True
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from fymserver.ingest_state import watch
+from maps.bundles import build_catalogue_bundle, catalogue_bundle_name
+
+
+class Command(BaseCommand):
+    help = "Builds the full map catalogue bundle if any map has changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep running, rebuilding the bundle whenever a map changes",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=60.0,
+            help="Seconds between checks for map changes in --watch mode",
+        )
+
+    def handle(self, *args, **options):
+        def run():
+            if build_catalogue_bundle():
+                self.stdout.write(f"Built {catalogue_bundle_name()}")
+            elif not options["watch"]:
+                self.stdout.write(f"{catalogue_bundle_name()} is up to date")
+
+        if options["watch"]:
+            watch(run, options["interval"])
+        else:
+            run()
@@ -1,65 +1,224 @@
 import os
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
 from glob import glob
 from pathlib import Path
-from typing import cast
+from typing import List, Optional, Tuple
 
-from django.core.files.base import ContentFile
+from django.core.files import File
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
 from tqdm import tqdm
 
-from maps.models import Map
+from fymserver.files import file_digest
+from fymserver.ingest_state import IngestState, add_incremental_arguments, watch
+from maps.models import FILE_EXTS, Map, next_change_seqs
+from maps.yrd import FverError, find_fver, parse_fver_date
 
+DEFAULT_WORKERS = 8
+DEFAULT_BATCH_SIZE = 500
 
-def ingest_map(dirpath: Path, map_id: int):
-    jpg_path = dirpath / f"{map_id}.jpg"
-    yrd_path = dirpath / f"{map_id}.yrd"
-    his_path = dirpath / f"{map_id}.his"
+BULK_UPDATE_FIELDS = [
+    "modified_date",
+    "updated_at",
+    "change_seq",
+    *(
+        f"{file_ext}_{attr}"
+        for file_ext in FILE_EXTS
+        for attr in ("file", "size", "sha256")
+    ),
+]
 
-    date_str = ""
 
-    with open(yrd_path) as f:
-        for line in f:
-            line = line.lower()
-            if line.startswith("fver="):
-                date_str = line.split("=")[1].strip()
-                break
+class IngestStats:
+    def __init__(self) -> None:
+        self.maps = 0
+        self.files = 0
+        self.bytes = 0
+        self.failures: List[Tuple[int, str]] = []
+        self.start = time.monotonic()
+
+    def report(self) -> str:
+        elapsed = max(time.monotonic() - self.start, 1e-6)
+        megabytes = self.bytes / (1024 * 1024)
+        report = (
+            f"Ingested {self.maps} maps, uploaded {self.files} files "
+            f"({megabytes:.1f} MB) in {elapsed:.1f}s: "
+            f"{self.files / elapsed:.1f} files/s, {megabytes / elapsed:.2f} MB/s"
+        )
+        if self.failures:
+            report += f"; {len(self.failures)} maps failed"
+        return report
+
 
-    if not date_str:
-        raise ValueError(f"Could not find Fver line in {yrd_path}")
+def read_fver_date(yrd_path: Path) -> Optional[date]:
+    with open(yrd_path) as f:
+        try:
+            date_str = find_fver(f)
+        except FverError:
+            raise ValueError(f"Could not find Fver line in {yrd_path}")
 
     try:
-        date = datetime.strptime(date_str, r"%m/%d/%Y").date()
+        return parse_fver_date(date_str)
     except ValueError:
-        print(yrd_path)
+        return None
+
+
+def upload_map_files(dirpath: Path, map_obj: Map) -> Tuple[int, int]:
+    """Stream any changed files for a map to storage, without touching the database."""
+    files = 0
+    nbytes = 0
+
+    for file_ext in FILE_EXTS:
+        with open(dirpath / f"{map_obj.id}.{file_ext}", "rb") as f:
+            content = File(f)
+            size, sha256 = file_digest(content)
+            if map_obj.file_matches(file_ext, size, sha256):
+                continue
+            getattr(map_obj, f"{file_ext}_file").save(
+                f"{map_obj.id}.{file_ext}", content, save=False
+            )
+        map_obj.set_file_digest(file_ext, size, sha256)
+        files += 1
+        nbytes += size
+
+    return files, nbytes
+
+
+def save_maps(
+    map_objs: List[Map],
+    batch_size: int,
+    dirpath: Path,
+    state: Optional[IngestState] = None,
+) -> None:
+    now = timezone.now()
+
+    with transaction.atomic():
+        change_seqs = next_change_seqs(len(map_objs))
+        for map_obj, change_seq in zip(map_objs, change_seqs):
+            map_obj.change_seq = change_seq
+            map_obj.updated_at = now
+
+        Map.objects.bulk_create(
+            [map_obj for map_obj in map_objs if map_obj._state.adding],
+            batch_size=batch_size,
+        )
+        Map.objects.bulk_update(
+            [map_obj for map_obj in map_objs if not map_obj._state.adding],
+            BULK_UPDATE_FIELDS,
+            batch_size=batch_size,
+        )
+
+    for map_obj in map_objs:
+        map_obj._state.adding = False
+        record_map(state, dirpath, map_obj)
+
+    if state is not None:
+        state.save()
+
+
+def record_map(state: Optional[IngestState], dirpath: Path, map_obj: Map) -> None:
+    if state is None:
         return
+    for file_ext in FILE_EXTS:
+        state.record(
+            dirpath / f"{map_obj.id}.{file_ext}",
+            getattr(map_obj, f"{file_ext}_sha256"),
+        )
 
-    if Map.objects.filter(pk=map_id).exists():
-        m = cast(Map, Map.objects.get(pk=map_id))
-        if m.modified_date == date:
-            return
-        m.modified_date = date
 
-    else:
-        m = Map(id=map_id, modified_date=date)
+def record_skipped(state: Optional[IngestState], dirpath: Path, map_id: int) -> None:
+    """Record a map's files as seen, so a map that failed to parse is not
+    retried until one of its files changes."""
+    if state is None:
+        return
+    for file_ext in FILE_EXTS:
+        path = dirpath / f"{map_id}.{file_ext}"
+        if path.exists():
+            state.record(path)
+
 
-    with open(jpg_path, "rb") as f1:
-        m.jpg_file.save(f"{map_id}.jpg", ContentFile(f1.read()))
-    with open(yrd_path, "rb") as f2:
-        m.yrd_file.save(f"{map_id}.yrd", ContentFile(f2.read()))
-    with open(his_path, "rb") as f3:
-        m.his_file.save(f"{map_id}.his", ContentFile(f3.read()))
-    m.save()
+def map_changed(state: IngestState, dirpath: Path, map_id: int) -> bool:
+    return any(
+        state.changed(dirpath / f"{map_id}.{file_ext}") for file_ext in FILE_EXTS
+    )
 
 
-def ingest_maps(dirpath: Path):
-    for yrd_file in tqdm(glob(str(dirpath / "*.yrd"))):
+def find_map_ids(dirpath: Path) -> List[int]:
+    map_ids = []
+    for yrd_file in glob(str(dirpath / "*.yrd")):
         map_id_str = os.path.splitext(os.path.basename(yrd_file))[0]
         try:
-            map_id = int(map_id_str)
+            map_ids.append(int(map_id_str))
         except ValueError:
             continue
-        ingest_map(dirpath, int(map_id))
+    return map_ids
+
+
+def ingest_maps(
+    dirpath: Path,
+    workers: int = DEFAULT_WORKERS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    state: Optional[IngestState] = None,
+) -> IngestStats:
+    stats = IngestStats()
+    map_ids = find_map_ids(dirpath)
+    if state is not None:
+        map_ids = [map_id for map_id in map_ids if map_changed(state, dirpath, map_id)]
+    existing = Map.objects.in_bulk(map_ids)
+
+    pending: List[Map] = []
+    for map_id in map_ids:
+        try:
+            modified_date = read_fver_date(dirpath / f"{map_id}.yrd")
+        except ValueError as e:
+            stats.failures.append((map_id, str(e)))
+            record_skipped(state, dirpath, map_id)
+            continue
+        map_obj = existing.get(map_id)
+        if modified_date is None:
+            if map_obj is not None:
+                record_map(state, dirpath, map_obj)
+            continue
+
+        if map_obj is None:
+            map_obj = Map(id=map_id, modified_date=modified_date)
+        elif map_obj.modified_date == modified_date:
+            record_map(state, dirpath, map_obj)
+            continue
+        else:
+            map_obj.modified_date = modified_date
+        pending.append(map_obj)
+
+    uploaded: List[Map] = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(upload_map_files, dirpath, map_obj): map_obj
+            for map_obj in pending
+        }
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            try:
+                files, nbytes = future.result()
+            except Exception as e:
+                stats.failures.append((futures[future].id, str(e)))
+                continue
+            stats.maps += 1
+            stats.files += files
+            stats.bytes += nbytes
+
+            uploaded.append(futures[future])
+            if len(uploaded) >= batch_size:
+                save_maps(uploaded, batch_size, dirpath, state)
+                uploaded = []
+
+    if uploaded:
+        save_maps(uploaded, batch_size, dirpath, state)
+    elif state is not None:
+        state.save()
+
+    return stats
 
 
 class Command(BaseCommand):
@@ -67,6 +226,36 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("dirpath", type=str)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=DEFAULT_WORKERS,
+            help="Number of concurrent uploads",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help="Number of maps written to the database per batch",
+        )
+        add_incremental_arguments(parser)
 
     def handle(self, *args, **options):
-        ingest_maps(Path(options["dirpath"]))
+        dirpath = Path(options["dirpath"])
+        state = IngestState.from_options(dirpath, options)
+
+        def run():
+            stats = ingest_maps(
+                dirpath,
+                workers=options["workers"],
+                batch_size=options["batch_size"],
+                state=state,
+            )
+            self.stdout.write(stats.report())
+            for map_id, error in stats.failures:
+                self.stderr.write(f"Failed to ingest map {map_id}: {error}")
+
+        if options["watch"]:
+            watch(run, options["interval"])
+        else:
+            run()
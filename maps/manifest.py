@@ -0,0 +1,36 @@
+import hashlib
+import json
+from typing import Tuple
+
+from django.core.cache import cache
+
+from .models import Map, last_change_seq
+
+MANIFEST_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def manifest_version() -> str:
+    return str(last_change_seq())
+
+
+def manifest_snapshot() -> Tuple[str, bytes]:
+    """Return the ETag and body of the map manifest.
+
+    The snapshot is built once per manifest version, the last map change
+    sequence, which moves whenever a Map row is created, changed or deleted.
+    """
+    cache_key = f"maps:manifest:{manifest_version()}"
+    snapshot = cache.get(cache_key)
+    if snapshot is None:
+        body = json.dumps(
+            {
+                "maps": [
+                    map_obj.manifest_entry() for map_obj in Map.objects.order_by("id")
+                ]
+            },
+            separators=(",", ":"),
+        ).encode()
+        etag = '"{}"'.format(hashlib.sha256(body).hexdigest())
+        snapshot = (etag, body)
+        cache.set(cache_key, snapshot, MANIFEST_CACHE_TIMEOUT)
+    return snapshot
@@ -0,0 +1,48 @@
+# Generated by Django 4.0.10 on 2026-10-18 09:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("maps", "0002_alter_map_his_file_alter_map_jpg_file_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="map",
+            name="his_sha256",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="map",
+            name="his_size",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="map",
+            name="jpg_sha256",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="map",
+            name="jpg_size",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="map",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name="map",
+            name="yrd_sha256",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="map",
+            name="yrd_size",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
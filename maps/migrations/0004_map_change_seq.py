@@ -0,0 +1,42 @@
+# Generated by Django 4.0.10 on 2026-10-18 09:35
+
+from django.db import migrations, models
+
+
+def assign_change_seqs(apps, schema_editor):
+    Map = apps.get_model("maps", "Map")
+    MapChange = apps.get_model("maps", "MapChange")
+    for map_obj in Map.objects.order_by("id"):
+        map_obj.change_seq = MapChange.objects.create(map_id=map_obj.id).pk
+        map_obj.save(update_fields=["change_seq"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("maps", "0003_map_updated_at_and_file_digests"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MapChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("map_id", models.IntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="map",
+            name="change_seq",
+            field=models.BigIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.RunPython(assign_change_seqs, migrations.RunPython.noop),
+    ]
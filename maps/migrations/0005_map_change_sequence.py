@@ -0,0 +1,44 @@
+# Generated by Django 4.0.10 on 2026-10-18 10:17
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def start_sequence(apps, schema_editor):
+    Map = apps.get_model("maps", "Map")
+    MapChange = apps.get_model("maps", "MapChange")
+    MapChangeSequence = apps.get_model("maps", "MapChangeSequence")
+    last = max(
+        MapChange.objects.aggregate(last=Max("id"))["last"] or 0,
+        Map.objects.aggregate(last=Max("change_seq"))["last"] or 0,
+    )
+    MapChangeSequence.objects.create(pk=1, value=last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("maps", "0004_map_change_seq"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MapChangeSequence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("value", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(start_sequence, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name="MapChange",
+        ),
+    ]
@@ -1,12 +1,131 @@
-from django.db import models
+from typing import List, Optional, Tuple
+
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 
 from fymserver.storage_backends import MapDataS3Storage
 
+FILE_EXTS = ("jpg", "yrd", "his")
+
+# Fields whose changes clients must fetch, and so get a new change sequence
+CHANGE_FIELDS = (
+    "modified_date",
+    *(
+        f"{file_ext}_{attr}"
+        for file_ext in FILE_EXTS
+        for attr in ("file", "size", "sha256")
+    ),
+)
+
+
+class MapChangeSequence(models.Model):
+    """Single-row counter allocating the map change sequence.
+
+    Allocating updates the row, and the row lock is held until the caller's
+    transaction commits, so concurrent writers commit in sequence order: by
+    the time a sequence is visible, every lower one has committed or been
+    rolled back, and ``changes`` never skips one that is still in flight.
+    """
+
+    value = models.BigIntegerField(default=0)
+
+
+def next_change_seqs(count: int) -> List[int]:
+    """Allocate ``count`` sequences; call inside the transaction writing them."""
+    if count < 1:
+        return []
+    while not MapChangeSequence.objects.filter(pk=1).update(value=F("value") + count):
+        MapChangeSequence.objects.get_or_create(pk=1)
+    last = MapChangeSequence.objects.values_list("value", flat=True).get(pk=1)
+    return list(range(last - count + 1, last + 1))
+
+
+def next_change_seq() -> int:
+    return next_change_seqs(1)[0]
+
+
+def last_change_seq() -> int:
+    """The latest allocated sequence, moved by every map change or deletion."""
+    return (
+        MapChangeSequence.objects.filter(pk=1).values_list("value", flat=True).first()
+        or 0
+    )
+
 
 # Create your models here.
 class Map(models.Model):
     id = models.IntegerField(primary_key=True)
     modified_date = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    change_seq = models.BigIntegerField(null=True, unique=True, editable=False)
     jpg_file = models.FileField(storage=MapDataS3Storage())
     yrd_file = models.FileField(storage=MapDataS3Storage())
     his_file = models.FileField(storage=MapDataS3Storage())
+    jpg_size = models.BigIntegerField(null=True, blank=True)
+    yrd_size = models.BigIntegerField(null=True, blank=True)
+    his_size = models.BigIntegerField(null=True, blank=True)
+    jpg_sha256 = models.CharField(max_length=64, blank=True, default="")
+    yrd_sha256 = models.CharField(max_length=64, blank=True, default="")
+    his_sha256 = models.CharField(max_length=64, blank=True, default="")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        map_obj = super().from_db(db, field_names, values)
+        map_obj._saved_state = map_obj._change_state()
+        return map_obj
+
+    def _change_state(self) -> Optional[Tuple]:
+        if self.get_deferred_fields().intersection(CHANGE_FIELDS):
+            return None
+        return tuple(
+            getattr(value, "name", value)
+            for value in (getattr(self, name) for name in CHANGE_FIELDS)
+        )
+
+    def save(self, *args, **kwargs):
+        state = self._change_state()
+        if (
+            not self._state.adding
+            and state is not None
+            and state == getattr(self, "_saved_state", None)
+        ):
+            # Nothing clients fetch has changed, so keep the change sequence
+            super().save(*args, **kwargs)
+            return
+
+        with transaction.atomic(using=kwargs.get("using")):
+            self.change_seq = next_change_seq()
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "change_seq"}
+            super().save(*args, **kwargs)
+        self._saved_state = state
+
+    def set_file_digest(self, file_ext: str, size: int, sha256: str) -> None:
+        setattr(self, f"{file_ext}_size", size)
+        setattr(self, f"{file_ext}_sha256", sha256)
+
+    def file_matches(self, file_ext: str, size: int, sha256: str) -> bool:
+        return (
+            bool(getattr(self, f"{file_ext}_file"))
+            and getattr(self, f"{file_ext}_size") == size
+            and getattr(self, f"{file_ext}_sha256") == sha256
+        )
+
+    def manifest_entry(self) -> dict:
+        entry: dict = {"id": self.id, "modified_date": self.modified_date.isoformat()}
+        for file_ext in FILE_EXTS:
+            entry[file_ext] = {
+                "size": getattr(self, f"{file_ext}_size"),
+                "sha256": getattr(self, f"{file_ext}_sha256"),
+            }
+        return entry
+
+
+@receiver(post_delete, sender=Map)
+def _count_map_deletion(sender, **kwargs) -> None:
+    # A deleted map leaves no row to carry a sequence, but last_change_seq must
+    # still move; this runs inside the deleting transaction
+    next_change_seq()
@@ -1,17 +1,31 @@
+import hashlib
+import tempfile
+import zipfile
 from datetime import date
 from io import BytesIO
+from pathlib import Path
 from typing import cast
 from unittest import mock
 
+from django.core.cache import cache
 from django.core.files import File
+from django.core.files.base import ContentFile
 from django.http import JsonResponse
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
 from override_storage import override_storage
 from override_storage.storage import LocMemStorage
 
-from .models import Map
+from fymserver.ingest_state import IngestState
+from fymserver.tests import FakeS3Client, FakeS3Storage
+from fymserver.upload_handlers import StagedUpload, stage_upload
+
+from .bundles import build_catalogue_bundle, catalogue_bundle_name
+from .management.commands.ingest_maps import ingest_maps, upload_map_files
+from .manifest import manifest_version
+from .models import FILE_EXTS, Map, MapChangeSequence, next_change_seqs
+from .views import BUNDLE_MAX_IDS
 
 
 def mock_file(filename: str) -> mock.MagicMock:
@@ -73,6 +87,24 @@ class MapJpgFileViewTests(TestCase):
         response = self.client.get(url)
         self.assertRedirects(response, "/1001.jpg", fetch_redirect_response=False)
 
+    def test_jpg_view_returns_digest_as_etag(self):
+        map = create_map()
+        map.set_file_digest("jpg", 1, "abc")
+        map.save()
+
+        url = reverse("maps:jpg_file", args=(map.id,))
+        response = self.client.get(url)
+        self.assertEqual('"abc"', response["ETag"])
+
+    def test_jpg_view_returns_304_for_matching_etag(self):
+        map = create_map()
+        map.set_file_digest("jpg", 1, "abc")
+        map.save()
+
+        url = reverse("maps:jpg_file", args=(map.id,))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"abc"')
+        self.assertEqual(304, response.status_code)
+
 
 @override_storage()
 class MapYrdFileViewTests(TestCase):
@@ -132,12 +164,156 @@ class MapListViewTests(TestCase):
         self.assertJSONEqual(response.content.decode(), expected_json)
 
 
+@override_storage()
+class MapManifestViewTests(TestCase):
+    def setUp(self):
+        # Change sequences restart in every test, so cached manifests would match
+        cache.clear()
+
+    def test_returns_map_dates_and_file_digests(self):
+        map_obj = create_map(map_id=1001, mod_date=date(2000, 1, 31))
+        map_obj.set_file_digest("jpg", 12, "abc")
+        map_obj.save()
+
+        response = self.client.get(reverse("maps:manifest"))
+
+        self.assertEqual(200, response.status_code)
+        self.assertJSONEqual(
+            response.content.decode(),
+            {
+                "maps": [
+                    {
+                        "id": 1001,
+                        "modified_date": "2000-01-31",
+                        "jpg": {"size": 12, "sha256": "abc"},
+                        "yrd": {"size": None, "sha256": ""},
+                        "his": {"size": None, "sha256": ""},
+                    }
+                ]
+            },
+        )
+
+    def test_returns_304_for_matching_etag(self):
+        create_map(map_id=1001)
+        url = reverse("maps:manifest")
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(304, response.status_code)
+
+    def test_etag_changes_when_map_changes(self):
+        map_obj = create_map(map_id=1001, mod_date=date(2000, 1, 1))
+        url = reverse("maps:manifest")
+        etag = self.client.get(url)["ETag"]
+
+        map_obj.modified_date = date(2000, 1, 2)
+        map_obj.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response["ETag"])
+
+    def test_etag_changes_when_map_is_deleted(self):
+        create_map(map_id=1001)
+        map_obj = create_map(map_id=1002)
+        url = reverse("maps:manifest")
+        etag = self.client.get(url)["ETag"]
+
+        map_obj.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response["ETag"])
+
+    def test_version_is_a_single_row_read(self):
+        create_map(map_id=1001)
+
+        with self.assertNumQueries(1):
+            manifest_version()
+
+
+@override_storage()
+class MapChangesViewTests(TestCase):
+    def get_changes(self, **params) -> dict:
+        response = self.client.get(reverse("maps:changes"), params)
+        self.assertEqual(200, response.status_code)
+        return response.json()
+
+    def test_returns_changed_maps_in_change_order(self):
+        create_map(map_id=1002)
+        create_map(map_id=1001)
+
+        self.assertEqual([1002, 1001], self.get_changes()["maps"])
+
+    def test_returns_only_maps_changed_since_cursor(self):
+        create_map(map_id=1001)
+        map_obj = create_map(map_id=1002)
+        cursor = self.get_changes()["next"]
+
+        map_obj.modified_date = date(2000, 1, 1)
+        map_obj.save()
+        create_map(map_id=1003)
+
+        self.assertEqual([1002, 1003], self.get_changes(since=cursor)["maps"])
+
+    def test_pages_with_limit(self):
+        for map_id in (1001, 1002, 1003):
+            create_map(map_id=map_id)
+
+        first_page = self.get_changes(limit=2)
+        second_page = self.get_changes(since=first_page["next"], limit=2)
+
+        self.assertEqual([1001, 1002], first_page["maps"])
+        self.assertEqual([1003], second_page["maps"])
+
+    def test_returns_same_cursor_when_nothing_changed(self):
+        create_map(map_id=1001)
+        cursor = self.get_changes()["next"]
+
+        self.assertEqual({"maps": [], "next": cursor}, self.get_changes(since=cursor))
+
+    def test_fails_with_malformed_cursor(self):
+        response = self.client.get(reverse("maps:changes"), {"since": "abc"})
+        self.assertEqual(400, response.status_code)
+
+    def test_allocates_consecutive_sequences(self):
+        first, second = next_change_seqs(2)
+
+        self.assertEqual(first + 1, second)
+        self.assertEqual(second, MapChangeSequence.objects.get(pk=1).value)
+
+    def test_save_without_changes_keeps_sequence(self):
+        map_obj = create_map(map_id=1001)
+        change_seq = map_obj.change_seq
+
+        map_obj.save()
+        Map.objects.get(pk=1001).save()
+
+        self.assertEqual(change_seq, Map.objects.get(pk=1001).change_seq)
+
+    def test_uploading_file_for_new_map_allocates_one_sequence(self):
+        last = MapChangeSequence.objects.get(pk=1).value
+        url = reverse("maps:update_jpg_file", args=(1001,))
+
+        self.client.post(url, {"jpg_file": BytesIO(b"jpg_data")})
+
+        self.assertEqual(last + 1, Map.objects.get(pk=1001).change_seq)
+        self.assertEqual(last + 1, MapChangeSequence.objects.get(pk=1).value)
+
+
 class OverwritingLocMemStorage(LocMemStorage):
     def get_available_name(self, name, max_length=None):
         if name in self.cache:
             del self.cache[name]
         return name
 
+    def listdir(self, path):
+        prefix = f"{path}/"
+        return [], [
+            name[len(prefix) :] for name in self.cache if name.startswith(prefix)
+        ]
+
 
 @override_storage(storage=OverwritingLocMemStorage)
 class MapUpdateTests(TestCase):
@@ -208,6 +384,10 @@ class MapUpdateAnyFileTests(TestCase):
 
         assert f"{map_id}.{file_ext}" == file_obj.name
         assert b"updated_data" == file_obj.read()
+        assert len(b"updated_data") == getattr(map_obj, f"{file_ext}_size")
+        assert hashlib.sha256(b"updated_data").hexdigest() == getattr(
+            map_obj, f"{file_ext}_sha256"
+        )
 
     def test_update_succeeds_for_new_map(self):
         for file_ext in self.FILE_EXTS:
@@ -242,6 +422,18 @@ class MapUpdateAnyFileTests(TestCase):
 
             Map.objects.get(pk=map_id).delete()
 
+    def test_update_with_unchanged_file_does_not_save_map(self):
+        for file_ext in self.FILE_EXTS:
+            map_id = 1001
+            url = reverse(f"maps:update_{file_ext}_file", args=(map_id,))
+
+            self.client.post(url, {f"{file_ext}_file": BytesIO(b"updated_data")})
+            change_seq = Map.objects.get(pk=map_id).change_seq
+            self.client.post(url, {f"{file_ext}_file": BytesIO(b"updated_data")})
+
+            self.assertEqual(change_seq, Map.objects.get(pk=map_id).change_seq)
+            self.assert_file_ok(map_id, file_ext)
+
     def test_update_fails_with_file_missing(self):
         for file_ext in self.FILE_EXTS:
             map_id = 1001
@@ -251,3 +443,411 @@ class MapUpdateAnyFileTests(TestCase):
             response = self.client.post(url, {})
 
             self.assertEqual(400, response.status_code)
+
+
+def write_map_files(dirpath: Path, map_id: int, fver: str = "01/31/2000") -> None:
+    (dirpath / f"{map_id}.jpg").write_bytes(b"jpg_data")
+    (dirpath / f"{map_id}.yrd").write_text(f"Name=Test\nFver={fver}\n")
+    (dirpath / f"{map_id}.his").write_bytes(b"his_data")
+
+
+@override_storage(storage=OverwritingLocMemStorage)
+class IngestMapsTests(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dirpath = Path(tempdir.name)
+
+    def test_ingests_new_maps(self):
+        write_map_files(self.dirpath, 1001)
+        write_map_files(self.dirpath, 1002)
+
+        stats = ingest_maps(self.dirpath, workers=2, batch_size=1)
+
+        self.assertEqual(2, stats.maps)
+        self.assertEqual(6, stats.files)
+        map_obj = Map.objects.get(pk=1001)
+        self.assertEqual(date(2000, 1, 31), map_obj.modified_date)
+        self.assertEqual(b"jpg_data", map_obj.jpg_file.read())
+        self.assertEqual(hashlib.sha256(b"his_data").hexdigest(), map_obj.his_sha256)
+        self.assertIsNotNone(map_obj.change_seq)
+
+    def test_skips_maps_with_unchanged_date(self):
+        write_map_files(self.dirpath, 1001)
+        ingest_maps(self.dirpath)
+
+        stats = ingest_maps(self.dirpath)
+
+        self.assertEqual(0, stats.maps)
+
+    def test_updates_maps_with_new_date_and_uploads_only_changed_files(self):
+        write_map_files(self.dirpath, 1001)
+        ingest_maps(self.dirpath)
+        write_map_files(self.dirpath, 1001, fver="02/01/2000")
+
+        stats = ingest_maps(self.dirpath)
+
+        self.assertEqual(1, stats.files)
+        self.assertEqual(date(2000, 2, 1), Map.objects.get(pk=1001).modified_date)
+
+    def test_state_index_skips_unchanged_maps(self):
+        write_map_files(self.dirpath, 1001)
+        state = IngestState(self.dirpath / "state.json")
+        ingest_maps(self.dirpath, state=state)
+
+        with mock.patch(
+            "maps.management.commands.ingest_maps.read_fver_date"
+        ) as read_fver_date:
+            stats = ingest_maps(self.dirpath, state=state)
+
+        read_fver_date.assert_not_called()
+        self.assertEqual(0, stats.maps)
+
+    def test_records_maps_without_fver_as_failed_and_skips_them(self):
+        write_map_files(self.dirpath, 1001)
+        (self.dirpath / "1002.yrd").write_text("Name=Test\n")
+        (self.dirpath / "1002.jpg").write_bytes(b"jpg_data")
+        (self.dirpath / "1002.his").write_bytes(b"his_data")
+        state = IngestState(self.dirpath / "state.json")
+
+        stats = ingest_maps(self.dirpath, state=state)
+
+        self.assertEqual(1, stats.maps)
+        self.assertEqual([1002], [map_id for map_id, _ in stats.failures])
+        self.assertFalse(Map.objects.filter(pk=1002).exists())
+        state = IngestState(self.dirpath / "state.json")
+        with mock.patch(
+            "maps.management.commands.ingest_maps.read_fver_date"
+        ) as read_fver_date:
+            ingest_maps(self.dirpath, state=state)
+        read_fver_date.assert_not_called()
+
+    def test_saves_successful_maps_when_an_upload_fails(self):
+        write_map_files(self.dirpath, 1001)
+        write_map_files(self.dirpath, 1002)
+        real_upload = upload_map_files
+
+        def upload(dirpath, map_obj):
+            if map_obj.id == 1002:
+                raise OSError("connection reset")
+            return real_upload(dirpath, map_obj)
+
+        with mock.patch(
+            "maps.management.commands.ingest_maps.upload_map_files", upload
+        ):
+            stats = ingest_maps(self.dirpath, workers=2)
+
+        self.assertEqual(1, stats.maps)
+        self.assertEqual([(1002, "connection reset")], stats.failures)
+        self.assertTrue(Map.objects.filter(pk=1001).exists())
+        self.assertFalse(Map.objects.filter(pk=1002).exists())
+
+
+class MapDirectUploadTests(TestCase):
+    DATA = b"updated_data"
+    SHA256 = hashlib.sha256(DATA).hexdigest()
+
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        for file_ext in FILE_EXTS:
+            patcher = mock.patch.object(
+                Map._meta.get_field(f"{file_ext}_file"),
+                "storage",
+                FakeS3Storage(self.s3),
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def presign(self, file_ext: str = "jpg", **params) -> dict:
+        url = reverse(f"maps:presign_{file_ext}_upload", args=(1001,))
+        response = self.client.post(
+            url, {"size": len(self.DATA), "sha256": self.SHA256, **params}
+        )
+        self.assertEqual(200, response.status_code)
+        return response.json()
+
+    def client_upload(self, staging_name: str, data: bytes):
+        self.s3.objects[f"maps/{staging_name}"] = data
+
+    def complete(self, staging_name: str, file_ext: str = "jpg"):
+        url = reverse(f"maps:complete_{file_ext}_upload", args=(1001,))
+        return self.client.post(
+            url,
+            {"upload": staging_name, "size": len(self.DATA), "sha256": self.SHA256},
+        )
+
+    def test_presign_fails_without_digest(self):
+        url = reverse("maps:presign_jpg_upload", args=(1001,))
+        response = self.client.post(url, {"size": 1})
+        self.assertEqual(400, response.status_code)
+
+    def test_completed_upload_is_stored_on_map(self):
+        for file_ext in ("jpg", "yrd", "his"):
+            upload = self.presign(file_ext)
+            self.assertEqual(
+                f"https://bucket.s3.example.com/maps/{upload['upload']}",
+                upload["url"],
+            )
+            self.client_upload(upload["upload"], self.DATA)
+
+            response = self.complete(upload["upload"], file_ext)
+
+            self.assertEqual(200, response.status_code)
+            map_obj = Map.objects.get(pk=1001)
+            self.assertEqual(self.DATA, getattr(map_obj, f"{file_ext}_file").read())
+            self.assertEqual(self.SHA256, getattr(map_obj, f"{file_ext}_sha256"))
+            storage = Map._meta.get_field(f"{file_ext}_file").storage
+            self.assertFalse(storage.exists(upload["upload"]))
+
+    def test_complete_fails_for_mismatched_upload(self):
+        upload = self.presign()
+        self.client_upload(upload["upload"], b"other_data")
+
+        response = self.complete(upload["upload"])
+
+        self.assertEqual(400, response.status_code)
+        self.assertFalse(Map.objects.filter(pk=1001).exists())
+        storage = Map._meta.get_field("jpg_file").storage
+        self.assertFalse(storage.exists(upload["upload"]))
+
+    def test_complete_fails_for_unknown_upload(self):
+        response = self.complete("1002.jpg")
+        self.assertEqual(400, response.status_code)
+
+    @override_storage(storage=OverwritingLocMemStorage)
+    def test_presign_fails_without_s3_storage(self):
+        url = reverse("maps:presign_jpg_upload", args=(1001,))
+        response = self.client.post(
+            url, {"size": len(self.DATA), "sha256": self.SHA256}
+        )
+        self.assertEqual(400, response.status_code)
+
+
+def create_map_with_files(map_id: int) -> Map:
+    map_obj = Map(id=map_id, modified_date=date(2000, 1, 31))
+    for file_ext in ("jpg", "yrd", "his"):
+        getattr(map_obj, f"{file_ext}_file").save(
+            f"{map_id}.{file_ext}", ContentFile(f"{map_id}_{file_ext}"), save=False
+        )
+    map_obj.save()
+    return map_obj
+
+
+@override_storage(storage=OverwritingLocMemStorage)
+class MapBundleViewTests(TestCase):
+    def get_bundle(self, **params) -> zipfile.ZipFile:
+        response = self.client.get(reverse("maps:bundle"), params)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("application/zip", response["Content-Type"])
+        return zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+
+    def test_streams_requested_maps(self):
+        for map_id in (1001, 1002, 1003):
+            create_map_with_files(map_id)
+
+        archive = self.get_bundle(ids="1001,1003")
+
+        self.assertEqual(
+            ["1001.jpg", "1001.yrd", "1001.his", "1003.jpg", "1003.yrd", "1003.his"],
+            archive.namelist(),
+        )
+        self.assertEqual(b"1003_yrd", archive.read("1003.yrd"))
+
+    def test_streams_range_of_maps(self):
+        for map_id in (1001, 1002, 1003):
+            create_map_with_files(map_id)
+
+        archive = self.get_bundle(start=1002, end=1002)
+
+        self.assertEqual(["1002.jpg", "1002.yrd", "1002.his"], archive.namelist())
+
+    def test_range_from_start_spans_max_ids(self):
+        for map_id in (1001, 1001 + BUNDLE_MAX_IDS - 1, 1001 + BUNDLE_MAX_IDS):
+            create_map_with_files(map_id)
+
+        archive = self.get_bundle(start=1001)
+
+        self.assertEqual(
+            ["1001.jpg", f"{1001 + BUNDLE_MAX_IDS - 1}.jpg"],
+            [name for name in archive.namelist() if name.endswith(".jpg")],
+        )
+
+    def test_range_to_end_spans_max_ids(self):
+        for map_id in (1001, 1002, 1001 + BUNDLE_MAX_IDS):
+            create_map_with_files(map_id)
+
+        archive = self.get_bundle(end=1001 + BUNDLE_MAX_IDS)
+
+        self.assertEqual(
+            ["1002.jpg", f"{1001 + BUNDLE_MAX_IDS}.jpg"],
+            [name for name in archive.namelist() if name.endswith(".jpg")],
+        )
+
+    def test_fails_with_too_wide_range(self):
+        response = self.client.get(
+            reverse("maps:bundle"), {"start": 1001, "end": 1001 + BUNDLE_MAX_IDS}
+        )
+        self.assertEqual(400, response.status_code)
+
+    def test_full_catalogue_is_unavailable_until_bundle_is_rebuilt(self):
+        map_obj = create_map_with_files(1001)
+        build_catalogue_bundle()
+        map_obj.modified_date = date(2000, 2, 1)
+        map_obj.save()
+
+        response = self.client.get(reverse("maps:bundle"))
+
+        self.assertEqual(503, response.status_code)
+        self.assertEqual("60", response["Retry-After"])
+
+    def test_redirects_to_prebuilt_catalogue_bundle(self):
+        create_map_with_files(1001)
+        self.assertTrue(build_catalogue_bundle())
+
+        response = self.client.get(reverse("maps:bundle"))
+
+        self.assertRedirects(
+            response, f"/{catalogue_bundle_name()}", fetch_redirect_response=False
+        )
+
+    def test_catalogue_bundle_is_rebuilt_only_when_maps_change(self):
+        map_obj = create_map_with_files(1001)
+        self.assertTrue(build_catalogue_bundle())
+        self.assertFalse(build_catalogue_bundle())
+
+        map_obj.modified_date = date(2000, 2, 1)
+        map_obj.save()
+
+        self.assertTrue(build_catalogue_bundle())
+        storage = Map._meta.get_field("jpg_file").storage
+        self.assertEqual(1, len(storage.listdir("bundles")[1]))
+
+    def test_fails_with_malformed_ids(self):
+        response = self.client.get(reverse("maps:bundle"), {"ids": "1001,abc"})
+        self.assertEqual(400, response.status_code)
+
+
+@override_storage(storage=OverwritingLocMemStorage)
+class MapPublishViewTests(TestCase):
+    def publish(self, yrd_data: bytes = b"Name=Test\nFver=01/31/2000\n", **files):
+        url = reverse("maps:publish", args=(1001,))
+        data = {
+            "jpg_file": BytesIO(b"jpg_data"),
+            "yrd_file": BytesIO(yrd_data),
+            "his_file": BytesIO(b"his_data"),
+            **files,
+        }
+        return self.client.post(url, data)
+
+    def test_publish_stores_all_files_and_fver_date(self):
+        response = self.publish()
+
+        self.assertEqual(200, response.status_code)
+        map_obj = Map.objects.get(pk=1001)
+        self.assertEqual(date(2000, 1, 31), map_obj.modified_date)
+        self.assertEqual(b"jpg_data", map_obj.jpg_file.read())
+        self.assertEqual(b"his_data", map_obj.his_file.read())
+        self.assertEqual(hashlib.sha256(b"jpg_data").hexdigest(), map_obj.jpg_sha256)
+
+    def test_publish_saves_map_once(self):
+        self.publish()
+        change_seq = Map.objects.get(pk=1001).change_seq
+
+        self.publish(yrd_data=b"Fver=02/01/2000\n")
+
+        self.assertEqual(change_seq + 1, Map.objects.get(pk=1001).change_seq)
+
+    def test_republishing_identical_files_does_not_save_map(self):
+        self.publish()
+        change_seq = Map.objects.get(pk=1001).change_seq
+
+        self.publish()
+
+        self.assertEqual(change_seq, Map.objects.get(pk=1001).change_seq)
+
+    def test_failed_upload_leaves_published_map_untouched(self):
+        self.publish()
+        storage = Map._meta.get_field("jpg_file").storage
+        real_stage_upload = stage_upload
+
+        def stage(storage, file_obj, sha256):
+            if file_obj.name == "yrd_file":
+                raise ConnectionError("S3 unavailable")
+            return real_stage_upload(storage, file_obj, sha256)
+
+        with mock.patch("maps.views.stage_upload", stage):
+            with self.assertRaises(ConnectionError):
+                self.publish(
+                    yrd_data=b"Fver=02/01/2000\n", jpg_file=BytesIO(b"new_jpg_data")
+                )
+
+        map_obj = Map.objects.get(pk=1001)
+        self.assertEqual(date(2000, 1, 31), map_obj.modified_date)
+        self.assertEqual(b"jpg_data", map_obj.jpg_file.read())
+        self.assertEqual([], storage.listdir("uploads")[1])
+
+    def test_failed_publish_leaves_published_files_untouched(self):
+        self.publish()
+        storage = Map._meta.get_field("jpg_file").storage
+        files = sorted(storage.cache)
+        real_commit = StagedUpload.commit
+
+        def commit(upload, name):
+            if name.endswith(".yrd"):
+                raise ConnectionError("S3 unavailable")
+            return real_commit(upload, name)
+
+        with mock.patch.object(StagedUpload, "commit", commit):
+            with self.assertRaises(ConnectionError):
+                self.publish(
+                    yrd_data=b"Fver=02/01/2000\n", jpg_file=BytesIO(b"new_jpg_data")
+                )
+
+        map_obj = Map.objects.get(pk=1001)
+        self.assertEqual(b"jpg_data", map_obj.jpg_file.read())
+        self.assertEqual(files, sorted(storage.cache))
+
+    def test_republishing_deletes_replaced_files(self):
+        self.publish()
+        old_name = Map.objects.get(pk=1001).jpg_file.name
+
+        self.publish(jpg_file=BytesIO(b"new_jpg_data"))
+
+        storage = Map._meta.get_field("jpg_file").storage
+        map_obj = Map.objects.get(pk=1001)
+        self.assertEqual(b"new_jpg_data", map_obj.jpg_file.read())
+        self.assertTrue(map_obj.jpg_file.name.endswith("/1001.jpg"))
+        self.assertFalse(storage.exists(old_name))
+
+    def test_publish_fails_with_missing_file(self):
+        url = reverse("maps:publish", args=(1001,))
+        response = self.client.post(url, {"jpg_file": BytesIO(b"jpg_data")})
+
+        self.assertEqual(400, response.status_code)
+        self.assertFalse(Map.objects.filter(pk=1001).exists())
+
+    def test_publish_fails_without_fver_line(self):
+        response = self.publish(yrd_data=b"Name=Test\n")
+
+        self.assertEqual(400, response.status_code)
+        self.assertFalse(Map.objects.filter(pk=1001).exists())
+
+
+@override_settings(ROOT_URLCONF="fymserver.async_urls")
+class AsyncMapUpdateAnyFileTests(MapUpdateAnyFileTests):
+    pass
+
+
+@override_settings(ROOT_URLCONF="fymserver.async_urls")
+class AsyncMapDirectUploadTests(MapDirectUploadTests):
+    pass
+
+
+@override_settings(ROOT_URLCONF="fymserver.async_urls")
+class AsyncMapBundleViewTests(MapBundleViewTests):
+    pass
+
+
+@override_settings(ROOT_URLCONF="fymserver.async_urls")
+class AsyncMapPublishViewTests(MapPublishViewTests):
+    pass
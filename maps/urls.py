@@ -1,15 +1,20 @@
 from django.urls import path
 
 from . import views
+from .models import FILE_EXTS
 
 app_name = "maps"
 
 urlpatterns = [
     path("", views.index, name="index"),
+    path("manifest", views.manifest, name="manifest"),
+    path("changes", views.changes, name="changes"),
+    path("bundle", views.bundle, name="bundle"),
     path("<int:pk>/jpg_file", views.jpg_file, name="jpg_file"),
     path("<int:pk>/yrd_file", views.yrd_file, name="yrd_file"),
     path("<int:pk>/his_file", views.his_file, name="his_file"),
     path("<int:pk>/modified_date", views.modified_date, name="modified_date"),
+    path("<int:pk>/publish", views.publish, name="publish"),
     path("<int:pk>/jpg_file/update", views.update_jpg_file, name="update_jpg_file"),
     path("<int:pk>/yrd_file/update", views.update_yrd_file, name="update_yrd_file"),
     path("<int:pk>/his_file/update", views.update_his_file, name="update_his_file"),
@@ -18,4 +23,17 @@ urlpatterns = [
         views.update_modified_date,
         name="update_modified_date",
     ),
+    *(
+        path(
+            f"<int:pk>/{file_ext}_file/{action}",
+            view,
+            {"file_ext": file_ext},
+            name=f"{action}_{file_ext}_upload",
+        )
+        for file_ext in FILE_EXTS
+        for action, view in (
+            ("presign", views.presign_upload),
+            ("complete", views.complete_upload),
+        )
+    ),
 ]
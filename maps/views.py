@@ -1,12 +1,44 @@
-from datetime import datetime
-from typing import cast
-
-from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, JsonResponse
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Dict, List, Tuple
+
+from django.core.files import File
+from django.db import transaction
+from django.http import (
+    HttpRequest,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
 from django.views.decorators.csrf import csrf_exempt
 
-from .models import Map
+from fymserver import direct_uploads
+from fymserver.files import file_digest
+from fymserver.ratelimit import ratelimit
+from fymserver.upload_handlers import (
+    StagedUpload,
+    stage_upload,
+    store_upload,
+    streamed_upload,
+)
+
+from .bundles import bundle_storage, catalogue_bundle_name, stream_bundle
+from .manifest import manifest_snapshot
+from .models import FILE_EXTS, Map
+from .yrd import find_fver, parse_fver_date
+
+CHANGES_DEFAULT_LIMIT = 100
+CHANGES_MAX_LIMIT = 1000
+BUNDLE_MAX_IDS = 1000
+BUNDLE_RETRY_AFTER_SECS = 60
+
+logger = logging.getLogger(__name__)
 
 
 # Create your views here.
@@ -14,21 +46,105 @@ def index(request: HttpRequest) -> JsonResponse:
     return JsonResponse({"maps": [map_obj.id for map_obj in Map.objects.all()]})
 
 
-def _get_map_file(pk: int, file_attr: str) -> HttpResponse:
+def manifest(request: HttpRequest) -> HttpResponse:
+    etag, body = manifest_snapshot()
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    return response
+
+
+def changes(request: HttpRequest) -> HttpResponse:
+    try:
+        since = int(request.GET.get("since", "0"))
+        limit = int(request.GET.get("limit", CHANGES_DEFAULT_LIMIT))
+    except ValueError:
+        return HttpResponseBadRequest("since and limit must be integers")
+
+    if limit < 1:
+        return HttpResponseBadRequest("limit must be positive")
+    limit = min(limit, CHANGES_MAX_LIMIT)
+
+    changed = list(
+        Map.objects.filter(change_seq__gt=since)
+        .order_by("change_seq")
+        .values_list("id", "change_seq")[:limit]
+    )
+    next_cursor = changed[-1][1] if changed else since
+
+    return JsonResponse(
+        {"maps": [map_id for map_id, _ in changed], "next": next_cursor}
+    )
+
+
+def bundle(request: HttpRequest) -> HttpResponse:
+    maps = Map.objects.order_by("id")
+    try:
+        if "ids" in request.GET:
+            ids = [int(map_id) for map_id in request.GET["ids"].split(",")]
+            if len(ids) > BUNDLE_MAX_IDS:
+                return HttpResponseBadRequest(
+                    f"At most {BUNDLE_MAX_IDS} ids may be requested"
+                )
+            maps = maps.filter(id__in=ids)
+        elif "start" in request.GET or "end" in request.GET:
+            # Both ends are inclusive; a missing one is BUNDLE_MAX_IDS from the other
+            if "start" in request.GET:
+                start = int(request.GET["start"])
+                end = int(request.GET.get("end", start + BUNDLE_MAX_IDS - 1))
+            else:
+                end = int(request.GET["end"])
+                start = end - BUNDLE_MAX_IDS + 1
+            if end < start or end - start >= BUNDLE_MAX_IDS:
+                return HttpResponseBadRequest(
+                    f"Ranges must span 1 to {BUNDLE_MAX_IDS} ids"
+                )
+            maps = maps.filter(id__gte=start, id__lte=end)
+        else:
+            # The full catalogue is only served prebuilt, by build_map_bundle
+            storage = bundle_storage()
+            name = catalogue_bundle_name()
+            if not storage.exists(name):
+                response = HttpResponse("Map bundle is being rebuilt", status=503)
+                response["Retry-After"] = str(BUNDLE_RETRY_AFTER_SECS)
+                return response
+            return redirect(storage.url(name))
+    except ValueError:
+        return HttpResponseBadRequest("Map ids must be integers")
+
+    response = StreamingHttpResponse(
+        stream_bundle(maps.iterator()), content_type="application/zip"
+    )
+    response["Content-Disposition"] = 'attachment; filename="maps.zip"'
+    return response
+
+
+def _get_map_file(request: HttpRequest, pk: int, file_ext: str) -> HttpResponse:
     map_obj = get_object_or_404(Map, pk=pk)
-    return redirect(getattr(map_obj, file_attr).url)
+
+    sha256 = getattr(map_obj, f"{file_ext}_sha256")
+    etag = f'"{sha256}"' if sha256 else None
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = redirect(getattr(map_obj, f"{file_ext}_file").url)
+    if etag:
+        response["ETag"] = etag
+    return response
 
 
 def jpg_file(request: HttpRequest, pk: int) -> HttpResponse:
-    return _get_map_file(pk, "jpg_file")
+    return _get_map_file(request, pk, "jpg")
 
 
 def yrd_file(request: HttpRequest, pk: int) -> HttpResponse:
-    return _get_map_file(pk, "yrd_file")
+    return _get_map_file(request, pk, "yrd")
 
 
 def his_file(request: HttpRequest, pk: int) -> HttpResponse:
-    return _get_map_file(pk, "his_file")
+    return _get_map_file(request, pk, "his")
 
 
 def modified_date(request: HttpRequest, pk: int) -> JsonResponse:
@@ -37,6 +153,7 @@ def modified_date(request: HttpRequest, pk: int) -> JsonResponse:
 
 
 @csrf_exempt
+@ratelimit("maps:update")
 def update_modified_date(request: HttpRequest, pk: int) -> HttpResponse:
     if "modified_date" not in request.POST:
         return HttpResponseBadRequest("modified_date parameter missing")
@@ -48,18 +165,8 @@ def update_modified_date(request: HttpRequest, pk: int) -> HttpResponse:
     except ValueError:
         return HttpResponseBadRequest("Malformed modified_date, must be YYYY-MM-DD")
 
-    if Map.objects.filter(pk=pk).exists():
-        map_obj = cast(Map, Map.objects.get(pk=pk))
-        map_obj.modified_date = modified_date
-    else:
-        map_obj = cast(
-            Map,
-            Map.objects.create(
-                id=pk,
-                modified_date=modified_date,
-            ),
-        )
-
+    map_obj = _get_or_new_map(pk)
+    map_obj.modified_date = modified_date
     map_obj.save()
 
     return HttpResponse()
@@ -73,18 +180,28 @@ def update_file(request: HttpRequest, pk: int, file_attr: str, file_ext: str):
 
     file_obj = request.FILES[list(request.FILES.keys())[0]]
 
-    if Map.objects.filter(pk=pk).exists():
-        map_obj = cast(Map, Map.objects.get(pk=pk))
-    else:
-        map_obj = cast(
-            Map,
-            Map.objects.create(
-                id=pk,
-                modified_date=timezone.now(),
-            ),
-        )
+    return _store_map_file(pk, file_attr, file_ext, file_obj)
+
 
-    getattr(map_obj, file_attr).save(f"{pk}.{file_ext}", file_obj)
+def _get_or_new_map(pk: int) -> Map:
+    """The map, or a new one left for the caller to save along with its file."""
+    map_obj = Map.objects.filter(pk=pk).first()
+    if map_obj is None:
+        map_obj = Map(id=pk, modified_date=timezone.now().date())
+    return map_obj
+
+
+def _store_map_file(
+    pk: int, file_attr: str, file_ext: str, file_obj: File
+) -> HttpResponse:
+    map_obj = _get_or_new_map(pk)
+
+    size, sha256 = file_digest(file_obj)
+    if map_obj.file_matches(file_ext, size, sha256):
+        return HttpResponse()
+
+    map_obj.set_file_digest(file_ext, size, sha256)
+    store_upload(getattr(map_obj, file_attr), f"{pk}.{file_ext}", file_obj)
 
     map_obj.save()
 
@@ -92,15 +209,211 @@ def update_file(request: HttpRequest, pk: int, file_attr: str, file_ext: str):
 
 
 @csrf_exempt
+@ratelimit("maps:update")
+@streamed_upload(Map._meta.get_field("jpg_file"))
 def update_jpg_file(request: HttpRequest, pk: int) -> HttpResponse:
     return update_file(request, pk, "jpg_file", "jpg")
 
 
 @csrf_exempt
+@ratelimit("maps:update")
+@streamed_upload(Map._meta.get_field("yrd_file"))
 def update_yrd_file(request: HttpRequest, pk: int) -> HttpResponse:
     return update_file(request, pk, "yrd_file", "yrd")
 
 
 @csrf_exempt
+@ratelimit("maps:update")
+@streamed_upload(Map._meta.get_field("his_file"))
 def update_his_file(request: HttpRequest, pk: int) -> HttpResponse:
     return update_file(request, pk, "his_file", "his")
+
+
+@csrf_exempt
+@ratelimit("maps:update")
+def presign_upload(request: HttpRequest, pk: int, file_ext: str) -> HttpResponse:
+    storage = Map._meta.get_field(f"{file_ext}_file").storage
+    try:
+        size, sha256 = direct_uploads.parse_upload_params(request)
+        upload = direct_uploads.presign_upload(storage, size, sha256)
+    except direct_uploads.DirectUploadError as e:
+        return HttpResponseBadRequest(str(e))
+
+    return JsonResponse(upload)
+
+
+@csrf_exempt
+@ratelimit("maps:update")
+def complete_upload(request: HttpRequest, pk: int, file_ext: str) -> HttpResponse:
+    return _complete_upload(request, pk, file_ext)
+
+
+def _complete_upload(request: HttpRequest, pk: int, file_ext: str) -> HttpResponse:
+    storage = Map._meta.get_field(f"{file_ext}_file").storage
+    try:
+        size, sha256 = direct_uploads.parse_upload_params(request)
+        staged = direct_uploads.complete_upload(
+            storage, request.POST.get("upload", ""), f"{pk}.{file_ext}", size, sha256
+        )
+    except direct_uploads.DirectUploadError as e:
+        return HttpResponseBadRequest(str(e))
+
+    try:
+        return _store_map_file(pk, f"{file_ext}_file", file_ext, staged)
+    finally:
+        if not staged.committed:
+            staged.discard()
+
+
+@csrf_exempt
+@ratelimit("maps:update")
+@streamed_upload(Map._meta.get_field("jpg_file"))
+def publish(request: HttpRequest, pk: int) -> HttpResponse:
+    return _publish(request, pk)
+
+
+def _publish(request: HttpRequest, pk: int) -> HttpResponse:
+    missing = [ext for ext in FILE_EXTS if f"{ext}_file" not in request.FILES]
+    if missing:
+        return HttpResponseBadRequest(
+            "Missing file attachments: "
+            + ", ".join(f"{file_ext}_file" for file_ext in missing)
+        )
+
+    files = {file_ext: request.FILES[f"{file_ext}_file"] for file_ext in FILE_EXTS}
+
+    try:
+        modified_date = _read_fver_date(files["yrd"])
+    except ValueError:
+        return HttpResponseBadRequest("yrd_file must have a Fver=MM/DD/YYYY line")
+
+    map_obj = Map.objects.filter(pk=pk).first() or Map(id=pk)
+
+    digests = {file_ext: file_digest(file_obj) for file_ext, file_obj in files.items()}
+    changed = [
+        file_ext
+        for file_ext in FILE_EXTS
+        if not map_obj.file_matches(file_ext, *digests[file_ext])
+    ]
+
+    if not changed and map_obj.modified_date == modified_date:
+        return HttpResponse()
+
+    staged = _stage_files(files, digests, changed)
+    try:
+        published = _publish_files(pk, staged)
+    finally:
+        _discard_uncommitted(staged)
+
+    try:
+        replaced = _save_published_map(pk, modified_date, digests, published)
+    except BaseException:
+        _delete_files(published)
+        raise
+    _delete_files(replaced)
+
+    return HttpResponse()
+
+
+def _read_fver_date(yrd_file: File) -> date:
+    date_str = find_fver(line.decode("utf-8", "replace") for line in yrd_file)
+    return parse_fver_date(date_str)
+
+
+def _stage_files(
+    files: Dict[str, File], digests: Dict[str, Tuple[int, str]], changed: List[str]
+) -> Dict[str, StagedUpload]:
+    """Upload the changed files to staging names, discarding them all if any fails."""
+
+    def stage(file_ext: str) -> StagedUpload:
+        storage = Map._meta.get_field(f"{file_ext}_file").storage
+        return stage_upload(storage, files[file_ext], digests[file_ext][1])
+
+    with ThreadPoolExecutor(max_workers=len(FILE_EXTS)) as executor:
+        futures = {file_ext: executor.submit(stage, file_ext) for file_ext in changed}
+
+    staged = {
+        file_ext: future.result()
+        for file_ext, future in futures.items()
+        if future.exception() is None
+    }
+    for future in futures.values():
+        error = future.exception()
+        if error is not None:
+            _discard_uncommitted(staged)
+            raise error
+    return staged
+
+
+def _discard_uncommitted(staged: Dict[str, StagedUpload]) -> None:
+    for upload in staged.values():
+        if not upload.committed:
+            upload.discard()
+
+
+def _published_name(map_id: int, file_ext: str) -> str:
+    # A new key for every publish, under which clients still see {id}.{ext}
+    return f"{map_id}/{uuid.uuid4().hex}/{map_id}.{file_ext}"
+
+
+def _publish_files(map_id: int, staged: Dict[str, StagedUpload]) -> Dict[str, str]:
+    """Copy the staged files to new names, deleting them all if any copy fails.
+
+    The files the map's row refers to are left untouched until it is switched
+    over to the returned names.
+    """
+
+    def publish(file_ext: str) -> str:
+        return staged[file_ext].commit(_published_name(map_id, file_ext))
+
+    with ThreadPoolExecutor(max_workers=len(FILE_EXTS)) as executor:
+        futures = {file_ext: executor.submit(publish, file_ext) for file_ext in staged}
+
+    published = {
+        file_ext: future.result()
+        for file_ext, future in futures.items()
+        if future.exception() is None
+    }
+    for future in futures.values():
+        error = future.exception()
+        if error is not None:
+            _delete_files(published)
+            raise error
+    return published
+
+
+def _delete_files(names: Dict[str, str]) -> None:
+    for file_ext, name in names.items():
+        try:
+            Map._meta.get_field(f"{file_ext}_file").storage.delete(name)
+        except Exception:
+            # Left behind, but nothing refers to it
+            logger.exception("Failed to delete map file %s", name)
+
+
+def _save_published_map(
+    map_id: int,
+    modified_date: date,
+    digests: Dict[str, Tuple[int, str]],
+    published: Dict[str, str],
+) -> Dict[str, str]:
+    """Switch the map over to its published files, returning the names replaced.
+
+    Only the database is written here, so the transaction, and with it the
+    change sequence lock, is held for no longer than a few queries.
+    """
+    with transaction.atomic():
+        map_obj = Map.objects.select_for_update().filter(pk=map_id).first()
+        if map_obj is None:
+            map_obj = Map(id=map_id)
+
+        replaced = {}
+        for file_ext, name in published.items():
+            field_file = getattr(map_obj, f"{file_ext}_file")
+            if field_file.name and field_file.name != name:
+                replaced[file_ext] = field_file.name
+            field_file.name = name
+            map_obj.set_file_digest(file_ext, *digests[file_ext])
+        map_obj.modified_date = modified_date
+        map_obj.save()
+    return replaced
@@ -0,0 +1,20 @@
+from datetime import date, datetime
+from typing import Iterable
+
+
+class FverError(ValueError):
+    pass
+
+
+def find_fver(lines: Iterable[str]) -> str:
+    """Return the raw value of a yrd file's Fver line."""
+    for line in lines:
+        line = line.lower()
+        if line.startswith("fver="):
+            return line.split("=")[1].strip()
+
+    raise FverError("Could not find Fver line")
+
+
+def parse_fver_date(date_str: str) -> date:
+    return datetime.strptime(date_str, r"%m/%d/%Y").date()
@@ -0,0 +1,46 @@
+"""Which endpoint the code running now is serving, for labelling metrics."""
+import contextvars
+from typing import Optional
+
+UNKNOWN_ENDPOINT = "-"
+
+
+class RequestInfo:
+    __slots__ = ("endpoint",)
+
+    def __init__(self) -> None:
+        self.endpoint = UNKNOWN_ENDPOINT
+
+
+_current: contextvars.ContextVar[Optional[RequestInfo]] = contextvars.ContextVar(
+    "monitoring_request", default=None
+)
+
+
+def start_request() -> contextvars.Token:
+    # A mutable holder, so threads handed a copy of this context by
+    # sync_to_async or run_blocking see the endpoint once the URL resolves
+    return _current.set(RequestInfo())
+
+
+def current_request() -> Optional[RequestInfo]:
+    return _current.get()
+
+
+def resume_request(info: Optional[RequestInfo]) -> contextvars.Token:
+    return _current.set(info)
+
+
+def end_request(token: contextvars.Token) -> None:
+    _current.reset(token)
+
+
+def set_endpoint(endpoint: str) -> None:
+    info = _current.get()
+    if info is not None:
+        info.endpoint = endpoint
+
+
+def current_endpoint() -> str:
+    info = _current.get()
+    return UNKNOWN_ENDPOINT if info is None else info.endpoint
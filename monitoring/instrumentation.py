@@ -0,0 +1,83 @@
+"""Timing of database queries and storage backend calls, per endpoint, and
+as spans of the current trace."""
+import time
+from functools import wraps
+
+from .context import current_endpoint
+from .metrics import DB_QUERIES, DB_QUERY_SECONDS, STORAGE_CALL_SECONDS, STORAGE_CALLS
+from .tracing import SQL_MAX_LENGTH, span
+
+
+def record_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        endpoint = current_endpoint()
+        DB_QUERIES.inc(endpoint)
+        DB_QUERY_SECONDS.inc(endpoint, amount=time.perf_counter() - started)
+
+
+def trace_query(execute, sql, params, many, context):
+    with span("db.query", sql=sql[:SQL_MAX_LENGTH], many=many):
+        return execute(sql, params, many, context)
+
+
+def instrument_connection(sender, connection, **kwargs) -> None:
+    """``connection_created`` receiver adding the wrappers to new connections."""
+    for wrapper in (record_query, trace_query):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
+
+
+def _timed(operation: str):
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                name = args[0] if args else kwargs.get("name")
+                with span(f"storage.{operation}", name=name):
+                    return method(self, *args, **kwargs)
+            finally:
+                endpoint = current_endpoint()
+                STORAGE_CALLS.inc(endpoint, operation)
+                STORAGE_CALL_SECONDS.inc(
+                    endpoint, operation, amount=time.perf_counter() - started
+                )
+
+        return wrapper
+
+    return decorator
+
+
+class InstrumentedStorageMixin:
+    """Counts and times the storage calls views make, per endpoint.
+
+    Must come before the mixins whose time it should include, such as
+    ``CachedUrlMixin`` for ``url``.
+    """
+
+    @_timed("save")
+    def save(self, *args, **kwargs):
+        return super().save(*args, **kwargs)
+
+    @_timed("open")
+    def open(self, *args, **kwargs):
+        return super().open(*args, **kwargs)
+
+    @_timed("url")
+    def url(self, *args, **kwargs):
+        return super().url(*args, **kwargs)
+
+    @_timed("exists")
+    def exists(self, *args, **kwargs):
+        return super().exists(*args, **kwargs)
+
+    @_timed("delete")
+    def delete(self, *args, **kwargs):
+        return super().delete(*args, **kwargs)
+
+    @_timed("size")
+    def size(self, *args, **kwargs):
+        return super().size(*args, **kwargs)
@@ -0,0 +1,79 @@
+import pstats
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from monitoring.profiling import ProfileStore
+
+SORT_KEYS = {"tottime": 2, "cumtime": 3}
+
+
+def hot_functions(stats: pstats.Stats, top: int, sort: str) -> List[str]:
+    """Format the ``top`` functions of ``stats`` by ``sort`` time."""
+    index = SORT_KEYS[sort]
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][index], reverse=True)
+    lines = []
+    for (filename, line, function), (_, calls, tottime, cumtime, _) in rows[:top]:
+        lines.append(
+            f"  {tottime * 1000:10.1f} {cumtime * 1000:10.1f} {calls:8}  "
+            f"{function} ({filename}:{line})"
+        )
+    return lines
+
+
+def profile_report(
+    directory: str, top: int, sort: str, endpoint: Optional[str] = None
+) -> List[str]:
+    """Merge the stored profiles by endpoint, listing each one's hot functions."""
+    paths: Dict[str, List[str]] = defaultdict(list)
+    summaries: Dict[str, List[dict]] = defaultdict(list)
+    for path, summary in ProfileStore(directory, 0).profiles():
+        if endpoint is None or summary["endpoint"] == endpoint:
+            paths[summary["endpoint"]].append(str(path))
+            summaries[summary["endpoint"]].append(summary)
+
+    lines = []
+    for name in sorted(paths):
+        durations = [summary["duration"] for summary in summaries[name]]
+        peaks = [
+            summary["peak_memory"]
+            for summary in summaries[name]
+            if summary["peak_memory"] is not None
+        ]
+        header = (
+            f"{name}: {len(durations)} profiles, "
+            f"mean {sum(durations) / len(durations) * 1000:.1f} ms, "
+            f"max {max(durations) * 1000:.1f} ms"
+        )
+        if peaks:
+            header += f", peak memory {max(peaks) / (1024 * 1024):.1f} MB"
+        lines.append(header)
+        lines.append(f"  {'tottime ms':>10} {'cumtime ms':>10} {'calls':>8}  function")
+        lines.extend(hot_functions(pstats.Stats(*paths[name]), top, sort))
+        lines.append("")
+    return lines
+
+
+class Command(BaseCommand):
+    help = "Reports the hottest functions per endpoint in the stored profiles"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default=settings.PROFILING_DIR)
+        parser.add_argument(
+            "--top", type=int, default=20, help="Functions listed per endpoint"
+        )
+        parser.add_argument("--sort", choices=sorted(SORT_KEYS), default="tottime")
+        parser.add_argument("--endpoint", help="Only report this URL name")
+
+    def handle(self, *args, **options):
+        if options["top"] < 1:
+            raise CommandError("--top must be positive")
+
+        lines = profile_report(
+            options["dir"], options["top"], options["sort"], options["endpoint"]
+        )
+        if not lines:
+            raise CommandError(f"No profiles found in {options['dir']}")
+        self.stdout.write("\n".join(lines))
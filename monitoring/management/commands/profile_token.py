@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from monitoring.profiling import PROFILE_HEADER, profile_token
+
+
+class Command(BaseCommand):
+    help = "Prints a header that makes ProfilingMiddleware profile a request"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{PROFILE_HEADER}: {profile_token()}")
+        self.stderr.write(
+            f"Valid for {settings.PROFILING_TOKEN_MAX_AGE} seconds on servers "
+            "with PROFILING_ENABLED=TRUE"
+        )
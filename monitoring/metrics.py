@@ -0,0 +1,366 @@
+"""In-process metrics, rendered in the Prometheus text exposition format.
+
+Each process keeps its own counts; updates take one short lock, so they are
+cheap enough to record on every request. With ``METRICS_DIR`` set, each
+process also writes its counts to a file there every few seconds, and a
+scrape of any process adds up the files of all of them.
+"""
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+# Values of every metric by name, then by label values, as kept by one process
+State = Dict[str, Dict[LabelValues, Any]]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def state(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def add_state(self, state: Dict[LabelValues, float]) -> None:
+        with self._lock:
+            self.combine(self._values, state)
+
+    @staticmethod
+    def combine(
+        into: Dict[LabelValues, float], state: Dict[LabelValues, float]
+    ) -> None:
+        for labels, value in state.items():
+            into[labels] = into.get(labels, 0) + value
+
+    @staticmethod
+    def load_value(value) -> float:
+        return float(value)
+
+    def samples(self, state: Dict[LabelValues, float]) -> Iterator[str]:
+        for labels, value in sorted(state.items()):
+            yield (
+                f"{self.name}{_format_labels(self.label_names, labels)} "
+                f"{_format_value(value)}"
+            )
+
+
+class Gauge(Counter):
+    """A value read from ``function`` when sampled, added up over processes.
+
+    An exited process's last value is not taken over by its successor, since
+    it no longer holds.
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def state(self) -> Dict[LabelValues, float]:
+        return {(): self.function()}
+
+    def add_state(self, state: Dict[LabelValues, float]) -> None:
+        pass
+
+
+class Histogram:
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # Per label values: count in each bucket (the last being +Inf), and sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(
+                labels, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[index] += 1
+            total[0] += value
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            counts, _ = self._values.get(labels, ([0], [0.0]))
+            return sum(counts)
+
+    def state(self) -> Dict[LabelValues, Tuple[List[int], float]]:
+        with self._lock:
+            return {
+                labels: (list(counts), total[0])
+                for labels, (counts, total) in self._values.items()
+            }
+
+    def add_state(self, state: Dict[LabelValues, Tuple[List[int], float]]) -> None:
+        with self._lock:
+            for labels, (counts, total) in state.items():
+                own_counts, own_total = self._values.setdefault(
+                    labels, ([0] * (len(self.buckets) + 1), [0.0])
+                )
+                for index, count in enumerate(counts[: len(own_counts)]):
+                    own_counts[index] += count
+                own_total[0] += total
+
+    @staticmethod
+    def combine(
+        into: Dict[LabelValues, Tuple[List[int], float]],
+        state: Dict[LabelValues, Tuple[List[int], float]],
+    ) -> None:
+        for labels, (counts, total) in state.items():
+            if labels not in into:
+                into[labels] = (list(counts), total)
+                continue
+            own_counts, own_total = into[labels]
+            into[labels] = (
+                [own + other for own, other in zip(own_counts, counts)],
+                own_total + total,
+            )
+
+    @staticmethod
+    def load_value(value) -> Tuple[List[int], float]:
+        counts, total = value
+        return [int(count) for count in counts], float(total)
+
+    def samples(
+        self, state: Dict[LabelValues, Tuple[List[int], float]]
+    ) -> Iterator[str]:
+        names = self.label_names + ("le",)
+        for labels, (counts, total) in sorted(state.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                yield (
+                    f"{self.name}_bucket{_format_labels(names, labels + (le,))} "
+                    f"{cumulative}"
+                )
+            label_str = _format_labels(self.label_names, labels)
+            yield f"{self.name}_sum{label_str} {_format_value(total)}"
+            yield f"{self.name}_count{label_str} {cumulative}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, function: Callable[[], float]):
+        return self.register(Gauge(name, documentation, function))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def metrics(self) -> List[Any]:
+        with self._lock:
+            return sorted(self._metrics.values(), key=lambda metric: metric.name)
+
+    def state(self) -> State:
+        return {metric.name: metric.state() for metric in self.metrics()}
+
+    def render(self, others: Sequence[State] = ()) -> str:
+        """Render every metric, added up with the ``others`` states of other
+        processes."""
+        lines = []
+        for metric in self.metrics():
+            state = metric.state()
+            for other in others:
+                metric.combine(state, other.get(metric.name, {}))
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.samples(state))
+        return "\n".join(lines) + "\n"
+
+
+class SharedStore:
+    """Directory where each process writes its registry's state, by pid.
+
+    A process writes its file every ``interval`` seconds from a background
+    thread, and reads every other file when scraped. A file left by an exited
+    process is taken over by the next process to get its pid, which adds its
+    counts to its own, so counters never go backwards.
+    """
+
+    def __init__(self, registry: Registry, directory: str, interval: float) -> None:
+        self.registry = registry
+        self.directory = Path(directory)
+        self.interval = interval
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Path:
+        return self.directory / f"{os.getpid()}.json"
+
+    def start(self) -> None:
+        """Start writing this process's state, unless already started.
+
+        Cheap enough to call on every request, which a forking server needs:
+        threads started before the fork do not run in the worker processes.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            left = self.read(self.path)
+            if left is not None:
+                for metric in self.registry.metrics():
+                    metric.add_state(left.get(metric.name, {}))
+            threading.Thread(
+                target=self._run, name="metrics-writer", daemon=True
+            ).start()
+
+    def write(self) -> None:
+        data = {
+            name: [[list(labels), value] for labels, value in values.items()]
+            for name, values in self.registry.state().items()
+        }
+        # Written aside and renamed, so readers never see part of a file
+        temporary = self.path.with_suffix(".tmp")
+        with open(temporary, "w") as f:
+            json.dump(data, f)
+        os.replace(temporary, self.path)
+
+    def read(self, path: Path) -> Optional[State]:
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning("Ignoring unreadable metrics file %s", path)
+            return None
+
+        metrics = {metric.name: metric for metric in self.registry.metrics()}
+        return {
+            name: {
+                tuple(labels): metrics[name].load_value(value)
+                for labels, value in values
+            }
+            for name, values in data.items()
+            if name in metrics
+        }
+
+    def others(self) -> List[State]:
+        """The last written state of every other process."""
+        own = self.path
+        states = []
+        for path in sorted(self.directory.glob("*.json")):
+            if path != own:
+                state = self.read(path)
+                if state is not None:
+                    states.append(state)
+        return states
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except Exception:
+                logger.exception("Failed to write metrics to %s", self.directory)
+
+
+registry = Registry()
+
+
+@lru_cache(maxsize=None)
+def get_shared_store() -> Optional[SharedStore]:
+    if not settings.METRICS_DIR:
+        return None
+    return SharedStore(registry, settings.METRICS_DIR, settings.METRICS_WRITE_INTERVAL)
+
+
+REQUEST_SECONDS = registry.histogram(
+    "fym_request_seconds", "Request latency", ["endpoint", "method"]
+)
+REQUESTS = registry.counter(
+    "fym_requests_total", "Requests handled", ["endpoint", "method", "status"]
+)
+RESPONSE_BYTES = registry.counter(
+    "fym_response_bytes_total", "Response body bytes sent", ["endpoint"]
+)
+DB_QUERIES = registry.counter(
+    "fym_db_queries_total", "Database queries executed", ["endpoint"]
+)
+DB_QUERY_SECONDS = registry.counter(
+    "fym_db_query_seconds_total", "Time spent in database queries", ["endpoint"]
+)
+STORAGE_CALLS = registry.counter(
+    "fym_storage_calls_total", "Storage backend calls", ["endpoint", "operation"]
+)
+STORAGE_CALL_SECONDS = registry.counter(
+    "fym_storage_call_seconds_total",
+    "Time spent in storage backend calls",
+    ["endpoint", "operation"],
+)
@@ -0,0 +1,282 @@
+import asyncio
+import cProfile
+import random
+import threading
+import time
+import tracemalloc
+from typing import Optional
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpRequest, HttpResponse
+
+from . import context, tracing
+from .metrics import REQUEST_SECONDS, REQUESTS, RESPONSE_BYTES, get_shared_store
+from .profiling import PROFILE_HEADER_META, ProfileStore, valid_profile_token
+
+_tracemalloc_lock = threading.Lock()
+
+
+class MetricsMiddleware:
+    """Records latency, status and response size for each request by URL name.
+
+    Latency is measured to the start of the response; the bytes of streaming
+    responses are counted as they are sent. Each worker process starts sharing
+    its counts with ``METRICS_DIR`` on its first request.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Mark the instance as a coroutine function, as MiddlewareMixin
+            # does, so the handler awaits it without a thread hop
+            markcoroutinefunction(self)
+            # Likewise process_view, which Django would otherwise run in a thread
+            self.process_view = self.process_view_async
+
+    def __call__(self, request: HttpRequest):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        token = context.start_request()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            self.record(request, response, started)
+        finally:
+            context.end_request(token)
+        return response
+
+    async def __acall__(self, request: HttpRequest):
+        token = context.start_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+            self.record(request, response, started)
+        finally:
+            context.end_request(token)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        context.set_endpoint(request.resolver_match.view_name)
+
+    async def process_view_async(self, request, view_func, view_args, view_kwargs):
+        context.set_endpoint(request.resolver_match.view_name)
+
+    def record(self, request: HttpRequest, response: HttpResponse, started) -> None:
+        store = get_shared_store()
+        if store is not None:
+            store.start()
+
+        endpoint = context.current_endpoint()
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started, endpoint, request.method or ""
+        )
+        REQUESTS.inc(endpoint, request.method or "", str(response.status_code))
+
+        if response.streaming:
+            response.streaming_content = self.count_streamed(
+                response.streaming_content, context.current_request(), endpoint
+            )
+        else:
+            RESPONSE_BYTES.inc(endpoint, amount=len(response.content))
+
+    def count_streamed(self, content, info, endpoint: str):
+        sent = 0
+        iterator = iter(content)
+        try:
+            while True:
+                # Put the request back in context while producing each chunk,
+                # so any queries this makes are labelled with its endpoint
+                token = context.resume_request(info)
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    context.end_request(token)
+                sent += len(chunk)
+                yield chunk
+        finally:
+            RESPONSE_BYTES.inc(endpoint, amount=sent)
+
+
+class TracingMiddleware:
+    """Records a trace of each request, see ``monitoring.tracing``.
+
+    The root span covers the whole request, with a ``view`` span from URL
+    resolution until the view's response comes back. The trace of a streaming
+    response stays open until its content has been sent, as MetricsMiddleware
+    counts its bytes, so the queries made while streaming are traced too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.TRACING_ENABLED:
+            raise MiddlewareNotUsed()
+
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # As MetricsMiddleware
+            markcoroutinefunction(self)
+            self.process_view = self.process_view_async
+
+    def __call__(self, request: HttpRequest):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        recorded, tokens = tracing.begin_trace("request", method=request.method)
+        if recorded is None:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+            self.finish(request, response, recorded)
+        except BaseException:
+            recorded.error = True
+            tracing.end_trace(recorded)
+            raise
+        finally:
+            tracing.leave_trace(tokens)
+        return self.end(response, recorded)
+
+    async def __acall__(self, request: HttpRequest):
+        recorded, tokens = tracing.begin_trace("request", method=request.method)
+        if recorded is None:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+            self.finish(request, response, recorded)
+        except BaseException:
+            recorded.error = True
+            tracing.end_trace(recorded)
+            raise
+        finally:
+            tracing.leave_trace(tokens)
+        return self.end(response, recorded)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        endpoint = request.resolver_match.view_name
+        request.tracing_view_span = tracing.begin_span("view", endpoint=endpoint)
+
+    async def process_view_async(self, request, view_func, view_args, view_kwargs):
+        self.process_view(request, view_func, view_args, view_kwargs)
+
+    def finish(self, request: HttpRequest, response: HttpResponse, recorded) -> None:
+        if hasattr(request, "tracing_view_span"):
+            tracing.end_span(*request.tracing_view_span)
+        root = recorded.root
+        root.attributes["endpoint"] = getattr(
+            request.resolver_match, "view_name", context.UNKNOWN_ENDPOINT
+        )
+        root.attributes["status"] = response.status_code
+        if response.status_code >= 500:
+            recorded.error = True
+
+    def end(self, response: HttpResponse, recorded) -> HttpResponse:
+        if response.streaming:
+            response.streaming_content = self.trace_streamed(
+                response.streaming_content, recorded
+            )
+        else:
+            tracing.end_trace(recorded)
+        return response
+
+    def trace_streamed(self, content, recorded):
+        iterator = iter(content)
+        try:
+            while True:
+                # Make the trace current again while producing each chunk, so
+                # any queries this makes are spans of the request
+                tokens = tracing.resume_trace(recorded)
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                except BaseException:
+                    recorded.error = True
+                    raise
+                finally:
+                    tracing.leave_trace(tokens)
+                yield chunk
+        finally:
+            tracing.end_trace(recorded)
+
+
+class ProfilingMiddleware:
+    """Profiles a sample of requests, see ``monitoring.profiling``.
+
+    ``cProfile`` only follows the thread it was started in, so requests are
+    profiled under WSGI only; under ASGI the event loop interleaves requests
+    and this middleware removes itself.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        if asyncio.iscoroutinefunction(get_response):
+            raise MiddlewareNotUsed("Requests can only be profiled under WSGI")
+
+        self.get_response = get_response
+        self.store = ProfileStore(settings.PROFILING_DIR, settings.PROFILING_MAX_FILES)
+        self.memory_views = set(settings.PROFILING_MEMORY_VIEWS)
+
+    def __call__(self, request: HttpRequest):
+        token = request.META.get(PROFILE_HEADER_META)
+        forced = bool(token) and valid_profile_token(
+            token, settings.PROFILING_TOKEN_MAX_AGE
+        )
+        if not forced and random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        request.profiling_memory = False
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            response = profile.runcall(self.get_response, request)
+        finally:
+            peak_memory = self.stop_tracing(request)
+        duration = time.perf_counter() - started
+
+        self.store.save(
+            profile,
+            {
+                "endpoint": getattr(
+                    request.resolver_match, "view_name", context.UNKNOWN_ENDPOINT
+                ),
+                "method": request.method,
+                "status": response.status_code,
+                "duration": duration,
+                "peak_memory": peak_memory,
+                "forced": forced,
+                "time": time.time(),
+            },
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Only one request at a time can trace memory, as tracemalloc is global
+        if (
+            hasattr(request, "profiling_memory")
+            and request.resolver_match.view_name in self.memory_views
+            and not tracemalloc.is_tracing()
+            and _tracemalloc_lock.acquire(blocking=False)
+        ):
+            tracemalloc.start()
+            request.profiling_memory = True
+
+    def stop_tracing(self, request: HttpRequest) -> Optional[int]:
+        if not getattr(request, "profiling_memory", False):
+            return None
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        _tracemalloc_lock.release()
+        return peak
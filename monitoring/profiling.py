@@ -0,0 +1,74 @@
+"""Profiles of sampled production requests, kept in a rotating directory.
+
+Each profiled request writes a ``cProfile`` dump and a JSON summary next to
+it; the ``profile_report`` command merges them into a report per endpoint.
+A request is profiled when sampled at ``PROFILING_SAMPLE_RATE``, or when it
+carries a ``PROFILE_HEADER`` made by ``profile_token``.
+"""
+import json
+import os
+import re
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, Tuple
+
+from django.core import signing
+
+PROFILE_HEADER = "X-FYM-Profile"
+PROFILE_HEADER_META = "HTTP_X_FYM_PROFILE"
+SIGNING_SALT = "monitoring.profiling"
+PROFILE_SUFFIX = ".prof"
+SUMMARY_SUFFIX = ".json"
+
+
+def profile_token() -> str:
+    """A value for ``PROFILE_HEADER`` that forces profiling until it expires."""
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign("profile")
+
+
+def valid_profile_token(value: str, max_age: int) -> bool:
+    try:
+        signing.TimestampSigner(salt=SIGNING_SALT).unsign(value, max_age=max_age)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+class ProfileStore:
+    """Directory of the newest ``max_profiles`` profiles, oldest removed first."""
+
+    def __init__(self, directory: str, max_profiles: int) -> None:
+        self.directory = Path(directory)
+        self.max_profiles = max_profiles
+
+    def save(self, profile, summary: Dict[str, Any]) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        endpoint = re.sub(r"[^\w.-]", "_", summary["endpoint"])
+        # Named by time first, so sorting the names sorts the profiles by age
+        stem = f"{time.time_ns()}-{endpoint}-{uuid.uuid4().hex[:8]}"
+        path = self.directory / (stem + PROFILE_SUFFIX)
+        profile.dump_stats(path)
+        with open(path.with_suffix(SUMMARY_SUFFIX), "w") as f:
+            json.dump(summary, f)
+        self.rotate()
+        return path
+
+    def rotate(self) -> None:
+        paths = sorted(self.directory.glob("*" + PROFILE_SUFFIX))
+        for path in paths[: max(len(paths) - self.max_profiles, 0)]:
+            for stale in (path, path.with_suffix(SUMMARY_SUFFIX)):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    # Another worker process rotated it first
+                    pass
+
+    def profiles(self) -> Iterator[Tuple[Path, Dict[str, Any]]]:
+        """(profile path, summary) for each stored profile, oldest first."""
+        for path in sorted(self.directory.glob("*" + PROFILE_SUFFIX)):
+            try:
+                with open(path.with_suffix(SUMMARY_SUFFIX)) as f:
+                    yield path, json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
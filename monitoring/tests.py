@@ -0,0 +1,554 @@
+import asyncio
+import json
+import tempfile
+import tracemalloc
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.mail import EmailMessage
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from override_storage import override_storage
+
+from fymserver.asynchronous import run_blocking
+from fymserver.mail_queue import MailQueue
+from players.models import Player
+
+from . import context
+from .instrumentation import InstrumentedStorageMixin
+from .metrics import (
+    DB_QUERIES,
+    REQUEST_SECONDS,
+    REQUESTS,
+    RESPONSE_BYTES,
+    STORAGE_CALLS,
+    Registry,
+    SharedStore,
+)
+from .middleware import MetricsMiddleware, ProfilingMiddleware
+from .profiling import PROFILE_HEADER_META, ProfileStore, profile_token
+from .tracing import JsonLinesExporter, get_exporter, span, trace
+
+
+class TestRegistry(SimpleTestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_renders_counters(self):
+        counter = self.registry.counter("requests_total", "Requests", ["endpoint"])
+        counter.inc("maps:index")
+        counter.inc("maps:index", amount=2)
+
+        self.assertIn('requests_total{endpoint="maps:index"} 3', self.registry.render())
+
+    def test_renders_cumulative_histogram_buckets(self):
+        histogram = self.registry.histogram(
+            "latency_seconds", "Latency", ["endpoint"], buckets=(0.1, 1)
+        )
+        histogram.observe(0.05, "x")
+        histogram.observe(0.5, "x")
+        histogram.observe(5, "x")
+
+        rendered = self.registry.render()
+        self.assertIn('latency_seconds_bucket{endpoint="x",le="0.1"} 1', rendered)
+        self.assertIn('latency_seconds_bucket{endpoint="x",le="1"} 2', rendered)
+        self.assertIn('latency_seconds_bucket{endpoint="x",le="+Inf"} 3', rendered)
+        self.assertIn('latency_seconds_count{endpoint="x"} 3', rendered)
+        self.assertIn('latency_seconds_sum{endpoint="x"} 5.55', rendered)
+
+    def test_renders_gauges(self):
+        self.registry.gauge("depth", "Depth", lambda: 7)
+
+        self.assertIn("# TYPE depth gauge\ndepth 7", self.registry.render())
+
+    def test_escapes_label_values(self):
+        counter = self.registry.counter("total", "Total", ["endpoint"])
+        counter.inc('a"b')
+
+        self.assertIn('total{endpoint="a\\"b"} 1', self.registry.render())
+
+
+class TestSharedStore(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def make_store(self):
+        registry = Registry()
+        registry.counter("requests_total", "Requests", ["endpoint"])
+        registry.histogram("latency_seconds", "Latency", ["endpoint"], buckets=(1,))
+        return SharedStore(registry, self.directory, interval=60)
+
+    def record(self, store, pid, latency):
+        with mock.patch("monitoring.metrics.os.getpid", return_value=pid):
+            store.start()
+            # Registering an existing name returns the metric already there
+            store.registry.counter("requests_total", "Requests").inc("x")
+            store.registry.histogram("latency_seconds", "Latency").observe(latency, "x")
+            store.write()
+
+    def test_adds_up_other_processes(self):
+        worker, scraped = self.make_store(), self.make_store()
+        self.record(worker, 1, 0.5)
+        self.record(scraped, 2, 5)
+
+        with mock.patch("monitoring.metrics.os.getpid", return_value=2):
+            rendered = scraped.registry.render(others=scraped.others())
+
+        self.assertIn('requests_total{endpoint="x"} 2', rendered)
+        self.assertIn('latency_seconds_bucket{endpoint="x",le="1"} 1', rendered)
+        self.assertIn('latency_seconds_bucket{endpoint="x",le="+Inf"} 2', rendered)
+        self.assertIn('latency_seconds_sum{endpoint="x"} 5.5', rendered)
+
+    def test_takes_over_counts_of_exited_process(self):
+        self.record(self.make_store(), 1, 0.5)
+        replacement = self.make_store()
+        self.record(replacement, 1, 0.5)
+
+        self.assertIn('requests_total{endpoint="x"} 2', replacement.registry.render())
+        with mock.patch("monitoring.metrics.os.getpid", return_value=2):
+            self.assertEqual(1, len(replacement.others()))
+
+    def test_adds_up_gauges_without_taking_them_over(self):
+        exited = self.make_store()
+        exited.registry.gauge("depth", "Depth", lambda: 3)
+        self.record(exited, 1, 0.5)
+        replacement = self.make_store()
+        replacement.registry.gauge("depth", "Depth", lambda: 4)
+        self.record(replacement, 1, 0.5)
+        scraped = self.make_store()
+        scraped.registry.gauge("depth", "Depth", lambda: 5)
+
+        with mock.patch("monitoring.metrics.os.getpid", return_value=2):
+            rendered = scraped.registry.render(others=scraped.others())
+
+        self.assertIn("depth 9", rendered)
+
+
+class FakeStorage:
+    def exists(self, name):
+        return True
+
+    def url(self, name):
+        return f"/{name}"
+
+
+class InstrumentedFakeStorage(InstrumentedStorageMixin, FakeStorage):
+    pass
+
+
+class TestInstrumentedStorageMixin(SimpleTestCase):
+    def test_counts_calls_per_endpoint(self):
+        storage = InstrumentedFakeStorage()
+        before = STORAGE_CALLS.value("test:storage", "url")
+
+        token = context.start_request()
+        try:
+            context.set_endpoint("test:storage")
+            self.assertEqual("/1001.jpg", storage.url("1001.jpg"))
+        finally:
+            context.end_request(token)
+
+        self.assertEqual(before + 1, STORAGE_CALLS.value("test:storage", "url"))
+
+    def test_run_blocking_keeps_endpoint(self):
+        async def endpoint_in_pool():
+            token = context.start_request()
+            try:
+                context.set_endpoint("test:pool")
+                return await run_blocking(context.current_endpoint)
+            finally:
+                context.end_request(token)
+
+        self.assertEqual("test:pool", asyncio.run(endpoint_in_pool()))
+
+
+TOKEN = "abc123"
+
+
+def get_login():
+    return {"player": "Player1", "token": TOKEN}
+
+
+@override_storage()
+class MetricsMiddlewareTests(TestCase):
+    def setUp(self):
+        Player.objects.create(username="Player1", token=TOKEN)
+
+    def test_records_request_by_url_name(self):
+        requests = REQUESTS.value("trains:index", "POST", "200")
+        observed = REQUEST_SECONDS.count("trains:index", "POST")
+        sent = RESPONSE_BYTES.value("trains:index")
+
+        response = self.client.post(reverse("trains:index"), data=get_login())
+
+        self.assertEqual(requests + 1, REQUESTS.value("trains:index", "POST", "200"))
+        self.assertEqual(observed + 1, REQUEST_SECONDS.count("trains:index", "POST"))
+        self.assertEqual(
+            sent + len(response.content),
+            RESPONSE_BYTES.value("trains:index"),
+        )
+
+    def test_counts_queries_by_url_name(self):
+        queries = DB_QUERIES.value("trains:index")
+
+        self.client.post(reverse("trains:index"), data=get_login())
+
+        self.assertGreater(DB_QUERIES.value("trains:index"), queries)
+
+    def test_counts_streamed_bytes_as_sent(self):
+        def get_response(request):
+            middleware.process_view(request, None, (), {})
+            return StreamingHttpResponse(iter([b"123", b"45"]))
+
+        middleware = MetricsMiddleware(get_response)
+        request = RequestFactory().get("/")
+        request.resolver_match = SimpleNamespace(view_name="test:streamed")
+
+        response = middleware(request)
+        self.assertEqual(0, RESPONSE_BYTES.value("test:streamed"))
+        b"".join(response.streaming_content)
+
+        self.assertEqual(5, RESPONSE_BYTES.value("test:streamed"))
+
+    def test_unresolved_urls_are_unlabelled(self):
+        requests = REQUESTS.value("-", "GET", "404")
+
+        self.client.get("/fymserver/no-such-page")
+
+        self.assertEqual(requests + 1, REQUESTS.value("-", "GET", "404"))
+
+
+class AsyncMetricsMiddlewareTests(SimpleTestCase):
+    def test_records_async_request_by_url_name(self):
+        async def view(request):
+            return HttpResponse(b"12345")
+
+        async def get_response(request):
+            await middleware.process_view(request, view, (), {})
+            return await view(request)
+
+        middleware = MetricsMiddleware(get_response)
+        request = RequestFactory().get("/")
+        request.resolver_match = SimpleNamespace(view_name="test:async")
+
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        asyncio.run(middleware(request))
+
+        self.assertEqual(1, REQUESTS.value("test:async", "GET", "200"))
+        self.assertEqual(5, RESPONSE_BYTES.value("test:async"))
+
+
+class MetricsViewTests(SimpleTestCase):
+    def test_serves_prometheus_text(self):
+        response = self.client.get(reverse("monitoring:metrics"))
+
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertIn(b"# TYPE fym_request_seconds histogram", response.content)
+        self.assertIn(b"fym_mail_queue_depth 0", response.content)
+
+    @override_settings(METRICS_ALLOWED_IPS=["10.0.0.1"])
+    def test_refuses_other_addresses(self):
+        response = self.client.get(reverse("monitoring:metrics"))
+
+        self.assertEqual(403, response.status_code)
+
+
+def busy_view(request):
+    data = [bytes(1024) for _ in range(1024)]
+    return HttpResponse(str(len(data)))
+
+
+class ProfilingMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.directory = tmpdir.name
+        settings = override_settings(
+            PROFILING_ENABLED=True,
+            PROFILING_SAMPLE_RATE=0.0,
+            PROFILING_DIR=self.directory,
+            PROFILING_MAX_FILES=3,
+            PROFILING_MEMORY_VIEWS=["test:upload"],
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def request(self, view_name="test:view", **headers):
+        def get_response(request):
+            middleware.process_view(request, busy_view, (), {})
+            return busy_view(request)
+
+        middleware = ProfilingMiddleware(get_response)
+        request = RequestFactory().get("/", **headers)
+        request.resolver_match = SimpleNamespace(view_name=view_name)
+        return middleware(request)
+
+    def summaries(self):
+        return [summary for _, summary in ProfileStore(self.directory, 0).profiles()]
+
+    def test_not_used_unless_enabled(self):
+        with override_settings(PROFILING_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(busy_view)
+
+    def test_not_used_under_asgi(self):
+        async def get_response(request):
+            pass
+
+        with self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(get_response)
+
+    def test_profiles_sampled_requests(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1.0):
+            self.request()
+
+        [summary] = self.summaries()
+        self.assertEqual("test:view", summary["endpoint"])
+        self.assertEqual(200, summary["status"])
+        self.assertIsNone(summary["peak_memory"])
+        self.assertFalse(summary["forced"])
+
+    def test_unsampled_requests_are_not_profiled(self):
+        self.request()
+
+        self.assertEqual([], self.summaries())
+
+    def test_signed_header_forces_profiling(self):
+        self.request(**{PROFILE_HEADER_META: profile_token()})
+
+        [summary] = self.summaries()
+        self.assertTrue(summary["forced"])
+
+    def test_ignores_forged_header(self):
+        self.request(**{PROFILE_HEADER_META: "profile:forged:signature"})
+
+        self.assertEqual([], self.summaries())
+
+    def test_records_peak_memory_for_memory_views(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1.0):
+            self.request("test:upload")
+
+        [summary] = self.summaries()
+        self.assertGreater(summary["peak_memory"], 1024 * 1024)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_keeps_newest_profiles(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1.0):
+            for n in range(5):
+                self.request(f"test:view{n}")
+
+        self.assertEqual(
+            ["test:view2", "test:view3", "test:view4"],
+            [summary["endpoint"] for summary in self.summaries()],
+        )
+        self.assertEqual(6, len(list(Path(self.directory).iterdir())))
+
+    def test_report_lists_hot_functions_per_endpoint(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1.0):
+            self.request("test:view")
+            self.request("test:view")
+
+        out = StringIO()
+        call_command(
+            "profile_report", dir=self.directory, sort="cumtime", top=5, stdout=out
+        )
+
+        self.assertIn("test:view: 2 profiles", out.getvalue())
+        self.assertIn("busy_view", out.getvalue())
+
+
+class MemoryExporter:
+    traces = []
+
+    def export(self, exported):
+        self.traces.append(exported)
+
+
+@override_settings(
+    TRACING_ENABLED=True,
+    TRACING_SLOW_SECS=0.0,
+    TRACING_SAMPLE_RATE=0.0,
+    TRACING_EXPORTER="monitoring.tests.MemoryExporter",
+)
+class TracingTests(SimpleTestCase):
+    def setUp(self):
+        MemoryExporter.traces = []
+        get_exporter.cache_clear()
+        self.addCleanup(get_exporter.cache_clear)
+
+    def spans(self, exported):
+        return {recorded["name"]: recorded for recorded in exported["spans"]}
+
+    def test_nests_spans(self):
+        with trace("job"):
+            with span("outer"):
+                with span("inner", size=3):
+                    pass
+
+        [exported] = MemoryExporter.traces
+        spans = self.spans(exported)
+        self.assertIsNone(spans["job"]["parent_id"])
+        self.assertEqual(spans["job"]["span_id"], spans["outer"]["parent_id"])
+        self.assertEqual(spans["outer"]["span_id"], spans["inner"]["parent_id"])
+        self.assertEqual({"size": 3}, spans["inner"]["attributes"])
+
+    def test_spans_outside_traces_are_ignored(self):
+        with span("orphan") as orphan:
+            self.assertIsNone(orphan)
+
+        self.assertEqual([], MemoryExporter.traces)
+
+    @override_settings(TRACING_SLOW_SECS=60.0)
+    def test_drops_fast_traces(self):
+        with trace("job"):
+            pass
+
+        self.assertEqual([], MemoryExporter.traces)
+
+    @override_settings(TRACING_SLOW_SECS=60.0)
+    def test_keeps_failed_traces(self):
+        with self.assertRaises(ValueError):
+            with trace("job"):
+                with span("step"):
+                    raise ValueError()
+
+        [exported] = MemoryExporter.traces
+        self.assertTrue(self.spans(exported)["step"]["attributes"]["error"])
+        self.assertTrue(self.spans(exported)["job"]["attributes"]["error"])
+
+    @override_settings(TRACING_MAX_SPANS=2)
+    def test_limits_spans_per_trace(self):
+        with trace("job"):
+            for _ in range(3):
+                with span("step"):
+                    pass
+
+        [exported] = MemoryExporter.traces
+        self.assertEqual(2, len(exported["spans"]))
+        self.assertEqual(2, exported["dropped_spans"])
+
+    def test_traces_storage_calls(self):
+        with trace("job"):
+            InstrumentedFakeStorage().exists("1001.jpg")
+
+        [exported] = MemoryExporter.traces
+        self.assertEqual(
+            {"name": "1001.jpg"}, self.spans(exported)["storage.exists"]["attributes"]
+        )
+
+    def test_run_blocking_keeps_parent_span(self):
+        def blocking_step():
+            with span("blocking"):
+                pass
+
+        async def job():
+            with trace("job"):
+                await run_blocking(blocking_step)
+
+        asyncio.run(job())
+
+        [exported] = MemoryExporter.traces
+        self.assertEqual(
+            self.spans(exported)["job"]["span_id"],
+            self.spans(exported)["blocking"]["parent_id"],
+        )
+
+    def test_traces_mail_sends(self):
+        queue = MailQueue(connection_factory=EmailBackend)
+        queue.enqueue(EmailMessage("Subject", "body", "from@localhost", ["to@x"]))
+        queue.join()
+
+        [exported] = MemoryExporter.traces
+        self.assertEqual(
+            {"recipients": 1}, self.spans(exported)["mail.send"]["attributes"]
+        )
+        self.assertIn("mail.attempt", self.spans(exported))
+
+
+@override_storage()
+@override_settings(
+    TRACING_ENABLED=True,
+    TRACING_SLOW_SECS=0.0,
+    TRACING_EXPORTER="monitoring.tests.MemoryExporter",
+)
+class TracingMiddlewareTests(TestCase):
+    def setUp(self):
+        Player.objects.create(username="Player1", token=TOKEN)
+        MemoryExporter.traces = []
+        get_exporter.cache_clear()
+        self.addCleanup(get_exporter.cache_clear)
+
+    def test_traces_view_and_queries(self):
+        self.client.post(reverse("trains:index"), data=get_login())
+
+        [exported] = MemoryExporter.traces
+        request, view = exported["spans"][-1], exported["spans"][-2]
+        self.assertEqual("request", request["name"])
+        self.assertEqual(
+            {"method": "POST", "endpoint": "trains:index", "status": 200},
+            request["attributes"],
+        )
+        self.assertEqual("view", view["name"])
+        self.assertEqual(request["span_id"], view["parent_id"])
+        queries = [
+            recorded for recorded in exported["spans"] if recorded["name"] == "db.query"
+        ]
+        self.assertTrue(queries)
+        self.assertTrue(all(query["parent_id"] == view["span_id"] for query in queries))
+
+    def test_traces_queries_made_while_streaming(self):
+        response = self.client.post(
+            reverse("trains:index"), data={**get_login(), "stream": 1}
+        )
+        self.assertEqual([], MemoryExporter.traces)
+
+        b"".join(response.streaming_content)
+
+        [exported] = MemoryExporter.traces
+        request = exported["spans"][-1]
+        self.assertEqual("request", request["name"])
+        self.assertIn(
+            request["span_id"],
+            [
+                recorded["parent_id"]
+                for recorded in exported["spans"]
+                if recorded["name"] == "db.query"
+            ],
+        )
+
+
+class JsonLinesExporterTests(SimpleTestCase):
+    def test_appends_one_line_per_trace(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "traces.jsonl"
+            exporter = JsonLinesExporter(str(path))
+            exporter.export({"trace_id": "a", "spans": []})
+            exporter.export({"trace_id": "b", "spans": []})
+            exporter.join()
+
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+
+        self.assertEqual(["a", "b"], [line["trace_id"] for line in lines])
+
+    def test_rotates_full_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "traces.jsonl"
+            exporter = JsonLinesExporter(str(path), max_bytes=1, backups=2)
+            exporter.write([{"trace_id": trace_id} for trace_id in "abcd"])
+
+            self.assertEqual(
+                ["traces.jsonl", "traces.jsonl.1", "traces.jsonl.2"],
+                sorted(child.name for child in Path(tmpdir).iterdir()),
+            )
+            self.assertEqual('{"trace_id": "d"}\n', path.read_text())
+            self.assertIn('"c"', Path(f"{path}.1").read_text())
@@ -0,0 +1,345 @@
+"""Request traces made of timed spans, sampled once each trace completes.
+
+A trace starts with each request (or background job, such as sending mail)
+and collects spans for the view, database queries, storage calls and mail.
+When it ends, it is kept if it was slow or failed, or else with probability
+``TRACING_SAMPLE_RATE``, and kept traces are handed to ``TRACING_EXPORTER``
+to write from a background thread.
+"""
+import abc
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+SQL_MAX_LENGTH = 500
+EXPORT_BATCH_SIZE = 100
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "span_id",
+        "parent_id",
+        "start",
+        "duration",
+        "attributes",
+        "_started",
+    )
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes) -> None:
+        self.name = name
+        self.span_id = _new_id()
+        self.parent_id = parent_id
+        self.attributes: Dict[str, Any] = attributes
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self._started = time.perf_counter()
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self._started
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    def __init__(self, max_spans: int) -> None:
+        self.trace_id = uuid.uuid4().hex
+        self.root: Optional[Span] = None
+        self.max_spans = max_spans
+        self.spans: List[Span] = []
+        self.dropped_spans = 0
+        self.error = False
+        # Spans finish in threads from sync_to_async and run_blocking too
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            if len(self.spans) < self.max_spans:
+                self.spans.append(span)
+            else:
+                self.dropped_spans += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+        return {
+            "trace_id": self.trace_id,
+            "dropped_spans": self.dropped_spans,
+            "spans": spans,
+        }
+
+
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar(
+    "tracing_trace", default=None
+)
+_parent: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "tracing_parent", default=None
+)
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+def begin_span(name: str, /, **attributes) -> Tuple[Optional[Span], Any]:
+    """Start a child of the current span, if a trace is being recorded.
+
+    Pass the returned pair to ``end_span``; use ``span`` where a ``with``
+    block fits.
+    """
+    if _trace.get() is None:
+        return None, None
+    new_span = Span(name, _parent.get(), attributes)
+    return new_span, _parent.set(new_span.span_id)
+
+
+def end_span(new_span: Optional[Span], token, error: bool = False) -> None:
+    if new_span is None:
+        return
+    _parent.reset(token)
+    new_span.finish()
+    if error:
+        new_span.attributes["error"] = True
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(new_span)
+
+
+@contextlib.contextmanager
+def span(name: str, /, **attributes) -> Iterator[Optional[Span]]:
+    """Time the block as a span of the current trace, if there is one."""
+    if _trace.get() is None:
+        yield None
+        return
+
+    new_span, token = begin_span(name, **attributes)
+    error = False
+    try:
+        yield new_span
+    except BaseException:
+        error = True
+        raise
+    finally:
+        end_span(new_span, token, error)
+
+
+@contextlib.contextmanager
+def trace(name: str, /, **attributes) -> Iterator[Optional[Span]]:
+    """Record a new trace rooted at a span covering the block.
+
+    Yields the root span, or None when tracing is disabled. Set
+    ``trace.error`` to keep the trace whatever its duration.
+    """
+    new_trace, tokens = begin_trace(name, **attributes)
+    if new_trace is None:
+        yield None
+        return
+
+    try:
+        yield new_trace.root
+    except BaseException:
+        new_trace.error = True
+        raise
+    finally:
+        leave_trace(tokens)
+        end_trace(new_trace)
+
+
+def begin_trace(name: str, /, **attributes) -> Tuple[Optional[Trace], Any]:
+    """Start recording a new trace, if tracing is enabled, and make it current.
+
+    For traces that outlive the block that starts them, where ``trace`` does
+    not fit: ``leave_trace`` with the returned tokens, ``resume_trace`` to
+    make it current again, and ``end_trace`` once it is done.
+    """
+    if not settings.TRACING_ENABLED:
+        return None, None
+    new_trace = Trace(settings.TRACING_MAX_SPANS)
+    new_trace.root = Span(name, None, attributes)
+    return new_trace, resume_trace(new_trace)
+
+
+def resume_trace(recorded: Trace) -> Tuple[Any, Any]:
+    return _trace.set(recorded), _parent.set(recorded.root.span_id)
+
+
+def leave_trace(tokens: Tuple[Any, Any]) -> None:
+    trace_token, parent_token = tokens
+    _parent.reset(parent_token)
+    _trace.reset(trace_token)
+
+
+def end_trace(recorded: Trace) -> None:
+    """Finish the root span, and export the trace if it is kept."""
+    root = recorded.root
+    root.finish()
+    if recorded.error:
+        root.attributes["error"] = True
+    recorded.add(root)
+    if should_keep(recorded, root):
+        get_exporter().export(recorded.to_dict())
+
+
+def should_keep(recorded: Trace, root: Span) -> bool:
+    """Tail-based sampling: keep every slow or failed trace and a sample of others."""
+    return (
+        recorded.error
+        or root.duration >= settings.TRACING_SLOW_SECS
+        or random.random() < settings.TRACING_SAMPLE_RATE
+    )
+
+
+class QueuedExporter(abc.ABC):
+    """Writes traces from a background thread, dropping them if it falls behind.
+
+    Subclasses implement ``write``.
+    """
+
+    def __init__(self, maxsize: int = 1000) -> None:
+        self.queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize)
+        self.dropped = 0
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, exported: Dict[str, Any]) -> None:
+        self._ensure_worker()
+        try:
+            self.queue.put_nowait(exported)
+        except queue.Full:
+            self.dropped += 1
+
+    def join(self) -> None:
+        self.queue.join()
+
+    @abc.abstractmethod
+    def write(self, traces: List[Dict[str, Any]]) -> None:
+        """Write a batch of traces, from the exporter's thread."""
+
+    def _ensure_worker(self) -> None:
+        # Started lazily so a forking server starts it in each worker process
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="trace-exporter", daemon=True
+                )
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            traces = [self.queue.get()]
+            while len(traces) < EXPORT_BATCH_SIZE:
+                try:
+                    traces.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self.write(traces)
+            except Exception:
+                logger.exception("Failed to export %d traces", len(traces))
+            finally:
+                for _ in traces:
+                    self.queue.task_done()
+
+
+class JsonLinesExporter(QueuedExporter):
+    """Appends each trace as a line of JSON to ``TRACING_FILE``.
+
+    Once the file reaches ``TRACING_FILE_MAX_BYTES`` it is renamed with the
+    suffix ``.1``, older files moving up to ``.2`` and so on, and only the
+    newest ``TRACING_FILE_BACKUPS`` are kept.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+        backups: Optional[int] = None,
+    ) -> None:
+        super().__init__(settings.TRACING_QUEUE_SIZE)
+        self.path = path or settings.TRACING_FILE
+        self.max_bytes = max_bytes or settings.TRACING_FILE_MAX_BYTES
+        self.backups = settings.TRACING_FILE_BACKUPS if backups is None else backups
+
+    def write(self, traces: List[Dict[str, Any]]) -> None:
+        f = open(self.path, "a")
+        try:
+            for exported in traces:
+                if f.tell() >= self.max_bytes:
+                    self.rotate(f)
+                    f.close()
+                    f = open(self.path, "a")
+                # One write per line, so processes sharing the file do not
+                # interleave within a trace
+                f.write(json.dumps(exported, default=str) + "\n")
+                f.flush()
+        finally:
+            f.close()
+
+    def rotate(self, f) -> None:
+        try:
+            if os.stat(self.path).st_ino != os.fstat(f.fileno()).st_ino:
+                # Another process sharing the file rotated it first
+                return
+        except FileNotFoundError:
+            return
+        for n in range(self.backups - 1, 0, -1):
+            try:
+                os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+            except FileNotFoundError:
+                pass
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+class CollectorExporter(QueuedExporter):
+    """POSTs batches of traces, as JSON lines, to ``TRACING_COLLECTOR_URL``."""
+
+    def __init__(self, url: Optional[str] = None) -> None:
+        super().__init__(settings.TRACING_QUEUE_SIZE)
+        self.url = url or settings.TRACING_COLLECTOR_URL
+
+    def write(self, traces: List[Dict[str, Any]]) -> None:
+        body = "".join(json.dumps(exported, default=str) + "\n" for exported in traces)
+        request = urllib.request.Request(
+            self.url,
+            data=body.encode(),
+            headers={"Content-Type": "application/x-ndjson"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=5):
+            pass
+
+
+@lru_cache(maxsize=None)
+def get_exporter() -> QueuedExporter:
+    return import_string(settings.TRACING_EXPORTER)()
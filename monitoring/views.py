@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpRequest, HttpResponse
+from django.views.decorators.http import require_GET
+
+# Registers the mail queue metrics
+import fymserver.mail_queue  # noqa: F401
+
+from .metrics import get_shared_store, registry
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@require_GET
+def metrics(request: HttpRequest) -> HttpResponse:
+    """Metrics in the Prometheus text format, added up over every process
+    sharing ``METRICS_DIR``, or else this process's alone."""
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+        raise PermissionDenied()
+
+    store = get_shared_store()
+    others = store.others() if store is not None else []
+    return HttpResponse(registry.render(others), content_type=CONTENT_TYPE)
@@ -0,0 +1,14 @@
+from fymserver.asynchronous import with_async_views
+
+from . import async_views, views
+from .urls import urlpatterns as sync_urlpatterns
+
+app_name = "players"
+
+urlpatterns = with_async_views(
+    sync_urlpatterns,
+    {
+        views.send_auth_code: async_views.send_auth_code,
+        views.check_auth_code: async_views.check_auth_code,
+    },
+)
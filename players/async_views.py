@@ -0,0 +1,25 @@
+"""Async versions of the player views, served by ``fymserver.asgi``.
+
+Each runs the same code as the sync view with ``sync_to_async``, in the
+thread Django keeps for the request; mail is queued, not sent, so neither
+waits on SMTP.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpRequest, HttpResponse
+
+from fymserver.asynchronous import async_csrf_exempt
+from fymserver.ratelimit import ratelimit
+
+from . import views
+
+
+@async_csrf_exempt
+@ratelimit("players:send_auth_code")
+async def send_auth_code(request: HttpRequest) -> HttpResponse:
+    return await sync_to_async(views._send_auth_code)(request)
+
+
+@async_csrf_exempt
+@ratelimit("players:check_auth_code")
+async def check_auth_code(request: HttpRequest) -> HttpResponse:
+    return await sync_to_async(views._check_auth_code)(request)
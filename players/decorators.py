@@ -1,29 +1,80 @@
-from typing import cast
+import asyncio
+import hmac
+from functools import wraps
+from typing import Tuple
 
+from asgiref.sync import sync_to_async
 from django.core.exceptions import BadRequest, PermissionDenied
+from django.db import router
 from django.http import HttpRequest
 
 from .models import Player
+from .tokens import cache_token, cached_token, hash_token
 
+PLAYER_HEADER = "X-FYM-Player"
+TOKEN_HEADER = "X-FYM-Token"
 
-def valid_player_required(func):
-    def wrapper(request: HttpRequest, *args, **kwargs):
-        player: str = request.POST.get("player", "")
-        token: str = request.POST.get("token", "")
 
-        if not player:
-            raise BadRequest("No player specified")
+def authenticate(player: str, token: str) -> Player:
+    if not player:
+        raise BadRequest("No player specified")
+
+    if not token:
+        raise BadRequest("No token specified")
+
+    token_hash = hash_token(token)
+    cached = cached_token(player)
+    if cached is not None and hmac.compare_digest(cached[1], token_hash):
+        # A fresh instance per request. As with Player.objects.only(), the
+        # other fields are deferred and each loads from the database when
+        # first read
+        return Player.from_db(
+            router.db_for_read(Player),
+            ["id", "username", "token"],
+            [cached[0], player, token_hash],
+        )
+
+    player_obj = Player.objects.filter(username=player).first()
+    if player_obj is None or not player_obj.validate_token_hash(token_hash):
+        raise PermissionDenied()
+
+    # Only cache the stored spelling: a case-insensitive collation also matches
+    # others, whose entries saving the player would not invalidate
+    if player_obj.username == player:
+        cache_token(player, player_obj.pk, token_hash)
+    return player_obj
+
 
-        if not token:
-            raise BadRequest("No token specified")
+def credentials(request: HttpRequest) -> Tuple[str, str]:
+    """Read the player and token from the request headers, or else the POST data.
 
-        if not Player.objects.filter(username=player).exists():
-            raise PermissionDenied()
+    Upload clients send the headers so that they can be checked before the
+    body is read.
+    """
+    player = request.headers.get(PLAYER_HEADER)
+    token = request.headers.get(TOKEN_HEADER)
+    if player is None and token is None:
+        return request.POST.get("player", ""), request.POST.get("token", "")
+    return player or "", token or ""
 
-        player_obj = cast(Player, Player.objects.get(username=player))
 
-        if not player_obj.validate_token(token):
-            raise PermissionDenied()
+def authenticate_request(request: HttpRequest) -> Player:
+    return authenticate(*credentials(request))
+
+
+def valid_player_required(func):
+    """Authenticate the request's player/token, setting ``request.player``."""
+    if asyncio.iscoroutinefunction(func):
+
+        @wraps(func)
+        async def async_wrapper(request: HttpRequest, *args, **kwargs):
+            request.player = await sync_to_async(authenticate_request)(request)
+            return await func(request, *args, **kwargs)
+
+        return async_wrapper
+
+    def wrapper(request: HttpRequest, *args, **kwargs):
+        request.player = authenticate_request(request)
 
         return func(request, *args, **kwargs)
 
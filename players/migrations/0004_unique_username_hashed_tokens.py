@@ -0,0 +1,48 @@
+# Generated by Django 4.0.10 on 2026-10-18 09:52
+
+from django.db import migrations, models
+from django.db.models import Count
+
+from players.tokens import hash_token, is_hashed
+
+
+def check_unique_usernames(apps, schema_editor):
+    # Which duplicate to keep is for an admin to decide, as trains and
+    # downloads may refer to either player
+    Player = apps.get_model("players", "Player")
+    duplicates = list(
+        Player.objects.values_list("username", flat=True)
+        .annotate(players=Count("id"))
+        .filter(players__gt=1)
+        .order_by("username")
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Usernames must be unique before migrating; rename or delete the "
+            f"duplicate players named: {', '.join(duplicates)}"
+        )
+
+
+def hash_tokens(apps, schema_editor):
+    Player = apps.get_model("players", "Player")
+    for player in Player.objects.only("token").iterator():
+        if not is_hashed(player.token):
+            player.token = hash_token(player.token)
+            player.save(update_fields=["token"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("players", "0003_player_email"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_unique_usernames, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="player",
+            name="username",
+            field=models.CharField(max_length=40, unique=True),
+        ),
+        migrations.RunPython(hash_tokens, migrations.RunPython.noop),
+    ]
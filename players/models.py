@@ -1,9 +1,12 @@
+import hmac
 import random
 import string
 import uuid
 
 from django.db import models
 
+from .tokens import hash_token, invalidate_tokens, is_hashed
+
 
 def generate_token() -> str:
     return "".join(
@@ -14,12 +17,42 @@ def generate_token() -> str:
 # Create your models here.
 class Player(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    username = models.CharField(max_length=40)
+    username = models.CharField(max_length=40, unique=True)
     email = models.CharField(max_length=200)
+    # Only the hash of the token is stored, see players.tokens
     token = models.CharField(max_length=128, default=generate_token)
 
     def __str__(self):
         return f"Player ({self.username})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        player_obj = super().from_db(db, field_names, values)
+        player_obj._saved_username = player_obj.__dict__.get("username")
+        return player_obj
+
+    def save(self, *args, **kwargs):
+        if not is_hashed(self.token):
+            self.token = hash_token(self.token)
+        super().save(*args, **kwargs)
+        # A renamed player's token is cached under the old name too
+        saved_username = getattr(self, "_saved_username", None)
+        invalidate_tokens(self.username, *filter(None, [saved_username]))
+        self._saved_username = self.username
+
+    def delete(self, *args, **kwargs):
+        invalidate_tokens(self.username)
+        return super().delete(*args, **kwargs)
+
     def validate_token(self, token: str) -> bool:
-        return token == self.token
+        return self.validate_token_hash(hash_token(token))
+
+    def validate_token_hash(self, token_hash: str) -> bool:
+        return hmac.compare_digest(token_hash, self.token)
+
+    def rotate_token(self) -> str:
+        """Replace the token with a new one, returning it unhashed."""
+        token = generate_token()
+        self.token = hash_token(token)
+        self.save(update_fields=["token"])
+        return token
@@ -0,0 +1,63 @@
+"""Verification of emailed one-time codes.
+
+The codes accepted within ``OTP_DRIFT_RANGE`` steps of now are computed once
+per key and time step and shared through the cache, so checking a code is a
+set lookup. Each player gets a limited number of attempts per
+``OTP_ATTEMPT_WINDOW_SECS``, counted before any hashing is done, and a code
+that has been accepted once is refused until it can no longer be valid.
+"""
+import hashlib
+import time
+from typing import FrozenSet, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django_otp.oath import hotp
+
+
+class OtpThrottled(Exception):
+    pass
+
+
+def otp_window(
+    key: str, step: int, timestamp: int, drift_range: int, now: Optional[float] = None
+) -> FrozenSet[int]:
+    """The codes for ``key`` accepted during the current time step."""
+    counter = (int(time.time() if now is None else now) - timestamp) // step
+    key_digest = hashlib.sha256(key.encode()).hexdigest()
+    cache_key = f"players:otp:window:{key_digest}:{step}:{drift_range}:{counter}"
+
+    window = cache.get(cache_key)
+    if window is None:
+        window = frozenset(
+            hotp(key.encode(), counter + drift)
+            for drift in range(-drift_range, drift_range + 1)
+        )
+        cache.set(cache_key, window, step)
+    return window
+
+
+def count_attempt(player_id) -> None:
+    """Record an attempt by ``player_id``, raising ``OtpThrottled`` over the limit."""
+    cache_key = f"players:otp:attempts:{player_id}"
+    cache.add(cache_key, 0, settings.OTP_ATTEMPT_WINDOW_SECS)
+    try:
+        attempts = cache.incr(cache_key)
+    except ValueError:
+        # Expired between add() and incr()
+        cache.set(cache_key, 1, settings.OTP_ATTEMPT_WINDOW_SECS)
+        attempts = 1
+
+    if attempts > settings.OTP_MAX_ATTEMPTS:
+        raise OtpThrottled()
+
+
+def reset_attempts(player_id) -> None:
+    cache.delete(f"players:otp:attempts:{player_id}")
+
+
+def claim_code(player_id, otp: int) -> bool:
+    """Mark ``otp`` used by ``player_id``; False if it already had been."""
+    # A code stays acceptable for drift_range steps either side of its own
+    lifetime = settings.OTP_STEP_SECS * (2 * settings.OTP_DRIFT_RANGE + 1)
+    return cache.add(f"players:otp:used:{player_id}:{otp}", True, lifetime)
@@ -1,13 +1,18 @@
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
+from django.conf import settings
 from django.core import mail
+from django.core.cache import cache
 from django.core.exceptions import BadRequest, PermissionDenied
 from django.http import HttpRequest
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
+from fymserver.mail_queue import mail_queue
 from players.decorators import valid_player_required
-from players.views import generate_otp
+from players.otp import claim_code
+from players.tokens import cached_token, hash_token
+from players.views import generate_otp, validate_otp
 
 from .models import Player
 
@@ -38,8 +43,11 @@ def wrapped_func(request: HttpRequest, message: str = "ok"):
 
 
 class FakeRequest:
-    def __init__(self, post_params: Dict[str, Any]) -> None:
+    def __init__(
+        self, post_params: Dict[str, Any], headers: Optional[Dict[str, str]] = None
+    ) -> None:
         self.POST = post_params
+        self.headers = headers or {}
 
 
 class TestValidPlayerRequired(TestCase):
@@ -124,6 +132,100 @@ class TestValidPlayerRequired(TestCase):
 
         assert expected == actual
 
+    def test_should_set_request_player(self):
+        player_obj = create_default_player()
+
+        request = FakeRequest({"player": OK_USERNAME, "token": OK_TOKEN})
+        wrapped_func(request)
+
+        assert player_obj == request.player
+
+    def test_should_accept_credentials_in_headers(self):
+        player_obj = create_default_player()
+
+        request = FakeRequest(
+            {}, headers={"X-FYM-Player": OK_USERNAME, "X-FYM-Token": OK_TOKEN}
+        )
+        wrapped_func(request)
+
+        assert player_obj == request.player
+
+    def test_should_not_fall_back_to_post_with_header_credentials(self):
+        create_default_player()
+
+        with self.assertRaises(BadRequest):
+            wrapped_func(
+                FakeRequest(
+                    {"player": OK_USERNAME, "token": OK_TOKEN},
+                    headers={"X-FYM-Player": OK_USERNAME},
+                )
+            )
+
+    def test_should_cache_validated_token(self):
+        create_default_player()
+        login = {"player": OK_USERNAME, "token": OK_TOKEN}
+        wrapped_func(FakeRequest(login))
+
+        with self.assertNumQueries(0):
+            wrapped_func(FakeRequest(login))
+
+    def test_should_cache_token_hash_not_player(self):
+        player_obj = create_default_player()
+        login = {"player": OK_USERNAME, "token": OK_TOKEN}
+        first = FakeRequest(login)
+        wrapped_func(first)
+        second = FakeRequest(login)
+        wrapped_func(second)
+
+        assert (player_obj.pk, hash_token(OK_TOKEN)) == cached_token(OK_USERNAME)
+        assert player_obj == second.player
+        assert first.player is not second.player
+
+    def test_should_load_other_fields_of_cached_player(self):
+        player_obj = create_default_player()
+        player_obj.email = "player@example.com"
+        player_obj.save()
+        login = {"player": OK_USERNAME, "token": OK_TOKEN}
+        wrapped_func(FakeRequest(login))
+        request = FakeRequest(login)
+        wrapped_func(request)
+
+        with self.assertNumQueries(1):
+            assert "player@example.com" == request.player.email
+
+    def test_should_raise_for_old_username_after_rename(self):
+        player_obj = create_default_player()
+        wrapped_func(FakeRequest({"player": OK_USERNAME, "token": OK_TOKEN}))
+
+        player_obj.username = "Renamed"
+        player_obj.save()
+
+        with self.assertRaises(PermissionDenied):
+            wrapped_func(FakeRequest({"player": OK_USERNAME, "token": OK_TOKEN}))
+
+    def test_should_raise_after_token_rotation(self):
+        player_obj = create_default_player()
+        wrapped_func(FakeRequest({"player": OK_USERNAME, "token": OK_TOKEN}))
+
+        new_token = player_obj.rotate_token()
+
+        with self.assertRaises(PermissionDenied):
+            wrapped_func(FakeRequest({"player": OK_USERNAME, "token": OK_TOKEN}))
+        assert "ok" == wrapped_func(
+            FakeRequest({"player": OK_USERNAME, "token": new_token})
+        )
+
+
+class TestPlayerToken(TestCase):
+    def test_token_is_stored_hashed(self):
+        player_obj = create_default_player()
+        player_obj.save()
+
+        player_obj.refresh_from_db()
+        assert hash_token(OK_TOKEN) == player_obj.token
+        assert player_obj.validate_token(OK_TOKEN)
+        assert not player_obj.validate_token(BAD_TOKEN)
+
 
 class TestPlayerSendAuthCode(TestCase):
     def setUp(self):
@@ -140,6 +242,7 @@ class TestPlayerSendAuthCode(TestCase):
 
         self.assertEqual(200, response.status_code)
 
+        mail_queue.join()
         self.assertEqual(1, len(mail.outbox))
         self.assertEqual(
             "[Freight Yard Manager] Authentication Code", mail.outbox[0].subject
@@ -151,6 +254,7 @@ class TestPlayerSendAuthCode(TestCase):
 
         self.assertEqual(200, response.status_code)
 
+        mail_queue.join()
         self.assertEqual(0, len(mail.outbox))
 
     def test_does_not_send_email_for_blank_email(self):
@@ -165,6 +269,7 @@ class TestPlayerSendAuthCode(TestCase):
 
         self.assertEqual(200, response.status_code)
 
+        mail_queue.join()
         self.assertEqual(0, len(mail.outbox))
 
 
@@ -179,3 +284,73 @@ class TestGenerateOTP(TestCase):
         actual = generate_otp(key, step, timestamp, drift=drift)
 
         assert expected == actual
+
+
+class TestValidateOTP(TestCase):
+    def test_accepts_codes_within_drift_range(self):
+        key = "secretkey"
+        accepted = [generate_otp(key, 30, 0, drift=drift) for drift in (-2, 0, 2)]
+
+        for otp in accepted:
+            assert validate_otp(key, 30, 0, 2, otp)
+        assert not validate_otp(key, 30, 0, 2, generate_otp(key, 30, 0, drift=3))
+
+    def test_codes_can_only_be_claimed_once(self):
+        assert claim_code("player-id", 123456)
+        assert not claim_code("player-id", 123456)
+        assert claim_code("other-player-id", 123456)
+
+
+class TestPlayerCheckAuthCode(TestCase):
+    def test_returns_new_token_for_valid_code(self):
+        player_obj = create_default_player()
+        otp = generate_otp(
+            settings.SECRET_KEY + player_obj.token, settings.OTP_STEP_SECS, 0
+        )
+
+        response = self.client.post(
+            reverse("players:check_auth_code"),
+            data={"player": OK_USERNAME, "otp": otp},
+        )
+
+        self.assertEqual(200, response.status_code)
+        token = response.json()["token"]
+        player_obj.refresh_from_db()
+        assert player_obj.validate_token(token)
+        assert not player_obj.validate_token(OK_TOKEN)
+
+    @override_settings(OTP_MAX_ATTEMPTS=2)
+    def test_throttles_repeated_attempts(self):
+        create_default_player()
+        url = reverse("players:check_auth_code")
+
+        statuses = [
+            self.client.post(url, data={"player": OK_USERNAME, "otp": "1"}).status_code
+            for _ in range(3)
+        ]
+
+        self.assertEqual([403, 403, 429], statuses)
+
+    @override_settings(
+        RATELIMITS={"players:check_auth_code": {"ip": "2/h"}}, OTP_MAX_ATTEMPTS=5
+    )
+    def test_limits_attempts_from_each_address(self):
+        cache.clear()
+        url = reverse("players:check_auth_code")
+
+        statuses = [
+            self.client.post(url, data={"player": player, "otp": "1"}).status_code
+            for player in ("Player1", "Player2", "Player3")
+        ]
+
+        self.assertEqual(429, statuses[-1])
+
+
+@override_settings(ROOT_URLCONF="fymserver.async_urls")
+class AsyncTestPlayerSendAuthCode(TestPlayerSendAuthCode):
+    pass
+
+
+@override_settings(ROOT_URLCONF="fymserver.async_urls")
+class AsyncTestPlayerCheckAuthCode(TestPlayerCheckAuthCode):
+    pass
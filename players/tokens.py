@@ -0,0 +1,43 @@
+"""Hashing of player tokens and the cache of recently validated ones.
+
+Tokens are 128 random characters, so a single SHA-256 is enough to make a
+leaked table useless without slowing every authenticated request down.
+
+Validated tokens are cached in the shared Django cache, keyed by username, so
+that saving a player invalidates them for every worker at once.
+"""
+import hashlib
+from typing import Any, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+TOKEN_HASH_PREFIX = "sha256$"
+
+
+def hash_token(token: str) -> str:
+    return TOKEN_HASH_PREFIX + hashlib.sha256(token.encode()).hexdigest()
+
+
+def is_hashed(token: str) -> bool:
+    return token.startswith(TOKEN_HASH_PREFIX)
+
+
+def _cache_key(username: str) -> str:
+    # Usernames may contain characters memcached does not allow in keys
+    return "players:token:" + hashlib.sha256(username.encode()).hexdigest()
+
+
+def cached_token(username: str) -> Optional[Tuple[Any, str]]:
+    """The (player id, token hash) recently validated for ``username``, if any."""
+    return cache.get(_cache_key(username))
+
+
+def cache_token(username: str, player_id: Any, token_hash: str) -> None:
+    cache.set(
+        _cache_key(username), (player_id, token_hash), settings.PLAYER_TOKEN_CACHE_TTL
+    )
+
+
+def invalidate_tokens(*usernames: str) -> None:
+    cache.delete_many([_cache_key(username) for username in usernames])
@@ -1,7 +1,6 @@
 from typing import cast
 
 from django.conf import settings
-from django.core import mail
 from django.http import (
     HttpRequest,
     HttpResponse,
@@ -13,7 +12,11 @@ from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django_otp.oath import totp
 
+from fymserver.mail_queue import MailQueueFull, send_mail_async
+from fymserver.ratelimit import ratelimit
+
 from .models import Player
+from .otp import OtpThrottled, claim_code, count_attempt, otp_window, reset_attempts
 
 AUTH_CODE_EMAIL_TEXT = """Hello!
 
@@ -33,7 +36,12 @@ def generate_otp(key: str, step: int, timestamp: int, drift: int = 0) -> int:
 
 
 @csrf_exempt
+@ratelimit("players:send_auth_code")
 def send_auth_code(request: HttpRequest) -> HttpResponse:
+    return _send_auth_code(request)
+
+
+def _send_auth_code(request: HttpRequest) -> HttpResponse:
     player: str = request.POST.get("player", "")
     if not player:
         return HttpResponseBadRequest("No player specified")
@@ -50,12 +58,17 @@ def send_auth_code(request: HttpRequest) -> HttpResponse:
 
             message = AUTH_CODE_EMAIL_TEXT.format(auth_code=otp)
 
-            mail.send_mail(
-                "[Freight Yard Manager] Authentication Code",
-                message,
-                "noreply@fymanager.com",
-                [player_obj.email],
-            )
+            try:
+                send_mail_async(
+                    "[Freight Yard Manager] Authentication Code",
+                    message,
+                    "noreply@fymanager.com",
+                    [player_obj.email],
+                )
+            except MailQueueFull:
+                response = HttpResponse("Mail queue full", status=503)
+                response["Retry-After"] = "60"
+                return response
 
     return HttpResponse()
 
@@ -63,15 +76,22 @@ def send_auth_code(request: HttpRequest) -> HttpResponse:
 def validate_otp(
     key: str, step: int, timestamp: int, drift_range: int, input_otp: int
 ) -> bool:
-    for i in range(-drift_range, drift_range + 1):
-        if input_otp == generate_otp(key, step, timestamp, drift=i):
-            return True
-
-    return False
+    return input_otp in otp_window(key, step, timestamp, drift_range)
 
 
 @csrf_exempt
+@ratelimit("players:check_auth_code")
 def check_auth_code(request: HttpRequest) -> HttpResponse:
+    """Exchange an emailed code for a new token.
+
+    Only the hash of a token is stored, so the one issued before cannot be
+    handed out again: every successful check replaces the player's token, and
+    signs the player out on their other devices.
+    """
+    return _check_auth_code(request)
+
+
+def _check_auth_code(request: HttpRequest) -> HttpResponse:
     player: str = request.POST.get("player", "")
     if not player:
         return HttpResponseBadRequest("No player specified")
@@ -80,23 +100,31 @@ def check_auth_code(request: HttpRequest) -> HttpResponse:
     if not otp_raw:
         return HttpResponseBadRequest("No OTP specified")
 
-    if not Player.objects.filter(username=player).exists():
+    player_obj = Player.objects.filter(username=player).first()
+    if player_obj is None:
         return HttpResponseForbidden()
 
-    player_obj = cast(Player, Player.objects.get(username=player))
-
     try:
         otp = int(otp_raw)
-    except TypeError:
+    except ValueError:
         return HttpResponseBadRequest("Unparseable OTP")
 
+    try:
+        count_attempt(player_obj.pk)
+    except OtpThrottled:
+        response = HttpResponse("Too many attempts", status=429)
+        response["Retry-After"] = str(settings.OTP_ATTEMPT_WINDOW_SECS)
+        return response
+
     if not validate_otp(
         settings.SECRET_KEY + player_obj.token,
         settings.OTP_STEP_SECS,
         0,
         settings.OTP_DRIFT_RANGE,
         otp,
-    ):
+    ) or not claim_code(player_obj.pk, otp):
         return HttpResponseForbidden()
 
-    return JsonResponse({"token": player_obj.token})
+    reset_attempts(player_obj.pk)
+
+    return JsonResponse({"token": player_obj.rotate_token()})
@@ -0,0 +1,14 @@
+#!/usr/bin/env bash
+
+# Serves fymserver.asgi, with async views, as an alternative to run-uwsgi.sh.
+# Point nginx at the socket with proxy_pass http://unix:/run/uvicorn/fymserver.sock
+# rather than uwsgi_pass, and pass the Host and X-Forwarded-For headers. Requests
+# over the socket have no client address of their own, so forwarded addresses are
+# trusted from any peer; only nginx can reach the socket.
+
+source /etc/django_params
+poetry run uvicorn fymserver.asgi:application \
+    --uds /run/uvicorn/fymserver.sock \
+    --proxy-headers \
+    --forwarded-allow-ips='*' \
+    --no-access-log
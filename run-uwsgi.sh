@@ -1,4 +1,4 @@
 #!/usr/bin/env bash
 
 source /etc/django_params
-poetry run uwsgi --socket /run/uwsgi/fymserver.sock --module fymserver.wsgi
+poetry run uwsgi --socket /run/uwsgi/fymserver.sock --module fymserver.wsgi --enable-threads
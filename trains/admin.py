@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Train
+from .models import ArchivedTrain, Train
 
 
 # Register your models here.
@@ -24,3 +24,31 @@ class TrainAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Train, TrainAdmin)
+
+
+class ArchivedTrainAdmin(admin.ModelAdmin):
+    list_display = ["id", "train_file", "to_player", "upload_date", "archived_at"]
+    search_fields = ["from_player", "to_player"]
+    readonly_fields = [
+        "id",
+        "from_player",
+        "to_player",
+        "downloaded_by",
+        "upload_date",
+        "archived_at",
+        "train_file",
+    ]
+
+    # Archived trains are only written by archive_trains and removed by
+    # purge_trains, so the admin just browses them
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(ArchivedTrain, ArchivedTrainAdmin)
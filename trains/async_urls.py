@@ -0,0 +1,19 @@
+from django.urls import path
+
+from fymserver.asynchronous import with_async_views
+
+from . import async_views, views
+from .urls import urlpatterns as sync_urlpatterns
+
+app_name = "trains"
+
+urlpatterns = with_async_views(
+    sync_urlpatterns,
+    {
+        views.upload: async_views.upload,
+        views.complete_upload: async_views.complete_upload,
+    },
+) + [
+    # Long-polls, so only routed here
+    path("wait", async_views.wait, name="wait"),
+]
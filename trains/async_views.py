@@ -0,0 +1,65 @@
+"""Async versions of the train views that wait on S3, served by ``fymserver.asgi``.
+
+Uploads are parsed off the event loop, then run the same code as the sync
+views with ``sync_to_async``, in the thread Django keeps for the request. The
+other train views run as they are. ``wait`` holds the request open for new
+trains, so it is only served here, where it does not tie up a worker while it
+waits.
+"""
+from typing import Any, Dict, List
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import BadRequest
+from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, JsonResponse
+
+from fymserver.asynchronous import async_csrf_exempt
+from fymserver.pubsub import get_broker
+from fymserver.ratelimit import ratelimit
+from fymserver.upload_handlers import streamed_upload
+from players.decorators import valid_player_required
+
+from . import views
+from .events import channel_for, parse_since, pending_trains
+from .models import Train
+
+WAIT_DEFAULT_SECS = 30
+WAIT_MAX_SECS = 60
+
+
+@async_csrf_exempt
+@valid_player_required
+async def wait(request: HttpRequest) -> HttpResponse:
+    player: str = request.player.username
+    try:
+        since = parse_since(request.POST.get("since"))
+        timeout = float(request.POST.get("timeout", WAIT_DEFAULT_SECS))
+    except (BadRequest, ValueError):
+        return HttpResponseBadRequest("since must be an integer, timeout a number")
+    timeout = max(0.0, min(timeout, WAIT_MAX_SECS))
+
+    with get_broker().subscribe(channel_for(player)) as subscription:
+        trains: List[Dict[str, Any]] = []
+        if since is not None:
+            trains = await sync_to_async(pending_trains)(player, since)
+        if not trains:
+            message = await subscription.get(timeout)
+            trains = [message] if message else []
+
+    return JsonResponse({"trains": trains})
+
+
+@async_csrf_exempt
+@ratelimit("trains:upload")
+@valid_player_required
+@ratelimit("trains:upload", key="player")
+@streamed_upload(Train._meta.get_field("train_file"))
+async def upload(request: HttpRequest) -> HttpResponse:
+    return await sync_to_async(views._upload)(request)
+
+
+@async_csrf_exempt
+@ratelimit("trains:upload")
+@valid_player_required
+@ratelimit("trains:upload", key="player")
+async def complete_upload(request: HttpRequest) -> HttpResponse:
+    return await sync_to_async(views._complete_upload)(request)
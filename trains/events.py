@@ -0,0 +1,185 @@
+"""Notifications to players when a train addressed to them is stored.
+
+Uploads publish to a per-player channel on the pub/sub broker, which must be
+shared between the processes serving uploads and those serving these
+notifications. Clients can either long-poll ``trains:wait``, which is only
+routed by ``fymserver.async_urls``, or hold open a Server-Sent Events stream on
+``SSE_PATH``, which ``fymserver.asgi`` routes straight to ``sse_application``:
+Django 4.0 can only stream responses from synchronous iterators, which would
+tie up a worker thread per idle client.
+"""
+import asyncio
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import BadRequest, PermissionDenied, RequestDataTooBig
+from django.db import transaction
+from django.http import QueryDict
+
+from fymserver.pubsub import get_broker
+from players.decorators import authenticate
+
+from .models import PlayerName, Train, TrainState
+
+SSE_PATH = "/fymserver/trains/events"
+KEEPALIVE_SECS = 15
+PENDING_MAX_TRAINS = 100
+# The body only carries the player, token and since fields
+MAX_BODY_BYTES = 4096
+
+
+def channel_for(player: str) -> str:
+    # Usernames may contain characters memcached does not allow in keys
+    return "trains:" + hashlib.sha256(player.encode()).hexdigest()
+
+
+def train_message(train: Train) -> Dict[str, Any]:
+    return {"pk": train.pk, "file": train.train_file.name}
+
+
+def notify_new_train(train: Train) -> None:
+    """Tell the recipient about ``train`` once the current transaction commits."""
+    channel = channel_for(train.to_player)
+    message = train_message(train)
+    transaction.on_commit(lambda: get_broker().publish(channel, message))
+
+
+def pending_trains(player: str, since: int) -> List[Dict[str, Any]]:
+    """Available trains for ``player`` stored after train ``since``."""
+    player_key = PlayerName.lookup(player)
+    if player_key is None:
+        return []
+    rows = (
+        Train.objects.filter(
+            state=TrainState.AVAILABLE, to_player_key=player_key, pk__gt=since
+        )
+        .order_by("pk")
+        .values_list("pk", "train_file")[:PENDING_MAX_TRAINS]
+    )
+    return [{"pk": pk, "file": name} for pk, name in rows]
+
+
+def parse_since(value: Optional[str]) -> Optional[int]:
+    """Parse an optional train id, raising ``BadRequest`` if malformed."""
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise BadRequest("since must be an integer")
+
+
+def _open_stream(
+    data: QueryDict, last_event_id: Optional[str]
+) -> Tuple[str, Optional[int]]:
+    player = data.get("player", "")
+    authenticate(player, data.get("token", ""))
+    return player, parse_since(data.get("since", last_event_id))
+
+
+def sse_event(message: Dict[str, Any]) -> bytes:
+    return f"id: {message['pk']}\ndata: {json.dumps(message)}\n\n".encode()
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise asyncio.CancelledError()
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_BYTES:
+            raise RequestDataTooBig()
+        if not message.get("more_body", False):
+            return body
+
+
+async def _send_error(send, status: int, reason: str) -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"text/plain; charset=utf-8")],
+        }
+    )
+    await send({"type": "http.response.body", "body": reason.encode()})
+
+
+async def sse_application(scope, receive, send) -> None:
+    """ASGI app streaming new trains for the authenticated player as SSE.
+
+    Takes the same form-encoded ``player``/``token`` body as the other train
+    views, plus an optional ``since`` train id (or ``Last-Event-ID`` header)
+    to first replay trains the client has not yet seen.
+    """
+    if scope["method"] != "POST":
+        await _send_error(send, 405, "Method not allowed")
+        return
+
+    try:
+        body = await _read_body(receive)
+    except asyncio.CancelledError:
+        return
+    except RequestDataTooBig:
+        await _send_error(send, 413, "Request body too large")
+        return
+
+    headers = dict(scope.get("headers", []))
+    last_event_id = headers.get(b"last-event-id")
+    try:
+        player, since = await sync_to_async(_open_stream)(
+            QueryDict(body), last_event_id.decode() if last_event_id else None
+        )
+    except BadRequest as e:
+        await _send_error(send, 400, str(e))
+        return
+    except PermissionDenied:
+        await _send_error(send, 403, "Forbidden")
+        return
+
+    # Subscribe before replaying so nothing stored in between is missed; the
+    # client may see a train twice but will never miss one
+    with get_broker().subscribe(channel_for(player)) as subscription:
+        backlog = []
+        if since is not None:
+            backlog = await sync_to_async(pending_trains)(player, since)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+        for message in backlog:
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": sse_event(message),
+                    "more_body": True,
+                }
+            )
+
+        disconnected = asyncio.ensure_future(receive())
+        try:
+            while True:
+                next_message = asyncio.ensure_future(subscription.get(KEEPALIVE_SECS))
+                await asyncio.wait(
+                    {disconnected, next_message},
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if disconnected.done():
+                    next_message.cancel()
+                    return
+                message = next_message.result()
+                body = sse_event(message) if message else b": keepalive\n\n"
+                await send(
+                    {"type": "http.response.body", "body": body, "more_body": True}
+                )
+        finally:
+            disconnected.cancel()
@@ -0,0 +1,122 @@
+import time
+from datetime import date, timedelta
+from typing import List, Optional, Tuple, Union
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from fymserver.ingest_state import watch
+from trains.models import ArchivedTrain, Train, TrainState
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class ArchiveStats:
+    def __init__(self) -> None:
+        self.rows = 0
+        self.conflicts: List[int] = []
+        self.start = time.monotonic()
+
+    def report(self) -> str:
+        elapsed = max(time.monotonic() - self.start, 1e-6)
+        report = (
+            f"Archived {self.rows} trains in {elapsed:.1f}s: "
+            f"{self.rows / elapsed:.1f} rows/s"
+        )
+        if self.conflicts:
+            report += (
+                f"; kept {len(self.conflicts)} trains whose ids are already "
+                "archived as other trains"
+            )
+        return report
+
+
+def _archive_key(train: Union[Train, ArchivedTrain]) -> Tuple[int, str, date]:
+    return train.pk, train.train_file.name, train.upload_date
+
+
+def archive_trains(
+    min_age_days: int,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    stats: Optional[ArchiveStats] = None,
+) -> ArchiveStats:
+    """Move downloaded trains uploaded at least ``min_age_days`` ago to the archive.
+
+    Each batch is copied and deleted in one transaction. Only trains whose
+    copy is confirmed in the archive are deleted: a train whose id is already
+    archived as a different train stays put, and is listed in the conflicts.
+    """
+    if stats is None:
+        stats = ArchiveStats()
+
+    cutoff = date.today() - timedelta(days=min_age_days)
+    downloaded = Train.objects.filter(
+        state=TrainState.DOWNLOADED, upload_date__lte=cutoff
+    ).order_by("pk")
+
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            batch = list(downloaded.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return stats
+            last_pk = batch[-1].pk
+
+            pks = [train.pk for train in batch]
+            ArchivedTrain.objects.bulk_create(
+                [ArchivedTrain.from_train(train) for train in batch],
+                ignore_conflicts=True,
+            )
+            archived = {
+                _archive_key(archived_train)
+                for archived_train in ArchivedTrain.objects.filter(pk__in=pks)
+            }
+            archived_pks = [
+                train.pk for train in batch if _archive_key(train) in archived
+            ]
+            _, deleted = Train.objects.filter(pk__in=archived_pks).delete()
+        stats.rows += deleted.get(Train._meta.label, 0)
+        stats.conflicts.extend(sorted(set(pks) - set(archived_pks)))
+
+
+class Command(BaseCommand):
+    help = "Moves downloaded trains out of the trains table into the archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.TRAIN_ARCHIVE_AFTER_DAYS,
+            help="Archive downloaded trains uploaded at least this many days ago",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help="Trains moved per transaction",
+        )
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep running, archiving every --interval seconds",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=600.0,
+            help="Seconds between runs in --watch mode",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        def run():
+            stats = archive_trains(options["days"], options["batch_size"])
+            self.stdout.write(stats.report())
+
+        if options["watch"]:
+            watch(run, options["interval"])
+        else:
+            run()
@@ -1,32 +1,59 @@
 import os
 from glob import glob
 from pathlib import Path
+from typing import Optional
 
-from django.core.files.base import ContentFile
+from django.core.files import File
 from django.core.management.base import BaseCommand
 from tqdm import tqdm
 
+from fymserver.files import file_digest
+from fymserver.ingest_state import IngestState, add_incremental_arguments, watch
 from trains.models import Train
 
 
-def ingest_train(filepath: Path):
+def ingest_train(filepath: Path) -> str:
     filename = filepath.name
 
     tokens = os.path.splitext(filename)[0].split("-")
     to_player = tokens[3]
     from_player = tokens[4]
 
-    train_obj = Train.objects.create(
-        to_player=to_player,
-        from_player=from_player,
-    )
     with open(filepath, "rb") as f:
-        train_obj.train_file.save(filename, ContentFile(f.read()))
+        content = File(f)
+        file_size, file_sha256 = file_digest(content)
 
+        if Train.objects.filter(
+            train_file=filename, file_size=file_size, file_sha256=file_sha256
+        ).exists():
+            return file_sha256
 
-def ingest_maps(dirpath: Path):
-    for train_file in tqdm(glob(str(dirpath / "Y*.zr*"))):
-        ingest_train(Path(train_file))
+        train_obj = Train(
+            to_player=to_player,
+            from_player=from_player,
+            file_size=file_size,
+            file_sha256=file_sha256,
+        )
+        train_obj.train_file.save(filename, content, save=False)
+        train_obj.save()
+
+    return file_sha256
+
+
+def ingest_trains(dirpath: Path, state: Optional[IngestState] = None) -> int:
+    filepaths = [Path(train_file) for train_file in glob(str(dirpath / "Y*.zr*"))]
+    if state is not None:
+        filepaths = [filepath for filepath in filepaths if state.changed(filepath)]
+
+    for filepath in tqdm(filepaths):
+        file_sha256 = ingest_train(filepath)
+        if state is not None:
+            state.record(filepath, file_sha256)
+
+    if state is not None:
+        state.save()
+
+    return len(filepaths)
 
 
 class Command(BaseCommand):
@@ -34,6 +61,17 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("dirpath", type=str)
+        add_incremental_arguments(parser)
 
     def handle(self, *args, **options):
-        ingest_maps(Path(options["dirpath"]))
+        dirpath = Path(options["dirpath"])
+        state = IngestState.from_options(dirpath, options)
+
+        def run():
+            count = ingest_trains(dirpath, state=state)
+            self.stdout.write(f"Processed {count} new or changed train files")
+
+        if options["watch"]:
+            watch(run, options["interval"])
+        else:
+            run()
@@ -0,0 +1,140 @@
+import time
+from datetime import date, timedelta
+from typing import List, Optional, Set
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+
+from fymserver.files import S3_DELETE_BATCH_SIZE, delete_files
+from fymserver.ingest_state import watch
+from trains.models import ArchivedTrain, Train, TrainState
+
+DEFAULT_BATCH_SIZE = S3_DELETE_BATCH_SIZE
+
+
+class PurgeStats:
+    def __init__(self) -> None:
+        self.rows = 0
+        self.objects = 0
+        self.start = time.monotonic()
+
+    def report(self) -> str:
+        elapsed = max(time.monotonic() - self.start, 1e-6)
+        return (
+            f"Purged {self.rows} trains and {self.objects} files "
+            f"in {elapsed:.1f}s: {self.rows / elapsed:.1f} rows/s, "
+            f"{self.objects / elapsed:.1f} objects/s"
+        )
+
+
+def purge_trains(
+    max_age_days: int,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    stats: Optional[PurgeStats] = None,
+) -> PurgeStats:
+    """Delete downloaded and archived trains uploaded over ``max_age_days`` ago.
+
+    Each batch deletes the files before the rows, so an interrupted run leaves
+    at worst rows whose files are already gone, and the next run finishes them.
+    """
+    if stats is None:
+        stats = PurgeStats()
+
+    cutoff = date.today() - timedelta(days=max_age_days)
+    _purge(
+        Train.objects.filter(state=TrainState.DOWNLOADED, upload_date__lt=cutoff),
+        batch_size,
+        stats,
+    )
+    _purge(ArchivedTrain.objects.filter(upload_date__lt=cutoff), batch_size, stats)
+
+    return stats
+
+
+def _purge(expired: models.QuerySet, batch_size: int, stats: PurgeStats) -> None:
+    model = expired.model
+    storage = model._meta.get_field("train_file").storage
+    expired = expired.order_by("pk")
+
+    last_pk = 0
+    while True:
+        batch = list(
+            expired.filter(pk__gt=last_pk).values_list("pk", "train_file")[:batch_size]
+        )
+        if not batch:
+            return
+        last_pk = batch[-1][0]
+
+        pks = [pk for pk, _ in batch]
+        names = {name for _, name in batch if name}
+        names -= _names_in_use(names, pks)
+
+        stats.objects += delete_files(storage, sorted(names))
+        with transaction.atomic():
+            _, deleted = model.objects.filter(pk__in=pks).delete()
+        stats.rows += deleted.get(model._meta.label, 0)
+
+
+def _names_in_use(names: Set[str], pks: List[int]) -> Set[str]:
+    """Which of ``names`` are still used by trains other than ``pks``.
+
+    Uploads overwrite files of the same name, so a newer train may share one.
+    Archived trains keep their original pk, so ``pks`` is unique across both.
+    """
+    in_use: Set[str] = set()
+    for model in (Train, ArchivedTrain):
+        in_use.update(
+            model.objects.filter(train_file__in=names)
+            .exclude(pk__in=pks)
+            .values_list("train_file", flat=True)
+        )
+    return in_use
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes downloaded and archived trains, and their files, "
+        "past the retention age"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.TRAIN_RETENTION_DAYS,
+            help="Purge downloaded trains uploaded more than this many days ago",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f"Trains deleted per batch (at most {S3_DELETE_BATCH_SIZE})",
+        )
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep running, purging every --interval seconds",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=3600.0,
+            help="Seconds between purges in --watch mode",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if not 1 <= batch_size <= S3_DELETE_BATCH_SIZE:
+            raise CommandError(
+                f"--batch-size must be between 1 and {S3_DELETE_BATCH_SIZE}"
+            )
+
+        def run():
+            stats = purge_trains(options["days"], batch_size)
+            self.stdout.write(stats.report())
+
+        if options["watch"]:
+            watch(run, options["interval"])
+        else:
+            run()
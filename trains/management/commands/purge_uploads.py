@@ -0,0 +1,73 @@
+from datetime import timedelta
+from typing import Dict, Tuple
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from fymserver.direct_uploads import stale_uploads
+from fymserver.files import delete_files
+from fymserver.ingest_state import watch
+from maps.models import FILE_EXTS, Map
+from trains.models import Train
+
+
+def upload_storages() -> Dict[Tuple[str, str], S3Boto3Storage]:
+    """The S3 storages uploads are staged in, one per bucket and location."""
+    fields = [Train._meta.get_field("train_file")] + [
+        Map._meta.get_field(f"{file_ext}_file") for file_ext in FILE_EXTS
+    ]
+    return {
+        (field.storage.bucket_name, field.storage.location): field.storage
+        for field in fields
+        if isinstance(field.storage, S3Boto3Storage)
+    }
+
+
+def purge_uploads(max_age_hours: int) -> int:
+    """Delete staged uploads older than ``max_age_hours``, returning how many.
+
+    An S3 lifecycle rule expiring ``*/uploads/`` objects after a day, and
+    aborting incomplete multipart uploads, does the same without this command.
+    """
+    before = timezone.now() - timedelta(hours=max_age_hours)
+    return sum(
+        delete_files(storage, stale_uploads(storage, before))
+        for storage in upload_storages().values()
+    )
+
+
+class Command(BaseCommand):
+    help = "Deletes staged uploads that were never completed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours",
+            type=int,
+            default=settings.STAGED_UPLOAD_MAX_AGE_HOURS,
+            help="Delete staged uploads written more than this many hours ago",
+        )
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep running, purging every --interval seconds",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=3600.0,
+            help="Seconds between purges in --watch mode",
+        )
+
+    def handle(self, *args, **options):
+        if options["hours"] < 1:
+            raise CommandError("--hours must be positive")
+
+        def run():
+            self.stdout.write(f"Purged {purge_uploads(options['hours'])} uploads")
+
+        if options["watch"]:
+            watch(run, options["interval"])
+        else:
+            run()
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.10 on 2026-10-18 09:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trains", "0003_alter_train_downloaded_by"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="train",
+            name="file_sha256",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="train",
+            name="file_size",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
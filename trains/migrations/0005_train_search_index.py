@@ -0,0 +1,133 @@
+# Generated by Django 4.0.10 on 2026-10-18 09:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+TRIGRAM_LENGTH = 3
+
+
+def index_existing_trains(apps, schema_editor):
+    Train = apps.get_model("trains", "Train")
+    PlayerName = apps.get_model("trains", "PlayerName")
+    TrainNameTrigram = apps.get_model("trains", "TrainNameTrigram")
+
+    keys = {}
+
+    def key_for(name):
+        if not name:
+            return None
+        if name not in keys:
+            keys[name] = PlayerName.objects.get_or_create(name=name)[0].pk
+        return keys[name]
+
+    for train in Train.objects.iterator():
+        train.from_player_key_id = key_for(train.from_player)
+        train.to_player_key_id = key_for(train.to_player)
+        train.save(update_fields=["from_player_key", "to_player_key"])
+
+        name = (train.train_file.name or "").lower()
+        TrainNameTrigram.objects.bulk_create(
+            TrainNameTrigram(train_id=train.pk, trigram=trigram)
+            for trigram in {
+                name[i : i + TRIGRAM_LENGTH]
+                for i in range(len(name) - TRIGRAM_LENGTH + 1)
+            }
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trains", "0004_train_file_digest"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlayerName",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=40, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TrainNameTrigram",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("trigram", models.CharField(max_length=3)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="trainnametrigram",
+            name="train",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="trains.train",
+            ),
+        ),
+        migrations.AddField(
+            model_name="train",
+            name="from_player_key",
+            field=models.ForeignKey(
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="trains.playername",
+            ),
+        ),
+        migrations.AddField(
+            model_name="train",
+            name="to_player_key",
+            field=models.ForeignKey(
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="trains.playername",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="train",
+            index=models.Index(
+                fields=["state", "upload_date"], name="trains_trai_state_b67421_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="train",
+            index=models.Index(
+                fields=["state", "from_player_key", "upload_date"],
+                name="trains_trai_state_26df16_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="train",
+            index=models.Index(
+                fields=["state", "to_player_key", "upload_date"],
+                name="trains_trai_state_e66b7c_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="trainnametrigram",
+            index=models.Index(
+                fields=["trigram", "train"], name="trains_trai_trigram_880b52_idx"
+            ),
+        ),
+        migrations.RunPython(index_existing_trains, migrations.RunPython.noop),
+    ]
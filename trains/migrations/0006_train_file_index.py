@@ -0,0 +1,19 @@
+# Generated by Django 4.0.10 on 2026-10-18 09:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trains", "0005_train_search_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="train",
+            index=models.Index(
+                fields=["train_file"], name="trains_trai_train_f_a1f288_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 4.0.10 on 2026-10-18 09:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import fymserver.storage_backends
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("players", "0003_player_email"),
+        ("trains", "0006_train_file_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedTrain",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                (
+                    "train_file",
+                    models.FileField(
+                        storage=fymserver.storage_backends.TrainDataS3Storage(),
+                        upload_to="",
+                    ),
+                ),
+                ("file_size", models.BigIntegerField(blank=True, null=True)),
+                (
+                    "file_sha256",
+                    models.CharField(blank=True, default="", max_length=64),
+                ),
+                ("from_player", models.CharField(max_length=40)),
+                ("to_player", models.CharField(max_length=40)),
+                ("upload_date", models.DateField()),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "downloaded_by",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.RESTRICT,
+                        related_name="+",
+                        to="players.player",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="archivedtrain",
+            index=models.Index(
+                fields=["upload_date"], name="trains_arch_upload__62d6e9_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedtrain",
+            index=models.Index(
+                fields=["from_player", "id"], name="trains_arch_from_pl_aeb9ac_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedtrain",
+            index=models.Index(
+                fields=["to_player", "id"], name="trains_arch_to_play_54ea37_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedtrain",
+            index=models.Index(
+                fields=["train_file"], name="trains_arch_train_f_c0ce2a_idx"
+            ),
+        ),
+    ]
@@ -1,20 +1,79 @@
 from datetime import date
+from typing import Dict, List, Optional, Set
 
+from django.core.cache import cache
 from django.db import models
 
 from fymserver.storage_backends import TrainDataS3Storage
 from players.models import Player
 
+TRIGRAM_LENGTH = 3
+# Trigrams found in more trains than this, or than this fraction of all trains,
+# like ".zr", barely narrow a search
+COMMON_TRIGRAM_TRAINS = 1000
+COMMON_TRIGRAM_FRACTION = 0.05
+# Trigram and train counts are cached this long between index requests
+TRIGRAM_COUNT_CACHE_TTL = 600
+
+
+def name_trigrams(name: str) -> Set[str]:
+    name = name.lower()
+    return {name[i : i + TRIGRAM_LENGTH] for i in range(len(name) - TRIGRAM_LENGTH + 1)}
+
 
 class TrainState(models.IntegerChoices):
     AVAILABLE = 1
     DOWNLOADED = 2
 
 
+class PlayerName(models.Model):
+    """Interned player name, so trains can be filtered on a compact integer key."""
+
+    name = models.CharField(max_length=40, unique=True)
+
+    @classmethod
+    def key_for(cls, name: str) -> Optional[int]:
+        if not name:
+            return None
+        return cls.objects.get_or_create(name=name)[0].pk
+
+    @classmethod
+    def lookup(cls, name: str) -> Optional[int]:
+        return cls.objects.filter(name=name).values_list("pk", flat=True).first()
+
+
+class TrainQuerySet(models.QuerySet):
+    def claim(self, player: Player) -> int:
+        """Mark the available trains in this queryset as downloaded by ``player``.
+
+        This is a single conditional UPDATE, so a train can only be claimed once
+        however many requests race for it. Returns the number of trains claimed.
+        """
+        return self.filter(state=TrainState.AVAILABLE).update(
+            state=TrainState.DOWNLOADED, downloaded_by=player
+        )
+
+
 class Train(models.Model):
     train_file = models.FileField(storage=TrainDataS3Storage())
+    file_size = models.BigIntegerField(null=True, blank=True)
+    file_sha256 = models.CharField(max_length=64, blank=True, default="")
     from_player = models.CharField(max_length=40)
     to_player = models.CharField(max_length=40)
+    from_player_key = models.ForeignKey(
+        PlayerName,
+        on_delete=models.PROTECT,
+        null=True,
+        editable=False,
+        related_name="+",
+    )
+    to_player_key = models.ForeignKey(
+        PlayerName,
+        on_delete=models.PROTECT,
+        null=True,
+        editable=False,
+        related_name="+",
+    )
     downloaded_by = models.ForeignKey(
         "players.Player", on_delete=models.RESTRICT, null=True
     )
@@ -23,6 +82,146 @@ class Train(models.Model):
         choices=TrainState.choices, default=TrainState.AVAILABLE
     )
 
+    objects = TrainQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["state", "upload_date"]),
+            models.Index(fields=["state", "from_player_key", "upload_date"]),
+            models.Index(fields=["state", "to_player_key", "upload_date"]),
+            # Exact-name lookups: duplicate uploads and purge_trains. Substring
+            # search goes through TrainNameTrigram instead.
+            models.Index(fields=["train_file"]),
+        ]
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        if adding:
+            self.from_player_key_id = PlayerName.key_for(self.from_player)
+            self.to_player_key_id = PlayerName.key_for(self.to_player)
+
+        super().save(*args, **kwargs)
+
+        if adding:
+            TrainNameTrigram.objects.bulk_create(self.build_trigrams())
+
+    def build_trigrams(self) -> List["TrainNameTrigram"]:
+        return [
+            TrainNameTrigram(train=self, trigram=trigram)
+            for trigram in name_trigrams(self.train_file.name or "")
+        ]
+
     def set_downloaded(self, player: Player) -> None:
         self.state = TrainState.DOWNLOADED
         self.downloaded_by = player
+
+
+class ArchivedTrain(models.Model):
+    """A downloaded train moved out of ``Train`` so the hot table stays small.
+
+    Keeps the original train's primary key; the file itself stays in storage
+    until purged.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    train_file = models.FileField(storage=TrainDataS3Storage())
+    file_size = models.BigIntegerField(null=True, blank=True)
+    file_sha256 = models.CharField(max_length=64, blank=True, default="")
+    from_player = models.CharField(max_length=40)
+    to_player = models.CharField(max_length=40)
+    downloaded_by = models.ForeignKey(
+        "players.Player", on_delete=models.RESTRICT, null=True, related_name="+"
+    )
+    upload_date = models.DateField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["upload_date"]),
+            models.Index(fields=["from_player", "id"]),
+            models.Index(fields=["to_player", "id"]),
+            models.Index(fields=["train_file"]),
+        ]
+
+    @classmethod
+    def from_train(cls, train: Train) -> "ArchivedTrain":
+        return cls(
+            id=train.pk,
+            train_file=train.train_file.name,
+            file_size=train.file_size,
+            file_sha256=train.file_sha256,
+            from_player=train.from_player,
+            to_player=train.to_player,
+            downloaded_by_id=train.downloaded_by_id,
+            upload_date=train.upload_date,
+        )
+
+
+class TrainNameTrigram(models.Model):
+    """Trigram index over train filenames, used for substring search."""
+
+    train = models.ForeignKey(Train, on_delete=models.CASCADE, related_name="+")
+    trigram = models.CharField(max_length=TRIGRAM_LENGTH)
+
+    class Meta:
+        indexes = [models.Index(fields=["trigram", "train"])]
+
+    @classmethod
+    def train_counts(cls, trigrams: Set[str]) -> Dict[str, int]:
+        """Number of trains containing each of ``trigrams``, cached for a while.
+
+        Stale counts only change which trigrams a search filters on, never
+        its results.
+        """
+        keys = {
+            f"trains:trigram:{trigram.encode().hex()}": trigram for trigram in trigrams
+        }
+        counts = {keys[key]: count for key, count in cache.get_many(keys).items()}
+        missing = trigrams - counts.keys()
+        if missing:
+            fresh = dict.fromkeys(missing, 0)
+            fresh.update(
+                cls.objects.filter(trigram__in=missing)
+                .values("trigram")
+                .annotate(trains=models.Count("train"))
+                .values_list("trigram", "trains")
+            )
+            cache.set_many(
+                {
+                    key: fresh[trigram]
+                    for key, trigram in keys.items()
+                    if trigram in fresh
+                },
+                TRIGRAM_COUNT_CACHE_TTL,
+            )
+            counts.update(fresh)
+        return counts
+
+    @staticmethod
+    def common_threshold() -> int:
+        trains = cache.get_or_set(
+            "trains:count", Train.objects.count, TRIGRAM_COUNT_CACHE_TTL
+        )
+        return max(COMMON_TRIGRAM_TRAINS, int(trains * COMMON_TRIGRAM_FRACTION))
+
+    @classmethod
+    def matching_train_ids(cls, query: str) -> Optional[models.QuerySet]:
+        """Ids of trains whose filename contains every uncommon trigram of ``query``.
+
+        Returns None if ``query`` has no uncommon trigrams to narrow the search.
+        """
+        threshold = cls.common_threshold()
+        trigrams = {
+            trigram
+            for trigram, count in cls.train_counts(name_trigrams(query)).items()
+            if count <= threshold
+        }
+        if not trigrams:
+            return None
+        return (
+            cls.objects.filter(trigram__in=trigrams)
+            .values("train")
+            .annotate(matches=models.Count("trigram", distinct=True))
+            .filter(matches=len(trigrams))
+            .values_list("train", flat=True)
+        )
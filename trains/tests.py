@@ -1,18 +1,36 @@
+import asyncio
+import hashlib
+import json
+import tempfile
 import uuid
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from io import BytesIO
+from pathlib import Path
 from typing import Any, Dict
 from unittest import mock
+from urllib.parse import urlencode
 
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import cache
 from django.core.files import File
-from django.test import TestCase
-from django.urls import reverse
+from django.test import TestCase, override_settings
+from django.urls import NoReverseMatch, reverse
 from django.utils import timezone
 from override_storage import override_storage
 
+from fymserver.ingest_state import IngestState
+from fymserver.tests import FakeS3Client, FakeS3Storage
+from fymserver.upload_handlers import new_staging_name
+from maps.models import FILE_EXTS, Map
 from players.models import Player
 
-from .models import Train, TrainState
+from . import events
+from .events import SSE_PATH, channel_for, sse_application
+from .management.commands.archive_trains import archive_trains
+from .management.commands.ingest_trains import ingest_trains
+from .management.commands.purge_trains import purge_trains
+from .management.commands.purge_uploads import purge_uploads
+from .models import ArchivedTrain, PlayerName, Train, TrainNameTrigram, TrainState
 
 
 def mock_file(filename: str) -> mock.MagicMock:
@@ -68,6 +86,55 @@ class TrainModelTests(TestCase):
         self.assertEqual("train01.zrn", train.train_file.name)
 
 
+@override_storage()
+class TrainSearchIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_player_names_share_keys(self):
+        pk1 = create_train("train01.zrn", from_player="player1", to_player="player2")
+        pk2 = create_train("train02.zrn", from_player="player2", to_player="player1")
+
+        train1 = Train.objects.get(pk=pk1)
+        train2 = Train.objects.get(pk=pk2)
+        self.assertEqual(train1.from_player_key_id, train2.to_player_key_id)
+        self.assertEqual(train1.to_player_key_id, train2.from_player_key_id)
+        self.assertEqual(2, PlayerName.objects.count())
+
+    def test_filename_trigrams_are_indexed(self):
+        pk = create_train("train01.zrn")
+
+        self.assertEqual([pk], list(TrainNameTrigram.matching_train_ids("IN01")))
+        self.assertEqual([], list(TrainNameTrigram.matching_train_ids("in02")))
+
+    def test_common_trigrams_are_not_matched(self):
+        pk = create_train("train01.zrn")
+        create_train("train02.zrn")
+
+        with mock.patch("trains.models.COMMON_TRIGRAM_TRAINS", 1):
+            self.assertEqual([pk], list(TrainNameTrigram.matching_train_ids("in01")))
+            self.assertIsNone(TrainNameTrigram.matching_train_ids("train"))
+
+    def test_common_threshold_grows_with_trains(self):
+        pk = create_train("train01.zrn")
+        for i in range(2, 5):
+            create_train(f"train0{i}.zrn")
+
+        with mock.patch("trains.models.COMMON_TRIGRAM_TRAINS", 1), mock.patch(
+            "trains.models.COMMON_TRIGRAM_FRACTION", 0.5
+        ):
+            self.assertEqual(2, TrainNameTrigram.common_threshold())
+            self.assertEqual([pk], list(TrainNameTrigram.matching_train_ids("in01")))
+            self.assertIsNone(TrainNameTrigram.matching_train_ids("train"))
+
+    def test_caches_trigram_counts(self):
+        create_train("train01.zrn")
+        TrainNameTrigram.matching_train_ids("in01")
+
+        with self.assertNumQueries(1):
+            list(TrainNameTrigram.matching_train_ids("in01"))
+
+
 @override_storage()
 class TrainIndexViewTests(TestCase):
     def setUp(self):
@@ -78,6 +145,15 @@ class TrainIndexViewTests(TestCase):
         response = self.client.post(url, data={"player": "fake", "token": "bad"})
         self.assertEqual(403, response.status_code)
 
+    def test_unknown_search_player_matches_nothing(self):
+        create_train("train01.zrn", from_player="player1")
+
+        url = reverse("trains:index")
+        response = self.client.post(
+            url, data={"search_player": "nobody", **get_default_login()}
+        )
+        self.assertJSONEqual(response.content, [])
+
     def test_train_index_view_is_empty_for_no_trains(self):
         url = reverse("trains:index")
         response = self.client.post(url, data=get_default_login())
@@ -129,6 +205,28 @@ class TrainIndexViewTests(TestCase):
         response = self.client.post(url, data={"filename": "01", **get_default_login()})
         self.assertJSONEqual(response.content, [{"pk": pk1, "file": "train01.zrn"}])
 
+    def test_returns_only_trains_with_names_containing_long_fragment(self):
+        pk1 = create_train("Y1234-01E02F034C0-000123-Player1-Player2.zrn")
+        pk2 = create_train("Y1234-01E02F034C0-000456-Player1-Player2.zrn")
+
+        url = reverse("trains:index")
+        response = self.client.post(
+            url, data={"filename": "034C0-000123", **get_default_login()}
+        )
+        self.assertJSONEqual(
+            response.content,
+            [{"pk": pk1, "file": "Y1234-01E02F034C0-000123-Player1-Player2.zrn"}],
+        )
+
+    def test_returns_no_trains_for_unknown_search_player(self):
+        create_train("train01.zrn", from_player="player1", to_player="player2")
+
+        url = reverse("trains:index")
+        response = self.client.post(
+            url, data={"search_player": "player3", **get_default_login()}
+        )
+        self.assertJSONEqual(response.content, [])
+
     def test_returns_only_trains_older_than_n_days(self):
         pk1 = create_train("train01.zrn", upload_date=datetime(2020, 1, 1))
         pk2 = create_train("train02.zrn", upload_date=datetime(2021, 1, 1))
@@ -147,6 +245,61 @@ class TrainIndexViewTests(TestCase):
         self.assertJSONEqual(response.content, [{"pk": pk1, "file": "train01.zrn"}])
 
 
+@override_storage()
+class TrainIndexPaginationTests(TestCase):
+    def setUp(self):
+        create_default_player()
+        self.pks = [create_train(f"train0{i}.zrn") for i in range(1, 4)]
+
+    def post(self, **data):
+        return self.client.post(
+            reverse("trains:index"), data={**data, **get_default_login()}
+        )
+
+    def test_pages_through_trains_with_cursor(self):
+        first_page = self.post(limit=2).json()
+        second_page = self.post(limit=2, cursor=first_page["next"]).json()
+
+        self.assertEqual(
+            {
+                "trains": [
+                    {"pk": self.pks[0], "file": "train01.zrn"},
+                    {"pk": self.pks[1], "file": "train02.zrn"},
+                ],
+                "next": self.pks[1],
+            },
+            first_page,
+        )
+        self.assertEqual(
+            {"trains": [{"pk": self.pks[2], "file": "train03.zrn"}], "next": None},
+            second_page,
+        )
+
+    def test_fails_with_malformed_cursor(self):
+        response = self.post(limit=2, cursor="abc")
+        self.assertEqual(400, response.status_code)
+
+    def test_streams_all_trains(self):
+        response = self.post(stream=1)
+
+        self.assertJSONEqual(
+            b"".join(response.streaming_content),
+            [
+                {"pk": self.pks[0], "file": "train01.zrn"},
+                {"pk": self.pks[1], "file": "train02.zrn"},
+                {"pk": self.pks[2], "file": "train03.zrn"},
+            ],
+        )
+
+    def test_streams_trains_in_bounded_batches(self):
+        with mock.patch("trains.views.STREAM_CHUNK_SIZE", 2):
+            response = self.post(stream=1)
+            with self.assertNumQueries(2):
+                content = b"".join(response.streaming_content)
+
+        self.assertEqual(self.pks, [train["pk"] for train in json.loads(content)])
+
+
 @override_storage()
 class TrainDownloadViewTests(TestCase):
     def setUp(self):
@@ -188,6 +341,47 @@ class TrainDownloadViewTests(TestCase):
         self.assertEqual(400, response.status_code)
 
 
+@override_storage()
+class TrainClaimTests(TestCase):
+    def setUp(self):
+        self.player = Player.objects.get(pk=create_default_player())
+
+    def test_train_can_only_be_claimed_once(self):
+        pk = create_train("train_01.zrn")
+
+        assert 1 == Train.objects.filter(pk=pk).claim(self.player)
+        assert 0 == Train.objects.filter(pk=pk).claim(self.player)
+
+    def test_batch_claim_returns_urls_for_available_trains(self):
+        pk1 = create_train("train_01.zrn")
+        pk2 = create_train("train_02.zrn", state=TrainState.DOWNLOADED)
+        pk3 = create_train("train_03.zrn")
+
+        response = self.client.post(
+            reverse("trains:claim"),
+            data={"pks": f"{pk1},{pk2},{pk3}", **get_default_login()},
+        )
+
+        self.assertJSONEqual(
+            response.content,
+            {
+                "trains": [
+                    {"pk": pk1, "file": "train_01.zrn", "url": "/train_01.zrn"},
+                    {"pk": pk3, "file": "train_03.zrn", "url": "/train_03.zrn"},
+                ],
+                "unavailable": [pk2],
+            },
+        )
+        for pk in (pk1, pk3):
+            train = Train.objects.get(pk=pk)
+            assert TrainState.DOWNLOADED == train.state
+            assert "Player1" == train.downloaded_by.username
+
+    def test_batch_claim_fails_without_pks(self):
+        response = self.client.post(reverse("trains:claim"), data=get_default_login())
+        self.assertEqual(400, response.status_code)
+
+
 @override_storage()
 class TrainUploadViewTests(TestCase):
     def setUp(self):
@@ -243,3 +437,430 @@ class TrainUploadViewTests(TestCase):
         assert file_data == train.train_file.read()
         assert TrainState.AVAILABLE == train.state
         assert None == train.downloaded_by
+
+    def test_upload_of_identical_available_train_is_skipped(self):
+        url = reverse("trains:upload")
+
+        filename = "Y1234-01E02F034C0-000123-Player1-Player2.zrn"
+        for _ in range(2):
+            response = self.client.post(
+                url,
+                {
+                    "train_file": BytesIO(b"train_data"),
+                    "filename": filename,
+                    **get_default_login(),
+                },
+            )
+            assert 200 == response.status_code
+
+        trains = Train.objects.all()
+        assert 1 == len(trains)
+        assert len(b"train_data") == trains[0].file_size
+        assert hashlib.sha256(b"train_data").hexdigest() == trains[0].file_sha256
+
+
+class TrainDirectUploadViewTests(TestCase):
+    FILENAME = "Y1234-01E02F034C0-000123-Player1-Player2.zrn"
+    DATA = b"train_data"
+
+    def setUp(self):
+        create_default_player()
+        self.s3 = FakeS3Client()
+        patcher = mock.patch.object(
+            Train._meta.get_field("train_file"), "storage", FakeS3Storage(self.s3)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload_params(self, **params) -> Dict[str, Any]:
+        return {
+            "filename": self.FILENAME,
+            "size": len(self.DATA),
+            "sha256": hashlib.sha256(self.DATA).hexdigest(),
+            **get_default_login(),
+            **params,
+        }
+
+    def test_presign_fails_with_invalid_player(self):
+        url = reverse("trains:presign_upload")
+        response = self.client.post(url, self.upload_params(player="fake", token="bad"))
+        self.assertEqual(403, response.status_code)
+
+    def test_completed_upload_creates_train(self):
+        response = self.client.post(
+            reverse("trains:presign_upload"), self.upload_params()
+        )
+        staging_name = response.json()["upload"]
+        self.s3.objects[f"maps/{staging_name}"] = self.DATA
+
+        response = self.client.post(
+            reverse("trains:complete_upload"),
+            self.upload_params(upload=staging_name),
+        )
+
+        assert 200 == response.status_code
+        train = Train.objects.get()
+        assert "Player1" == train.to_player
+        assert self.FILENAME == train.train_file.name
+        assert self.DATA == train.train_file.read()
+        assert f"maps/{staging_name}" not in self.s3.objects
+
+    @override_storage()
+    def test_presign_fails_without_s3_storage(self):
+        response = self.client.post(
+            reverse("trains:presign_upload"), self.upload_params()
+        )
+        assert 400 == response.status_code
+
+
+@override_storage()
+class IngestTrainsTests(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dirpath = Path(tempdir.name)
+        filename = "Y1234-01E02F034C0-000123-Player1-Player2.zrn"
+        (self.dirpath / filename).write_bytes(b"train_data")
+
+    def test_ingesting_twice_does_not_duplicate_trains(self):
+        ingest_trains(self.dirpath)
+        ingest_trains(self.dirpath)
+
+        assert 1 == Train.objects.count()
+
+    def test_state_index_skips_ingested_files(self):
+        state = IngestState(self.dirpath / "state.json")
+
+        assert 1 == ingest_trains(self.dirpath, state=state)
+        assert 0 == ingest_trains(self.dirpath, state=state)
+
+
+@override_storage()
+@override_settings(ROOT_URLCONF="fymserver.async_urls")
+class TrainEventsTests(TestCase):
+    FILENAME = "Y1234-01E02F034C0-000123-Player1-Player2.zrn"
+
+    def setUp(self):
+        create_default_player()
+
+    def upload_train(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("trains:upload"),
+                {
+                    "train_file": BytesIO(b"train_data"),
+                    "filename": self.FILENAME,
+                    **get_default_login(),
+                },
+            )
+        assert 200 == response.status_code
+
+    def test_wait_returns_pending_trains_after_since(self):
+        old_pk = create_train("old.zrn", to_player=DEFAULT_USERNAME)
+        new_pk = create_train("new.zrn", to_player=DEFAULT_USERNAME)
+        create_train("other.zrn", to_player="Player2")
+
+        response = self.client.post(
+            reverse("trains:wait"), {"since": old_pk, **get_default_login()}
+        )
+
+        assert 200 == response.status_code
+        assert [{"pk": new_pk, "file": "new.zrn"}] == response.json()["trains"]
+
+    def test_wait_times_out_without_new_trains(self):
+        response = self.client.post(
+            reverse("trains:wait"), {"timeout": "0", **get_default_login()}
+        )
+
+        assert 200 == response.status_code
+        assert [] == response.json()["trains"]
+
+    @override_settings(ROOT_URLCONF="fymserver.urls")
+    def test_wait_is_not_served_by_sync_urls(self):
+        with self.assertRaises(NoReverseMatch):
+            reverse("trains:wait")
+
+    def test_wait_fails_with_invalid_player(self):
+        response = self.client.post(
+            reverse("trains:wait"), {"player": "fake", "token": "bad"}
+        )
+
+        assert 403 == response.status_code
+
+    def test_sse_streams_uploaded_trains(self):
+        sent = []
+
+        async def run() -> None:
+            body = urlencode(get_default_login()).encode()
+            received = asyncio.Queue()
+            await received.put({"type": "http.request", "body": body})
+
+            async def send(message):
+                sent.append(message)
+                if message["type"] == "http.response.start":
+                    await sync_to_async(self.upload_train)()
+                elif message.get("body"):
+                    await received.put({"type": "http.disconnect"})
+
+            scope = {"type": "http", "method": "POST", "path": SSE_PATH}
+            await asyncio.wait_for(sse_application(scope, received.get, send), 5)
+
+        async_to_sync(run)()
+
+        assert 200 == sent[0]["status"]
+        assert (b"content-type", b"text/event-stream") in sent[0]["headers"]
+        train = Train.objects.get()
+        assert (
+            f"id: {train.pk}\ndata: "
+            f'{{"pk": {train.pk}, "file": "{self.FILENAME}"}}\n\n'.encode()
+            == sent[1]["body"]
+        )
+
+    def test_sse_sends_trains_stored_while_replaying(self):
+        sent = []
+        query_pending = events.pending_trains
+
+        def pending_trains(player, since):
+            trains = query_pending(player, since)
+            self.upload_train()
+            return trains
+
+        async def run() -> None:
+            body = urlencode({"since": 0, **get_default_login()}).encode()
+            received = asyncio.Queue()
+            await received.put({"type": "http.request", "body": body})
+
+            async def send(message):
+                sent.append(message)
+                if message.get("body"):
+                    await received.put({"type": "http.disconnect"})
+
+            scope = {"type": "http", "method": "POST", "path": SSE_PATH}
+            await asyncio.wait_for(sse_application(scope, received.get, send), 5)
+
+        with mock.patch("trains.events.pending_trains", pending_trains):
+            async_to_sync(run)()
+
+        train = Train.objects.get()
+        assert sent[1]["body"].startswith(f"id: {train.pk}\n".encode())
+
+    def test_sse_rejects_large_bodies(self):
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"x" * 5000}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": SSE_PATH}
+        async_to_sync(sse_application)(scope, receive, send)
+
+        assert 413 == sent[0]["status"]
+
+    def test_channels_are_valid_cache_keys(self):
+        assert " " not in channel_for("Player One")
+        assert channel_for("Player One") != channel_for("player one")
+
+    def test_sse_rejects_invalid_player(self):
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"player=fake&token=bad"}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": SSE_PATH}
+        async_to_sync(sse_application)(scope, receive, send)
+
+        assert 403 == sent[0]["status"]
+
+
+@override_storage()
+class PurgeTrainsTests(TestCase):
+    def test_purges_old_downloaded_trains_and_files(self):
+        old = timezone.now() - timedelta(days=100)
+        purged_pk = create_train("purged.zrn", upload_date=old)
+        kept_pks = [
+            create_train("available.zrn", upload_date=old),
+            create_train("recent.zrn", state=TrainState.DOWNLOADED),
+        ]
+        Train.objects.filter(pk=purged_pk).update(state=TrainState.DOWNLOADED)
+        storage = Train._meta.get_field("train_file").storage
+
+        stats = purge_trains(max_age_days=90, batch_size=1)
+
+        assert 1 == stats.rows
+        assert 1 == stats.objects
+        assert sorted(kept_pks) == sorted(Train.objects.values_list("pk", flat=True))
+        assert not TrainNameTrigram.objects.filter(train_id=purged_pk).exists()
+        assert not storage.exists("purged.zrn")
+        assert storage.exists("available.zrn")
+
+    def test_keeps_files_shared_with_newer_trains(self):
+        old = timezone.now() - timedelta(days=100)
+        create_train("shared.zrn", upload_date=old, state=TrainState.DOWNLOADED)
+        Train.objects.filter(pk=create_train("new.zrn")).update(train_file="shared.zrn")
+        storage = Train._meta.get_field("train_file").storage
+
+        stats = purge_trains(max_age_days=90)
+
+        assert 1 == stats.rows
+        assert 0 == stats.objects
+        assert storage.exists("shared.zrn")
+
+
+class PurgeUploadsTests(TestCase):
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        storage = FakeS3Storage(self.s3)
+        fields = [Train._meta.get_field("train_file")] + [
+            Map._meta.get_field(f"{file_ext}_file") for file_ext in FILE_EXTS
+        ]
+        for field in fields:
+            patcher = mock.patch.object(field, "storage", storage)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_deletes_only_old_staged_uploads(self):
+        old, recent = new_staging_name(), new_staging_name()
+        for name in (old, recent, "1001.jpg"):
+            self.s3.objects[f"maps/{name}"] = b"data"
+        self.s3.last_modified[f"maps/{old}"] = timezone.now() - timedelta(hours=25)
+
+        assert 1 == purge_uploads(max_age_hours=24)
+
+        assert {f"maps/{recent}", "maps/1001.jpg"} == set(self.s3.objects)
+
+
+@override_storage()
+class ArchiveTrainsTests(TestCase):
+    def setUp(self):
+        self.player = Player.objects.get(pk=create_default_player())
+
+    def test_moves_downloaded_trains_to_archive(self):
+        downloaded_pk = create_train(
+            "downloaded.zrn", from_player="Player2", to_player=DEFAULT_USERNAME
+        )
+        Train.objects.filter(pk=downloaded_pk).claim(self.player)
+        available_pk = create_train("available.zrn")
+
+        assert 1 == archive_trains(min_age_days=0, batch_size=1).rows
+        assert 0 == archive_trains(min_age_days=0).rows
+
+        assert [available_pk] == list(Train.objects.values_list("pk", flat=True))
+        archived = ArchivedTrain.objects.get()
+        assert downloaded_pk == archived.pk
+        assert "downloaded.zrn" == archived.train_file.name
+        assert self.player == archived.downloaded_by
+
+    def test_keeps_train_whose_id_is_archived_as_another_train(self):
+        pk = create_train("train_01.zrn")
+        Train.objects.filter(pk=pk).claim(self.player)
+        ArchivedTrain.objects.create(
+            id=pk, train_file="other.zrn", upload_date=date(2000, 1, 31)
+        )
+
+        stats = archive_trains(min_age_days=0)
+
+        assert 0 == stats.rows
+        assert [pk] == stats.conflicts
+        assert Train.objects.filter(pk=pk).exists()
+        assert "other.zrn" == ArchivedTrain.objects.get().train_file.name
+
+    def test_archive_lists_archived_trains(self):
+        pks = [create_train(f"train_{i}.zrn", to_player="Player2") for i in range(3)]
+        create_train("other.zrn", to_player="Player3")
+        Train.objects.all().claim(self.player)
+        archive_trains(min_age_days=0)
+
+        response = self.client.post(
+            reverse("trains:archive"),
+            {"search_player": "Player2", "limit": 2, **get_default_login()},
+        )
+
+        assert 200 == response.status_code
+        page = response.json()
+        assert pks[:2] == [train["pk"] for train in page["trains"]]
+        assert DEFAULT_USERNAME == page["trains"][0]["downloaded_by"]
+        assert pks[1] == page["next"]
+
+    def test_download_of_archived_train_is_unavailable(self):
+        pk = create_train("train_01.zrn")
+        Train.objects.filter(pk=pk).claim(self.player)
+        archive_trains(min_age_days=0)
+
+        response = self.client.post(
+            reverse("trains:download", args=[pk]), get_default_login()
+        )
+
+        assert 400 == response.status_code
+
+    def test_purge_removes_old_archived_trains(self):
+        pk = create_train("train_01.zrn", upload_date=timezone.now() - timedelta(100))
+        Train.objects.filter(pk=pk).claim(self.player)
+        archive_trains(min_age_days=0)
+
+        stats = purge_trains(max_age_days=90)
+
+        assert 1 == stats.rows
+        assert not ArchivedTrain.objects.exists()
+        assert not Train._meta.get_field("train_file").storage.exists("train_01.zrn")
+
+
+@override_storage()
+class TrainRateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        create_default_player()
+
+    @override_settings(RATELIMITS={"trains:index": {"player": "1/m"}})
+    def test_index_is_rate_limited_per_player(self):
+        url = reverse("trains:index")
+        assert 200 == self.client.post(url, data=get_default_login()).status_code
+
+        response = self.client.post(url, data=get_default_login())
+
+        assert 429 == response.status_code
+        assert "Retry-After" in response
+
+    @override_settings(RATELIMITS={"trains:index": {"player": "1/m"}})
+    def test_other_players_cannot_use_up_a_players_limit(self):
+        url = reverse("trains:index")
+        for _ in range(2):
+            response = self.client.post(
+                url, data={"player": DEFAULT_USERNAME, "token": "bad"}
+            )
+            assert 403 == response.status_code
+
+        assert 200 == self.client.post(url, data=get_default_login()).status_code
+
+    @override_settings(RATELIMITS={"trains:index": {"ip": "1/m"}})
+    def test_index_is_rate_limited_per_address_before_authentication(self):
+        url = reverse("trains:index")
+        self.client.post(url, data={"player": "fake", "token": "bad"})
+
+        response = self.client.post(url, data={"player": "fake", "token": "bad"})
+
+        assert 429 == response.status_code
+
+
+@override_settings(ROOT_URLCONF="fymserver.async_urls")
+class AsyncTrainIndexViewTests(TrainIndexViewTests):
+    pass
+
+
+@override_settings(ROOT_URLCONF="fymserver.async_urls")
+class AsyncTrainIndexPaginationTests(TrainIndexPaginationTests):
+    pass
+
+
+@override_settings(ROOT_URLCONF="fymserver.async_urls")
+class AsyncTrainUploadViewTests(TrainUploadViewTests):
+    pass
+
+
+@override_settings(ROOT_URLCONF="fymserver.async_urls")
+class AsyncTrainDirectUploadViewTests(TrainDirectUploadViewTests):
+    pass
@@ -7,5 +7,9 @@ app_name = "trains"
 urlpatterns = [
     path("", views.index, name="index"),
     path("<int:pk>/download", views.download, name="download"),
+    path("claim", views.claim, name="claim"),
+    path("archive", views.archive, name="archive"),
     path("upload", views.upload, name="upload"),
+    path("upload/presign", views.presign_upload, name="presign_upload"),
+    path("upload/complete", views.complete_upload, name="complete_upload"),
 ]
@@ -1,20 +1,42 @@
+import json
 import os
 from datetime import datetime
+from typing import Iterator, Tuple
 
+from django.core.files import File
+from django.db import transaction
 from django.db.models import Q
-from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.http import (
+    HttpRequest,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect
 from django.views.decorators.csrf import csrf_exempt
 
+from fymserver import direct_uploads
+from fymserver.files import file_digest
+from fymserver.ratelimit import ratelimit
+from fymserver.upload_handlers import store_upload, streamed_upload
 from players.decorators import valid_player_required
 from players.models import Player
 
-from .models import Train, TrainState
+from .events import notify_new_train
+from .models import ArchivedTrain, PlayerName, Train, TrainNameTrigram, TrainState
+
+INDEX_DEFAULT_LIMIT = 100
+INDEX_MAX_LIMIT = 1000
+STREAM_CHUNK_SIZE = 2000
+CLAIM_MAX_TRAINS = 100
 
 
 # Create your views here.
 @csrf_exempt
+@ratelimit("trains:index")
 @valid_player_required
+@ratelimit("trains:index", key="player")
 def index(request: HttpRequest) -> HttpResponse:
     search_player: str = request.POST.get("search_player", "")
     filename: str = request.POST.get("filename", "")
@@ -22,10 +44,17 @@ def index(request: HttpRequest) -> HttpResponse:
 
     trains = Train.objects.filter(state=TrainState.AVAILABLE)
     if search_player:
-        trains = trains.filter(
-            Q(from_player=search_player) | Q(to_player=search_player)
-        )
+        player_key = PlayerName.lookup(search_player)
+        if player_key is None:
+            trains = trains.none()
+        else:
+            trains = trains.filter(
+                Q(from_player_key=player_key) | Q(to_player_key=player_key)
+            )
     if filename:
+        train_ids = TrainNameTrigram.matching_train_ids(filename)
+        if train_ids is not None:
+            trains = trains.filter(pk__in=train_ids)
         trains = trains.filter(train_file__contains=filename)
     if upload_before:
         try:
@@ -34,34 +63,198 @@ def index(request: HttpRequest) -> HttpResponse:
             return HttpResponseBadRequest("Malformed upload_before, must be YYYY-MM-DD")
         trains = trains.filter(upload_date__lte=upload_before_date)
 
+    rows = trains.order_by("pk").values_list("pk", "train_file")
+
+    if request.POST.get("stream", ""):
+        return StreamingHttpResponse(
+            _stream_json_list(_keyset_batches(rows)),
+            content_type="application/json",
+        )
+
+    if "limit" not in request.POST and "cursor" not in request.POST:
+        return JsonResponse([{"pk": pk, "file": name} for pk, name in rows], safe=False)
+
+    try:
+        limit = int(request.POST.get("limit", INDEX_DEFAULT_LIMIT))
+        cursor = int(request.POST.get("cursor", "0"))
+    except ValueError:
+        return HttpResponseBadRequest("limit and cursor must be integers")
+    if limit < 1:
+        return HttpResponseBadRequest("limit must be positive")
+    limit = min(limit, INDEX_MAX_LIMIT)
+
+    page = list(rows.filter(pk__gt=cursor)[: limit + 1])
+    next_cursor = page[limit - 1][0] if len(page) > limit else None
+
     return JsonResponse(
-        [{"pk": train.pk, "file": train.train_file.name} for train in trains.all()],
-        safe=False,
+        {
+            "trains": [{"pk": pk, "file": name} for pk, name in page[:limit]],
+            "next": next_cursor,
+        }
     )
 
 
+def _keyset_batches(rows) -> Iterator[Tuple[int, str]]:
+    """Read rows ordered by pk in bounded batches.
+
+    Each batch is its own ``pk > last`` query, so no backend holds more than
+    STREAM_CHUNK_SIZE rows at once (mysqlclient buffers whole result sets,
+    even for ``.iterator()``).
+    """
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk)[:STREAM_CHUNK_SIZE])
+        yield from batch
+        if len(batch) < STREAM_CHUNK_SIZE:
+            return
+        last_pk = batch[-1][0]
+
+
+def _stream_json_list(rows: Iterator[Tuple[int, str]]) -> Iterator[bytes]:
+    yield b"["
+    for i, (pk, name) in enumerate(rows):
+        prefix = "," if i else ""
+        yield (prefix + json.dumps({"pk": pk, "file": name})).encode()
+    yield b"]"
+
+
 @csrf_exempt
+@ratelimit("trains:download")
 @valid_player_required
+@ratelimit("trains:download", key="player")
 def download(request: HttpRequest, pk: int) -> HttpResponse:
-    player: str = request.POST.get("player", "")
-    if not player:
-        return HttpResponseBadRequest("No player specified")
-
-    player_obj: Player = get_object_or_404(Player, username=player)
-    train: Train = get_object_or_404(Train, pk=pk)
+    player_obj: Player = request.player
 
-    if train.state != TrainState.AVAILABLE:
+    if not Train.objects.filter(pk=pk).claim(player_obj):
+        if not ArchivedTrain.objects.filter(pk=pk).exists():
+            get_object_or_404(Train, pk=pk)
         return HttpResponseBadRequest("Train unavailable")
 
-    train.set_downloaded(player_obj)
-    train.save()
+    train_file = Train.objects.filter(pk=pk).values_list("train_file", flat=True)[0]
+
+    return redirect(Train(pk=pk, train_file=train_file).train_file.url)
+
+
+@csrf_exempt
+@valid_player_required
+def archive(request: HttpRequest) -> HttpResponse:
+    search_player: str = request.POST.get("search_player", "")
+    upload_before: str = request.POST.get("upload_before", "")
+
+    trains = ArchivedTrain.objects.all()
+    if search_player:
+        trains = trains.filter(
+            Q(from_player=search_player) | Q(to_player=search_player)
+        )
+    if upload_before:
+        try:
+            upload_before_date = datetime.strptime(upload_before, r"%Y-%m-%d").date()
+        except ValueError:
+            return HttpResponseBadRequest("Malformed upload_before, must be YYYY-MM-DD")
+        trains = trains.filter(upload_date__lte=upload_before_date)
+
+    try:
+        limit = int(request.POST.get("limit", INDEX_DEFAULT_LIMIT))
+        cursor = int(request.POST.get("cursor", "0"))
+    except ValueError:
+        return HttpResponseBadRequest("limit and cursor must be integers")
+    if limit < 1:
+        return HttpResponseBadRequest("limit must be positive")
+    limit = min(limit, INDEX_MAX_LIMIT)
+
+    page = list(
+        trains.filter(pk__gt=cursor)
+        .order_by("pk")
+        .values(
+            "pk",
+            "train_file",
+            "from_player",
+            "to_player",
+            "upload_date",
+            "downloaded_by__username",
+        )[: limit + 1]
+    )
+    next_cursor = page[limit - 1]["pk"] if len(page) > limit else None
+
+    return JsonResponse(
+        {
+            "trains": [
+                {
+                    "pk": row["pk"],
+                    "file": row["train_file"],
+                    "from_player": row["from_player"],
+                    "to_player": row["to_player"],
+                    "upload_date": row["upload_date"],
+                    "downloaded_by": row["downloaded_by__username"],
+                }
+                for row in page[:limit]
+            ],
+            "next": next_cursor,
+        }
+    )
+
+
+@csrf_exempt
+@ratelimit("trains:claim")
+@valid_player_required
+@ratelimit("trains:claim", key="player")
+def claim(request: HttpRequest) -> HttpResponse:
+    try:
+        pks = [int(pk) for pk in request.POST.get("pks", "").split(",") if pk]
+    except ValueError:
+        return HttpResponseBadRequest("pks must be a comma-separated list of ids")
+    if not pks:
+        return HttpResponseBadRequest("No pks specified")
+    if len(pks) > CLAIM_MAX_TRAINS:
+        return HttpResponseBadRequest(
+            f"At most {CLAIM_MAX_TRAINS} trains may be claimed at once"
+        )
+
+    player_obj: Player = request.player
 
-    return redirect(train.train_file.url)
+    with transaction.atomic():
+        claimed = list(
+            Train.objects.select_for_update(skip_locked=True)
+            .filter(pk__in=pks, state=TrainState.AVAILABLE)
+            .order_by("pk")
+            .values_list("pk", "train_file")
+        )
+        claimed_trains = Train.objects.filter(pk__in=[pk for pk, _ in claimed])
+        if claimed_trains.claim(player_obj) != len(claimed):
+            # Without row locks another request may have claimed some of them
+            ours = set(
+                claimed_trains.filter(downloaded_by=player_obj).values_list(
+                    "pk", flat=True
+                )
+            )
+            claimed = [(pk, train_file) for pk, train_file in claimed if pk in ours]
+
+    claimed_pks = {pk for pk, _ in claimed}
+    return JsonResponse(
+        {
+            "trains": [
+                {
+                    "pk": pk,
+                    "file": train_file,
+                    "url": Train(pk=pk, train_file=train_file).train_file.url,
+                }
+                for pk, train_file in claimed
+            ],
+            "unavailable": [pk for pk in pks if pk not in claimed_pks],
+        }
+    )
 
 
 @csrf_exempt
+@ratelimit("trains:upload")
 @valid_player_required
+@ratelimit("trains:upload", key="player")
+@streamed_upload(Train._meta.get_field("train_file"))
 def upload(request: HttpRequest) -> HttpResponse:
+    return _upload(request)
+
+
+def _upload(request: HttpRequest) -> HttpResponse:
     if len(request.FILES) != 1:
         return HttpResponseBadRequest(
             f"Expected 1 file attachment, got {len(request.FILES)}"
@@ -72,15 +265,90 @@ def upload(request: HttpRequest) -> HttpResponse:
         return HttpResponseBadRequest("No filename provided")
 
     file_obj = request.FILES[list(request.FILES.keys())[0]]
-    tokens = os.path.splitext(filename)[0].split("-")
-    to_player = tokens[3]
-    from_player = tokens[4]
+
+    return _store_train(filename, file_obj)
+
+
+def _store_train(filename: str, file_obj: File) -> HttpResponse:
+    to_player, from_player = _train_players(filename)
+
+    file_size, file_sha256 = file_digest(file_obj)
+    if _is_duplicate_train(filename, file_size, file_sha256):
+        return HttpResponse()
 
     train_obj = Train(
         to_player=to_player,
         from_player=from_player,
+        file_size=file_size,
+        file_sha256=file_sha256,
     )
-    train_obj.train_file.save(filename, file_obj)
-    train_obj.save()
+    store_upload(train_obj.train_file, filename, file_obj)
+    _save_train(train_obj)
 
     return HttpResponse()
+
+
+def _train_players(filename: str) -> Tuple[str, str]:
+    tokens = os.path.splitext(filename)[0].split("-")
+    return tokens[3], tokens[4]
+
+
+def _is_duplicate_train(filename: str, file_size: int, file_sha256: str) -> bool:
+    return Train.objects.filter(
+        train_file=filename,
+        file_size=file_size,
+        file_sha256=file_sha256,
+        state=TrainState.AVAILABLE,
+    ).exists()
+
+
+def _save_train(train_obj: Train) -> None:
+    train_obj.save()
+    notify_new_train(train_obj)
+
+
+@csrf_exempt
+@ratelimit("trains:upload")
+@valid_player_required
+@ratelimit("trains:upload", key="player")
+def presign_upload(request: HttpRequest) -> HttpResponse:
+    if not request.POST.get("filename", ""):
+        return HttpResponseBadRequest("No filename provided")
+
+    storage = Train._meta.get_field("train_file").storage
+    try:
+        size, sha256 = direct_uploads.parse_upload_params(request)
+        upload = direct_uploads.presign_upload(storage, size, sha256)
+    except direct_uploads.DirectUploadError as e:
+        return HttpResponseBadRequest(str(e))
+
+    return JsonResponse(upload)
+
+
+@csrf_exempt
+@ratelimit("trains:upload")
+@valid_player_required
+@ratelimit("trains:upload", key="player")
+def complete_upload(request: HttpRequest) -> HttpResponse:
+    return _complete_upload(request)
+
+
+def _complete_upload(request: HttpRequest) -> HttpResponse:
+    filename: str = request.POST.get("filename", "")
+    if not filename:
+        return HttpResponseBadRequest("No filename provided")
+
+    storage = Train._meta.get_field("train_file").storage
+    try:
+        size, sha256 = direct_uploads.parse_upload_params(request)
+        staged = direct_uploads.complete_upload(
+            storage, request.POST.get("upload", ""), filename, size, sha256
+        )
+    except direct_uploads.DirectUploadError as e:
+        return HttpResponseBadRequest(str(e))
+
+    try:
+        return _store_train(filename, staged)
+    finally:
+        if not staged.committed:
+            staged.discard()